@@ -0,0 +1,422 @@
+"""
+Admission control for Anthropic calls: token buckets per client and per key.
+
+Every Messages call made through _claude.py is charged an estimate of the
+tokens it will use (prompt length, max_tokens and at most one web search)
+against two buckets: the calling client's and the shared one of the
+Anthropic API key, which keeps the whole deployment under its upstream rate
+limit. Once the call returns, the charge is settled to the tokens its usage
+reports (searches included); a call that fails is refunded. The client is
+the rep's X-Client-Id header, else the caller's IP; the header is
+self-declared, so the key bucket is the hard cap.
+
+A call that doesn't fit queues until the buckets refill, but only if that
+can happen before its deadline (and within ADMISSION_MAX_WAIT_SECONDS);
+otherwise it is refused at once with AdmissionRejected (429).
+
+Bulk work (/api/analyze_batch) runs under ``client(identity, batch=True)``:
+it draws on a separate, larger per-client bucket and queues for up to
+BATCH_MAX_WAIT_SECONDS, so a long list neither starves the rep's
+interactive calls nor fails fast on a full bucket. It still shares the key
+bucket.
+
+Bucket state lives in a pluggable store:
+  KVBucketStore     - the shared KV store (see _kv.py), so every function
+                      instance draws on the same buckets; the default when
+                      it is configured
+  MemoryBucketStore - in-process, survives between warm invocations (the
+                      default otherwise)
+  SQLiteBucketStore - file store shared by every process that opens it
+
+The memory and SQLite stores are per function instance: on Vercel each
+instance has its own memory and its own /tmp, so each enforces the budgets
+separately. The API's own 429s, which _claude.py retries, remain the
+backstop.
+
+Environment variables:
+  RATE_LIMIT_BACKEND         - "kv", "memory", "sqlite" or "off" (default
+                               "kv" when KV_REST_API_URL is set, else "memory")
+  RATE_LIMIT_DB_PATH         - SQLite file for the sqlite backend
+                               (default /tmp/salescopilot-limits.sqlite3)
+  CLIENT_TOKENS_PER_MINUTE   - Refill rate of each client's bucket (default 60000)
+  CLIENT_BURST_TOKENS        - Size of each client's bucket (default 120000)
+  KEY_TOKENS_PER_MINUTE      - Refill rate of the API key's bucket (default 400000)
+  KEY_BURST_TOKENS           - Size of the API key's bucket (default 400000)
+  ADMISSION_MAX_WAIT_SECONDS - Longest a call queues for budget (default 10)
+  BATCH_TOKENS_PER_MINUTE    - Refill rate of each client's batch bucket (default 200000)
+  BATCH_BURST_TOKENS         - Size of each client's batch bucket (default 200000)
+  BATCH_MAX_WAIT_SECONDS     - Longest a batch call queues for budget (default 120)
+"""
+
+import contextvars
+import hashlib
+import http.client
+import io
+import json
+import math
+import os
+import random
+import sqlite3
+import threading
+import time
+import urllib.error
+from contextlib import contextmanager
+
+import _trace
+from _compact import estimate_tokens
+from _kv import kv_from_env
+
+DEFAULT_DB_PATH = "/tmp/salescopilot-limits.sqlite3"
+CLIENT_TOKENS_PER_MINUTE = int(os.environ.get("CLIENT_TOKENS_PER_MINUTE", "60000"))
+CLIENT_BURST_TOKENS = int(os.environ.get("CLIENT_BURST_TOKENS", "120000"))
+KEY_TOKENS_PER_MINUTE = int(os.environ.get("KEY_TOKENS_PER_MINUTE", "400000"))
+KEY_BURST_TOKENS = int(os.environ.get("KEY_BURST_TOKENS", "400000"))
+MAX_WAIT_SECONDS = float(os.environ.get("ADMISSION_MAX_WAIT_SECONDS", "10"))
+BATCH_TOKENS_PER_MINUTE = int(os.environ.get("BATCH_TOKENS_PER_MINUTE", "200000"))
+BATCH_BURST_TOKENS = int(os.environ.get("BATCH_BURST_TOKENS", "200000"))
+BATCH_MAX_WAIT_SECONDS = float(os.environ.get("BATCH_MAX_WAIT_SECONDS", "120"))
+MIN_CALL_SECONDS = 3          # left for the call itself when queueing against a deadline
+SEARCH_USE_TOKENS = 3000      # results fed back to the model per web search
+MAX_MEMORY_BUCKETS = 10_000
+
+_client = contextvars.ContextVar("admission_client", default=None)
+_batch = contextvars.ContextVar("admission_batch", default=False)
+
+
+class AdmissionRejected(urllib.error.HTTPError):
+    """Raised without calling the API when a call is over budget.
+
+    An HTTPError (429, with Retry-After), so endpoints report it like any
+    other API failure.
+    """
+
+    def __init__(self, retry_after):
+        self.retry_after = retry_after
+        headers = http.client.HTTPMessage()
+        headers["Retry-After"] = str(math.ceil(retry_after))
+        body = json.dumps({"error": f"Token budget exceeded; retry in {math.ceil(retry_after)}s"}).encode()
+        super().__init__("admission", 429, "Token budget exceeded", headers, io.BytesIO(body))
+
+
+class Bucket:
+    """Token-bucket parameters: ``capacity`` tokens, refilled at ``rate``/s."""
+
+    def __init__(self, key, per_minute, capacity):
+        self.key = key
+        self.rate = per_minute / 60
+        self.capacity = capacity
+
+    def level(self, state, now):
+        """Tokens available now, given the stored (tokens, updated_at)."""
+        if state is None:
+            return self.capacity
+        tokens, updated_at = state
+        return min(self.capacity, tokens + max(now - updated_at, 0) * self.rate)
+
+    def wait(self, level, cost):
+        """Seconds until ``cost`` tokens are available (0 if they are)."""
+        cost = min(cost, self.capacity)  # an oversized call runs on a full bucket
+        return 0.0 if level >= cost else (cost - level) / self.rate
+
+
+def _take(buckets, states, cost, now):
+    """(wait, new states): charge every bucket, or none if any is short."""
+    levels = [bucket.level(state, now) for bucket, state in zip(buckets, states)]
+    wait = max(bucket.wait(level, cost) for bucket, level in zip(buckets, levels))
+    if wait:
+        return wait, None
+    return 0.0, [(level - min(cost, bucket.capacity), now) for bucket, level in zip(buckets, levels)]
+
+
+def _settle(buckets, states, charged, used, now):
+    """New states after replacing a charge of ``charged`` tokens (as _take
+    made it) with ``used``.
+
+    A bucket may go below zero; later calls then wait off the debt.
+    """
+    return [
+        (min(bucket.capacity, bucket.level(state, now) + min(charged, bucket.capacity) - used), now)
+        for bucket, state in zip(buckets, states)
+    ]
+
+
+class NullBucketStore:
+    """Store that admits everything (RATE_LIMIT_BACKEND=off)."""
+
+    def take(self, buckets, cost):
+        return 0.0
+
+    def settle(self, buckets, charged, used):
+        pass
+
+
+class MemoryBucketStore:
+    """Thread-safe in-process bucket levels."""
+
+    def __init__(self):
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def take(self, buckets, cost):
+        """Charge ``cost`` to every bucket and return 0 if all hold it;
+        else charge nothing and return the seconds until they would."""
+        now = time.time()
+        with self._lock:
+            wait, states = _take(buckets, [self._states.get(b.key) for b in buckets], cost, now)
+            if states is None:
+                return wait
+            for bucket, state in zip(buckets, states):
+                self._states[bucket.key] = state
+            if len(self._states) > MAX_MEMORY_BUCKETS:
+                # Idle clients' buckets have refilled; drop the oldest
+                oldest = sorted(self._states, key=lambda key: self._states[key][1])
+                for key in oldest[:len(oldest) // 2]:
+                    del self._states[key]
+            return 0.0
+
+    def settle(self, buckets, charged, used):
+        """Replace a ``take`` of ``charged`` tokens with the ``used`` ones."""
+        now = time.time()
+        with self._lock:
+            states = _settle(buckets, [self._states.get(b.key) for b in buckets], charged, used, now)
+            for bucket, state in zip(buckets, states):
+                self._states[bucket.key] = state
+
+
+class SQLiteBucketStore:
+    """File-backed bucket levels with the same semantics as MemoryBucketStore.
+
+    Each take runs in an immediate transaction, so processes sharing the
+    file never both spend the same tokens.
+    """
+
+    def __init__(self, path=DEFAULT_DB_PATH):
+        self.path = path
+        with self._connect() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                "key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def _update(self, buckets, change):
+        """Run ``change(states, now) -> (result, new states or None)`` on the
+        buckets' stored states in one transaction; returns ``result``."""
+        db = self._connect()
+        db.isolation_level = None
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            rows = {
+                key: (tokens, updated_at) for key, tokens, updated_at in db.execute(
+                    f"SELECT key, tokens, updated_at FROM buckets WHERE key IN ({','.join('?' * len(buckets))})",
+                    [b.key for b in buckets],
+                )
+            }
+            result, states = change([rows.get(b.key) for b in buckets], now)
+            if states is not None:
+                db.executemany(
+                    "INSERT OR REPLACE INTO buckets (key, tokens, updated_at) VALUES (?, ?, ?)",
+                    [(b.key, tokens, at) for b, (tokens, at) in zip(buckets, states)],
+                )
+            db.execute("COMMIT")
+            return result
+        except BaseException:
+            if db.in_transaction:
+                db.execute("ROLLBACK")
+            raise
+        finally:
+            db.close()
+
+    def take(self, buckets, cost):
+        return self._update(buckets, lambda states, now: _take(buckets, states, cost, now))
+
+    def settle(self, buckets, charged, used):
+        self._update(buckets, lambda states, now: (None, _settle(buckets, states, charged, used, now)))
+
+
+# Scripts run atomically by the KV store. KEYS are the buckets; ARGV starts
+# with each bucket's rate and capacity, then the time and the amounts. A
+# bucket's hash expires once it would have refilled, as a missing one is full.
+_LEVELS_LUA = """
+local n = #KEYS
+local now = tonumber(ARGV[2 * n + 1])
+local levels = {}
+for i, key in ipairs(KEYS) do
+  local rate, capacity = tonumber(ARGV[2 * i - 1]), tonumber(ARGV[2 * i])
+  local state = redis.call("HMGET", key, "tokens", "updated_at")
+  levels[i] = capacity
+  if state[1] then
+    levels[i] = math.min(capacity, tonumber(state[1]) + math.max(now - tonumber(state[2]), 0) * rate)
+  end
+end
+local function store(i, tokens)
+  local rate, capacity = tonumber(ARGV[2 * i - 1]), tonumber(ARGV[2 * i])
+  redis.call("HSET", KEYS[i], "tokens", tostring(tokens), "updated_at", ARGV[2 * n + 1])
+  redis.call("EXPIRE", KEYS[i], math.ceil((capacity - tokens) / rate) + 60)
+end
+"""
+
+TAKE_SCRIPT = _LEVELS_LUA + """
+local cost = tonumber(ARGV[2 * n + 2])
+local wait = 0
+for i = 1, n do
+  local rate, capacity = tonumber(ARGV[2 * i - 1]), tonumber(ARGV[2 * i])
+  local need = math.min(cost, capacity)
+  if levels[i] < need then wait = math.max(wait, (need - levels[i]) / rate) end
+end
+if wait > 0 then return tostring(wait) end
+for i = 1, n do
+  store(i, levels[i] - math.min(cost, tonumber(ARGV[2 * i])))
+end
+return "0"
+"""
+
+SETTLE_SCRIPT = _LEVELS_LUA + """
+local charged, used = tonumber(ARGV[2 * n + 2]), tonumber(ARGV[2 * n + 3])
+for i = 1, n do
+  local capacity = tonumber(ARGV[2 * i])
+  store(i, math.min(capacity, levels[i] + math.min(charged, capacity) - used))
+end
+return "0"
+"""
+
+
+class KVBucketStore:
+    """Bucket levels in the shared KV store, with the same semantics as
+    MemoryBucketStore; each take and settle is one script, which the store
+    runs atomically."""
+
+    def __init__(self, kv):
+        self.kv = kv
+
+    def _run(self, script, buckets, *amounts):
+        params = [value for b in buckets for value in (b.rate, b.capacity)]
+        return float(self.kv.command("EVAL", script, len(buckets), *("bucket:" + b.key for b in buckets),
+                                     *params, time.time(), *amounts))
+
+    def take(self, buckets, cost):
+        return self._run(TAKE_SCRIPT, buckets, cost)
+
+    def settle(self, buckets, charged, used):
+        self._run(SETTLE_SCRIPT, buckets, charged, used)
+
+
+def store_from_env():
+    """Build the bucket store selected by RATE_LIMIT_BACKEND."""
+    kv = kv_from_env()
+    backend = os.environ.get("RATE_LIMIT_BACKEND", "").strip().lower() or ("kv" if kv else "memory")
+    if backend == "off":
+        return NullBucketStore()
+    if backend == "kv":
+        if kv is None:
+            raise ValueError("RATE_LIMIT_BACKEND=kv needs KV_REST_API_URL and KV_REST_API_TOKEN")
+        return KVBucketStore(kv)
+    if backend == "sqlite":
+        return SQLiteBucketStore(os.environ.get("RATE_LIMIT_DB_PATH", DEFAULT_DB_PATH))
+    return MemoryBucketStore()
+
+
+STORE = store_from_env()
+
+
+def client_id(handler):
+    """Identity a request is budgeted under: X-Client-Id, else the caller's IP."""
+    declared = (handler.headers.get("X-Client-Id") or "").strip()
+    if declared:
+        return "id:" + declared[:64]
+    forwarded = (handler.headers.get("X-Forwarded-For") or "").split(",")[0].strip()
+    return "ip:" + (forwarded or handler.headers.get("X-Real-IP") or handler.client_address[0])
+
+
+@contextmanager
+def client(identity, batch=False):
+    """Budget the Anthropic calls made in this block (and in work bound
+    with _trace.in_context) under ``identity``; ``batch`` selects the
+    client's bulk-work bucket."""
+    token, batch_token = _client.set(identity), _batch.set(batch)
+    try:
+        yield
+    finally:
+        _batch.reset(batch_token)
+        _client.reset(token)
+
+
+def estimate_cost(payload):
+    """Tokens to charge a Messages request up front: its prompt, max_tokens
+    and one web search if it may search. Most calls run at most one search
+    whatever their max_uses; settling corrects the rest."""
+    prompt = json.dumps([payload.get("system", ""), payload.get("messages", [])])
+    searches = any(tool.get("name") == "web_search" for tool in payload.get("tools", ()))
+    return estimate_tokens(prompt) + payload.get("max_tokens", 0) + searches * SEARCH_USE_TOKENS
+
+
+def usage_tokens(usage):
+    """Tokens a call actually used, from the API's usage block (search
+    results are billed as input tokens)."""
+    return sum(usage.get(field) or 0 for field in (
+        "input_tokens", "output_tokens", "cache_creation_input_tokens", "cache_read_input_tokens"))
+
+
+def buckets_for(identity, batch=False):
+    key = hashlib.sha256(os.environ.get("ANTHROPIC_API_KEY", "").strip().encode()).hexdigest()[:16]
+    buckets = [Bucket("key:" + key, KEY_TOKENS_PER_MINUTE, KEY_BURST_TOKENS)]
+    if identity and batch:
+        buckets.append(Bucket("batch:" + identity, BATCH_TOKENS_PER_MINUTE, BATCH_BURST_TOKENS))
+    elif identity:
+        buckets.append(Bucket("client:" + identity, CLIENT_TOKENS_PER_MINUTE, CLIENT_BURST_TOKENS))
+    return buckets
+
+
+class Charge:
+    """The tokens ``admit`` took for one call, until it is settled."""
+
+    def __init__(self, store, buckets, cost):
+        self.store = store
+        self.buckets = buckets
+        self.cost = cost
+        self.settled = False
+
+    def settle(self, usage=None):
+        """Correct the charge to ``usage`` (the API's usage block); None
+        refunds it all, for a call that failed. Only the first call counts."""
+        if self.settled:
+            return
+        self.settled = True
+        used = usage_tokens(usage) if usage else 0
+        if used != self.cost:
+            self.store.settle(self.buckets, self.cost, used)
+
+
+def admit(payload, deadline=None, store=None):
+    """Charge a Messages request's estimated tokens before it is sent, and
+    return the Charge to settle once the call is done.
+
+    Waits for the buckets to refill when that can finish in time (leaving
+    MIN_CALL_SECONDS of ``deadline``, a ``time.monotonic()`` value, for the
+    call); raises AdmissionRejected when it can't.
+    """
+    store = store or STORE
+    identity, batch = _client.get(), _batch.get()
+    buckets = buckets_for(identity, batch)
+    cost = estimate_cost(payload)
+    give_up = time.monotonic() + (BATCH_MAX_WAIT_SECONDS if batch else MAX_WAIT_SECONDS)
+    if deadline is not None:
+        give_up = min(give_up, deadline - MIN_CALL_SECONDS)
+    trace = _trace.current()
+    while True:
+        wait = store.take(buckets, cost)
+        if not wait:
+            return Charge(store, buckets, cost)
+        if time.monotonic() + wait > give_up:
+            print(json.dumps({"event": "admission_rejected", "client": identity, "model": payload.get("model"),
+                              "tokens": cost, "retry_after": round(wait, 2)}), flush=True)
+            if trace is not None:
+                trace.incr("admission_rejected")
+            raise AdmissionRejected(wait)
+        if trace is not None:
+            trace.incr("admission_waits")
+        # Jitter so callers queued behind the same bucket don't retry in lockstep
+        time.sleep(wait + random.uniform(0, min(wait, 0.25)))
@@ -0,0 +1,257 @@
+"""
+Small TTL + LRU caches shared by the serverless endpoints.
+
+Two interchangeable backends:
+  MemoryCache - in-process, survives between warm invocations of a function
+  SQLiteCache - local file store (tests, local dev, single-box deployments)
+
+Both store JSON-serialisable values and expose get/set/delete/clear.
+
+Environment variables:
+  CACHE_BACKEND - "memory" (default), "sqlite" or "off"
+  CACHE_DB_PATH - SQLite file for the sqlite backend
+                  (default /tmp/salescopilot-cache.sqlite3)
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from urllib.parse import urlsplit, urlunsplit
+
+DEFAULT_DB_PATH = "/tmp/salescopilot-cache.sqlite3"
+# Legal-form suffixes that don't change which company a name refers to
+_COMPANY_SUFFIX_RE = re.compile(
+    r"(?:\s+(?:inc|incorporated|llc|l\.l\.c|ltd|limited|corp|corporation|co|company|plc|gmbh)\.?)+$"
+)
+
+
+def cache_key(*parts):
+    """Stable SHA-256 key over JSON-serialisable parts."""
+    blob = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+
+def normalize_text(text):
+    """Collapse whitespace so cosmetic differences don't change a key."""
+    return " ".join((text or "").split())
+
+
+def normalize_company(name):
+    """Lower-cased name without punctuation or a trailing legal form."""
+    name = normalize_text(name).lower().replace("&", " and ")
+    name = _COMPANY_SUFFIX_RE.sub("", name.replace(",", ""))
+    return normalize_text(re.sub(r"[^\w\s.]", " ", name)).strip(" .")
+
+
+def normalize_url(url):
+    """Lower-case scheme/host and drop fragment and trailing slash."""
+    parts = urlsplit((url or "").strip())
+    path = parts.path.rstrip("/")
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, parts.query, ""))
+
+
+class NullCache:
+    """Backend that never stores anything (CACHE_BACKEND=off)."""
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl=None):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def clear(self):
+        pass
+
+
+class MemoryCache:
+    """Thread-safe in-process cache with per-entry TTL and LRU eviction."""
+
+    def __init__(self, max_entries=256, ttl=3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class SQLiteCache:
+    """File-backed cache with the same semantics as MemoryCache.
+
+    Each namespace gets its own table, so several caches can share one file.
+    """
+
+    def __init__(self, path=DEFAULT_DB_PATH, namespace="cache", max_entries=256, ttl=3600):
+        self.path = path
+        self.table = "cache_" + "".join(c for c in namespace if c.isalnum() or c == "_")
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        with self._connect() as db:
+            db.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            db.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_lru ON {self.table} (accessed_at)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def get(self, key):
+        now = time.time()
+        with self._lock, self._connect() as db:
+            row = db.execute(
+                f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                db.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                return None
+            db.execute(f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?", (now, key))
+            return json.loads(row[0])
+
+    def set(self, key, value, ttl=None):
+        now = time.time()
+        expires_at = now + (self.ttl if ttl is None else ttl)
+        with self._lock, self._connect() as db:
+            db.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at, accessed_at) "
+                "VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), expires_at, now),
+            )
+            db.execute(f"DELETE FROM {self.table} WHERE expires_at <= ?", (now,))
+            db.execute(
+                f"DELETE FROM {self.table} WHERE key IN ("
+                f"SELECT key FROM {self.table} ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def delete(self, key):
+        with self._lock, self._connect() as db:
+            db.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    def clear(self):
+        with self._lock, self._connect() as db:
+            db.execute(f"DELETE FROM {self.table}")
+
+
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def single_flight(key, compute):
+    """Run ``compute`` once for concurrent callers with the same key.
+
+    The first caller computes; callers arriving before it finishes wait and
+    get the same value (or exception). Nothing is kept afterwards.
+    """
+    with _inflight_lock:
+        future = _inflight.get(key)
+        leader = future is None
+        if leader:
+            future = _inflight[key] = Future()
+    if not leader:
+        return future.result()
+    try:
+        value = compute()
+        future.set_result(value)
+        return value
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            del _inflight[key]
+
+
+def _refresh(cache, key, compute, ttl, should_store):
+    try:
+        value = compute()
+        if should_store(value):
+            cache.set(key, {"value": value, "stored_at": time.time()}, ttl=ttl)
+    except Exception:
+        pass
+    finally:
+        with _refreshing_lock:
+            _refreshing.discard(key)
+
+
+def get_or_compute(cache, key, compute, fresh_for, stale_for=0, should_store=bool):
+    """Return a cached value, computing it on a miss (stale-while-revalidate).
+
+    Entries younger than ``fresh_for`` seconds are returned as-is. Entries up
+    to ``stale_for`` seconds past that are still returned immediately, while
+    a background thread recomputes them (at most one refresh per key). Only
+    values accepted by ``should_store`` are cached. Concurrent misses for a
+    key share one computation (see single_flight).
+    """
+    entry = cache.get(key)
+    ttl = fresh_for + stale_for
+    if entry is not None:
+        if time.time() - entry["stored_at"] > fresh_for:
+            with _refreshing_lock:
+                start = key not in _refreshing
+                _refreshing.add(key)
+            if start:
+                threading.Thread(
+                    target=_refresh, args=(cache, key, compute, ttl, should_store), daemon=True
+                ).start()
+        return entry["value"]
+
+    def compute_and_store():
+        value = compute()
+        if should_store(value):
+            cache.set(key, {"value": value, "stored_at": time.time()}, ttl=ttl)
+        return value
+
+    return single_flight(key, compute_and_store)
+
+
+def cache_from_env(namespace, max_entries=256, ttl=3600):
+    """Build the cache backend selected by CACHE_BACKEND."""
+    backend = os.environ.get("CACHE_BACKEND", "memory").strip().lower()
+    if backend == "off":
+        return NullCache()
+    if backend == "sqlite":
+        path = os.environ.get("CACHE_DB_PATH", DEFAULT_DB_PATH)
+        return SQLiteCache(path, namespace=namespace, max_entries=max_entries, ttl=ttl)
+    return MemoryCache(max_entries=max_entries, ttl=ttl)
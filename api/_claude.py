@@ -0,0 +1,431 @@
+"""
+Thin Anthropic Messages API client shared by the serverless endpoints.
+
+Requests go through the pooled connections in _http.py. ``post_messages``
+returns the decoded JSON reply; ``stream_messages`` uses the streaming
+protocol and yields ``(event_type, data)`` pairs as they arrive.
+``create_batch`` / ``get_batch`` / ``iter_batch_results`` wrap the Message
+Batches API for asynchronous, half-price bulk runs.
+
+Calls are resilient: overload/rate-limit statuses and network failures are
+retried with jittered exponential backoff (honoring ``retry-after``) for as
+long as the caller's deadline allows, a per-model circuit breaker fails
+fast while the upstream is degraded, and ``hedge_after`` can race a second
+request against a slow first one. Messages calls are admitted against the
+caller's token budget first (see _admission.py).
+
+Environment variables:
+  ANTHROPIC_API_KEY  - Your Anthropic API key
+  ANTHROPIC_BASE_URL - (Optional) Override the API origin, e.g. a local fake
+"""
+
+import http.client
+import io
+import json
+import os
+import random
+import threading
+import time
+import urllib.error
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import _admission
+import _trace
+from _http import ResponseLimitError, urlopen
+
+ANTHROPIC_API_URL = os.environ.get("ANTHROPIC_BASE_URL", "https://api.anthropic.com").rstrip("/") + "/v1/messages"
+ANTHROPIC_VERSION = "2023-06-01"
+ANTHROPIC_BATCHES_URL = ANTHROPIC_API_URL + "/batches"
+MAX_RESPONSE_BYTES = 2_000_000
+MAX_BATCH_RESULTS_BYTES = 100_000_000
+
+RETRY_STATUSES = frozenset({408, 409, 429, 500, 502, 503, 504, 529})
+MAX_ATTEMPTS = 4
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 8
+MIN_ATTEMPT_SECONDS = 3     # don't start an attempt with less time than this left
+BREAKER_THRESHOLD = 5       # consecutive upstream failures that open the circuit
+BREAKER_COOLDOWN_SECONDS = 30
+
+
+def _headers():
+    return {
+        "Content-Type": "application/json",
+        "x-api-key": os.environ.get("ANTHROPIC_API_KEY", "").strip(),
+        "anthropic-version": ANTHROPIC_VERSION,
+    }
+
+
+USAGE_FIELDS = (
+    "input_tokens",
+    "output_tokens",
+    "cache_creation_input_tokens",
+    "cache_read_input_tokens",
+)
+
+
+def log_usage(model, usage):
+    """Emit one structured log line with the token counts of a call.
+
+    Includes the prompt-cache write/read counts, so cache hit rates can be
+    read straight out of the function logs.
+    """
+    record = {"event": "anthropic_usage", "model": model}
+    record.update({field: (usage or {}).get(field) or 0 for field in USAGE_FIELDS})
+    print(json.dumps(record), flush=True)
+    trace = _trace.current()
+    if trace is not None:
+        trace.record_usage(model, {field: record[field] for field in USAGE_FIELDS})
+
+
+class CircuitOpenError(urllib.error.HTTPError):
+    """Raised without calling the API while a model's circuit is open.
+
+    An HTTPError (503), so endpoints report it like any other API failure.
+    """
+
+    def __init__(self, name):
+        body = json.dumps({"error": f"{name} is failing; not retrying for now"}).encode()
+        super().__init__(ANTHROPIC_API_URL, 503, "Circuit open", None, io.BytesIO(body))
+
+
+class CircuitBreaker:
+    """Opens after BREAKER_THRESHOLD consecutive upstream failures.
+
+    While open, calls are refused. After BREAKER_COOLDOWN_SECONDS a single
+    trial call is let through; its outcome closes or re-opens the circuit.
+    A call that ends some other way must ``release()`` its trial, or the
+    circuit would stay open for good.
+    """
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN_SECONDS):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._failures = 0
+        self._opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if not self._trial and time.monotonic() - self._opened_at >= self.cooldown:
+                self._trial = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures, self._opened_at, self._trial = 0, None, False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial or self._failures >= self.threshold:
+                self._opened_at, self._trial = time.monotonic(), False
+
+    def release(self):
+        """End a call without a verdict; a pending trial slot is freed."""
+        with self._lock:
+            self._trial = False
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker_for(name):
+    """The shared CircuitBreaker for a model (or other upstream) name."""
+    with _breakers_lock:
+        return _breakers.setdefault(name, CircuitBreaker())
+
+
+def _retry_after(error):
+    """Seconds the API asked us to wait, if it said so."""
+    headers = getattr(error, "headers", None)
+    value = headers.get("retry-after") if headers is not None else None
+    try:
+        return max(float(value), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def _backoff(attempt):
+    """Full-jitter exponential backoff for the given retry number."""
+    return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+
+def _log_retry(name, attempt, error, delay):
+    record = {
+        "event": "anthropic_retry",
+        "model": name,
+        "attempt": attempt,
+        "error": f"HTTP {error.code}" if isinstance(error, urllib.error.HTTPError) else type(error).__name__,
+        "delay": round(delay, 2),
+    }
+    print(json.dumps(record), flush=True)
+    trace = _trace.current()
+    if trace is not None:
+        trace.incr("retries")
+
+
+def _hedged(call, timeout, hedge_after, discard=None):
+    """Run ``call(timeout)``; if it hasn't finished after ``hedge_after``
+    seconds, start a second one and return whichever succeeds first.
+
+    ``discard`` receives the losing result, e.g. to close a response.
+    """
+    pool = ThreadPoolExecutor(max_workers=2)
+    try:
+        first = pool.submit(_trace.in_context(call), timeout)
+        done, _ = wait([first], timeout=hedge_after)
+        if done:
+            return first.result()
+        trace = _trace.current()
+        if trace is not None:
+            trace.incr("hedges")
+        second = pool.submit(_trace.in_context(call), max(timeout - hedge_after, MIN_ATTEMPT_SECONDS))
+        pending, error = {first, second}, None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    for loser in pending:
+                        if discard:
+                            loser.add_done_callback(
+                                lambda f: f.exception() is None and discard(f.result()))
+                    return future.result()
+                error = future.exception()
+        raise error
+    finally:
+        pool.shutdown(wait=False)
+
+
+def with_retries(call, name, timeout, deadline=None, hedge_after=None, discard=None):
+    """Call ``call(attempt_timeout)`` under the retry policy and circuit breaker.
+
+    ``deadline`` (a ``time.monotonic()`` value, default now + timeout) caps
+    the whole thing: each attempt gets at most the time left, and no retry
+    starts unless its backoff plus MIN_ATTEMPT_SECONDS still fits. Only
+    RETRY_STATUSES, timeouts and connection failures are retried.
+    """
+    deadline = deadline if deadline is not None else time.monotonic() + timeout
+    breaker = breaker_for(name)
+    attempt = 0
+    while True:
+        if not breaker.allow():
+            trace = _trace.current()
+            if trace is not None:
+                trace.incr("circuit_open")
+            raise CircuitOpenError(name)
+        attempt_timeout = max(min(timeout, deadline - time.monotonic()), 1)
+        try:
+            if hedge_after and hedge_after < attempt_timeout:
+                result = _hedged(call, attempt_timeout, hedge_after, discard)
+            else:
+                result = call(attempt_timeout)
+        except urllib.error.HTTPError as e:
+            if e.code not in RETRY_STATUSES:
+                breaker.record_success()  # the upstream answered; the request was bad
+                raise
+            breaker.record_failure()
+            error, delay = e, _retry_after(e)
+            delay = _backoff(attempt) if delay is None else delay
+        except (OSError, http.client.HTTPException, ResponseLimitError) as e:  # timeouts, resets
+            breaker.record_failure()
+            error, delay = e, _backoff(attempt)
+        except BaseException:  # e.g. a 200 whose body isn't JSON
+            breaker.release()
+            raise
+        else:
+            breaker.record_success()
+            return result
+
+        attempt += 1
+        if attempt >= MAX_ATTEMPTS or time.monotonic() + delay + MIN_ATTEMPT_SECONDS > deadline:
+            raise error
+        _log_retry(name, attempt, error, delay)
+        time.sleep(delay)
+
+
+def post_messages(payload, timeout=60, deadline=None, hedge_after=None):
+    """POST a Messages request and return the parsed JSON response.
+
+    Retried per ``with_retries``; ``hedge_after`` (seconds) races a second
+    identical request against a slow first one. Raises AdmissionRejected,
+    without calling the API, when the caller is over its token budget;
+    the budget is then charged what the reply's usage reports.
+    """
+    charge = _admission.admit(payload, deadline)
+
+    def call(attempt_timeout):
+        with urlopen(
+            ANTHROPIC_API_URL,
+            data=json.dumps(payload).encode(),
+            headers=_headers(),
+            method="POST",
+            timeout=attempt_timeout,
+            max_bytes=MAX_RESPONSE_BYTES,
+            max_seconds=attempt_timeout,
+        ) as resp:
+            data = json.loads(resp.read().decode())
+        log_usage(payload.get("model"), data.get("usage"))  # hedged losers cost too
+        return data
+
+    try:
+        data = with_retries(call, payload.get("model"), timeout, deadline, hedge_after)
+    except BaseException:
+        charge.settle(None)  # a failed call is refunded
+        raise
+    charge.settle(data.get("usage"))
+    return data
+
+
+def stream_messages(payload, timeout=60, deadline=None, hedge_after=None):
+    """POST a streaming Messages request and yield (event_type, data) pairs.
+
+    ``timeout`` applies to each socket read, so a stalled stream still fails
+    even though the overall reply may take longer. Opening the stream is
+    retried (and optionally hedged) like ``post_messages``; once events
+    flow, a failure is not retried. An ``error`` event from the API is
+    raised as RuntimeError. Admission is as for ``post_messages``; a stream
+    that ends without its usage is refunded.
+    """
+    charge = _admission.admit(payload, deadline)
+    try:
+        yield from _stream_events(payload, timeout, deadline, hedge_after, charge)
+    finally:
+        charge.settle(None)
+
+
+def _stream_events(payload, timeout, deadline, hedge_after, charge):
+    payload = dict(payload, stream=True)
+    usage = {}
+
+    def call(attempt_timeout):
+        return urlopen(
+            ANTHROPIC_API_URL,
+            data=json.dumps(payload).encode(),
+            headers=dict(_headers(), Accept="text/event-stream"),
+            method="POST",
+            timeout=attempt_timeout,
+            decode_gzip=False,
+            max_bytes=MAX_RESPONSE_BYTES,
+            max_seconds=2 * timeout,  # whole stream; timeout itself bounds each read
+        )
+
+    resp = with_retries(call, payload.get("model"), timeout, deadline, hedge_after,
+                        discard=lambda r: r.close())
+    with resp:
+        event_type, data_lines = None, []
+        while True:
+            line = resp.readline()
+            if not line:
+                break
+            line = line.decode().rstrip("\r\n")
+            if line.startswith("event:"):
+                event_type = line[6:].strip()
+            elif line.startswith("data:"):
+                data_lines.append(line[5:].strip())
+            elif not line and data_lines:
+                data = json.loads("\n".join(data_lines))
+                event_type = event_type or data.get("type", "")
+                if event_type == "error":
+                    error = data.get("error", {})
+                    raise RuntimeError(f"{error.get('type', 'error')}: {error.get('message', '')}")
+                if event_type == "message_start":
+                    usage.update(data.get("message", {}).get("usage") or {})
+                elif event_type == "message_delta":
+                    usage.update(data.get("usage") or {})
+                elif event_type == "message_stop":
+                    log_usage(payload.get("model"), usage)
+                    charge.settle(usage)
+                yield event_type, data
+                event_type, data_lines = None, []
+
+
+def iter_text(events):
+    """Yield the text deltas from a stream_messages() event sequence."""
+    for event_type, data in events:
+        if event_type == "content_block_delta":
+            delta = data.get("delta", {})
+            if delta.get("type") == "text_delta":
+                yield delta.get("text", "")
+
+
+def create_batch(requests, timeout=60):
+    """Submit a Message Batch and return the batch object.
+
+    ``requests`` is a list of ``{"custom_id": str, "params": {...}}`` where
+    ``params`` is an ordinary Messages request body.
+    """
+    # Not retried: a timed-out submit may still have created the batch
+    with urlopen(
+        ANTHROPIC_BATCHES_URL,
+        data=json.dumps({"requests": requests}).encode(),
+        headers=_headers(),
+        method="POST",
+        timeout=timeout,
+        max_bytes=MAX_RESPONSE_BYTES,
+        max_seconds=timeout,
+    ) as resp:
+        return json.loads(resp.read().decode())
+
+
+def get_batch(batch_id, timeout=30):
+    """Return the current batch object (processing_status, request_counts...)."""
+    def call(attempt_timeout):
+        with urlopen(
+            f"{ANTHROPIC_BATCHES_URL}/{batch_id}",
+            headers=_headers(),
+            timeout=attempt_timeout,
+            max_bytes=MAX_RESPONSE_BYTES,
+            max_seconds=attempt_timeout,
+        ) as resp:
+            return json.loads(resp.read().decode())
+
+    return with_retries(call, "batches", timeout)
+
+
+def iter_batch_results(batch, timeout=60):
+    """Yield one result dict per request of an ended batch.
+
+    Each has ``custom_id`` and ``result`` (type "succeeded" with a
+    ``message``, or "errored" / "canceled" / "expired"). Usage of succeeded
+    requests is logged like any other call.
+    """
+    with urlopen(
+        batch["results_url"],
+        headers=_headers(),
+        timeout=timeout,
+        decode_gzip=False,
+        max_bytes=MAX_BATCH_RESULTS_BYTES,
+    ) as resp:
+        pending = b""
+        while True:
+            line = resp.readline()
+            pending += line
+            if line and not line.endswith(b"\n"):
+                continue  # longer than one readline() chunk
+            if pending.strip():
+                item = json.loads(pending.decode())
+                message = item.get("result", {}).get("message") or {}
+                if message:
+                    log_usage(message.get("model"), message.get("usage"))
+                yield item
+            pending = b""
+            if not line:
+                break
+
+
+def batch_result_text(result):
+    """Return (text, error) for one iter_batch_results() item."""
+    outcome = result.get("result", {})
+    if outcome.get("type") == "succeeded":
+        blocks = outcome.get("message", {}).get("content", [])
+        return "".join(b.get("text", "") for b in blocks if b.get("type") == "text").strip(), None
+    if outcome.get("type") == "errored":
+        error = outcome.get("error", {}).get("error", {})
+        return "", f"{error.get('type', 'error')}: {error.get('message', '')}"
+    return "", f"request {outcome.get('type', 'failed')}"
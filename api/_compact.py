@@ -0,0 +1,165 @@
+"""
+Relevance-ranked text compaction for prompt inputs.
+
+Instead of keeping the first N characters of a page (mostly navigation and
+cookie banners), text is split into labelled sections and small chunks.
+Boilerplate repeated across sections is dropped, and each chunk is scored
+for executive titles, hiring and news signals. The best chunks are packed
+into a token budget and emitted in their original order.
+"""
+
+import re
+
+CHARS_PER_TOKEN = 4  # rough estimate for English prose
+CHUNK_WORDS = 50
+SHINGLE_WORDS = 8
+GAP = "…"
+
+# Lines like "[Page: /about]" or "[Web Search Results]" label a section
+_LABEL_RE = re.compile(r"^\[[^\[\]\n]{1,80}\]$")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+_SIGNALS = [
+    # Executive titles named in the KEY CONTACTS RULES weigh most
+    (6, re.compile(
+        r"\b(ceo|coo|chief (executive|operating) officer|(brand )?president|"
+        r"(s?vp|vice president|director|head) of operations|founder|owner)\b", re.I)),
+    (2, re.compile(r"\b(leadership|executive team|management team|our team|meet the)\b", re.I)),
+    (3, re.compile(r"\b(hiring|careers?|join our team|open (positions|roles)|now hiring|recruiting)\b", re.I)),
+    (3, re.compile(
+        r"\b(announce[sd]?|press release|launch(ed|es)?|acquir(ed|es|ition)|expan(ds?|sion)|"
+        r"new locations?|grand opening|funding|partner(s|ship)|award(s|ed)?|milestone)\b", re.I)),
+    (1, re.compile(r"\b20\d\d\b")),
+    (1, re.compile(r"\b\d[\d,.]*\s*(%|percent|locations|franchises?|employees|customers)\b", re.I)),
+]
+_BOILERPLATE = re.compile(
+    r"\b(cookies?|privacy policy|terms (of use|of service|and conditions)|all rights reserved|"
+    r"copyright|subscribe|newsletter|sign in|log ?in|skip to (main )?content|accept all)\b", re.I)
+# Two capitalised words in a row, e.g. a person's name next to a title
+_NAME_RE = re.compile(r"\b[A-Z][a-z]+ (?:[A-Z]\. )?[A-Z][a-z]+\b")
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def split_sections(text):
+    """Split text into [(label, body)] using "[...]" label lines."""
+    sections = []
+    label, lines = "", []
+    for line in text.splitlines():
+        if _LABEL_RE.match(line.strip()):
+            if label or any(part.strip() for part in lines):
+                sections.append((label, " ".join(lines).strip()))
+            label, lines = line.strip(), []
+        else:
+            lines.append(line)
+    if label or any(part.strip() for part in lines):
+        sections.append((label, " ".join(lines).strip()))
+    return sections
+
+
+def _drop_repeated_boilerplate(word_lists):
+    """Remove word runs that already appeared earlier in the text.
+
+    Any SHINGLE_WORDS-long run seen before, in an earlier section (a shared
+    nav menu, footer or cookie banner) or earlier in the same one (repeated
+    card templates), is removed; only its first occurrence is kept.
+    """
+    seen = set()
+    cleaned = []
+    for words in word_lists:
+        drop = [False] * len(words)
+        for i in range(len(words) - SHINGLE_WORDS + 1):
+            key = tuple(w.lower() for w in words[i:i + SHINGLE_WORDS])
+            if key in seen:
+                for j in range(i, i + SHINGLE_WORDS):
+                    drop[j] = True
+            seen.add(key)
+        cleaned.append([w for w, d in zip(words, drop) if not d])
+    return cleaned
+
+
+def _chunks(words):
+    """Group words into chunks of about CHUNK_WORDS, preferring sentence ends."""
+    chunks = []
+    for sentence in _SENTENCE_RE.split(" ".join(words)):
+        parts = sentence.split()
+        while parts:
+            if chunks and len(chunks[-1]) + len(parts) <= CHUNK_WORDS:
+                chunks[-1].extend(parts[:CHUNK_WORDS])
+            else:
+                chunks.append(parts[:CHUNK_WORDS])
+            parts = parts[CHUNK_WORDS:]
+    return [" ".join(chunk) for chunk in chunks]
+
+
+def score_chunk(chunk, position):
+    """Heuristic value of a chunk; the first chunk of a section gets a bonus."""
+    score = 0.0
+    for weight, pattern in _SIGNALS:
+        score += weight * len(pattern.findall(chunk))
+    if _SIGNALS[0][1].search(chunk):
+        score += 2 * min(len(_NAME_RE.findall(chunk)), 3)
+    score -= 3 * len(_BOILERPLATE.findall(chunk))
+    if position == 0:
+        score += 2
+    return score
+
+
+def compact_sections(sections, max_tokens):
+    """Dedupe, rank and pack [(label, body)] sections into max_tokens.
+
+    Sections keep their labels and order; each run of chunks that didn't
+    make the cut is replaced by a single GAP marker.
+    """
+    bodies = _drop_repeated_boilerplate([body.split() for _, body in sections])
+    chunked = [_chunks(words) for words in bodies]
+
+    total = sum(estimate_tokens(label) for label, _ in sections)
+    total += sum(estimate_tokens(c) for chunks in chunked for c in chunks)
+    if total <= max_tokens:
+        keep = {(s, i) for s, chunks in enumerate(chunked) for i in range(len(chunks))}
+    else:
+        ranked = sorted(
+            ((score_chunk(c, i), -s, -i, s, i) for s, chunks in enumerate(chunked)
+             for i, c in enumerate(chunks)),
+            reverse=True,
+        )
+        budget = max_tokens - sum(estimate_tokens(label) for label, _ in sections)
+        keep = set()
+        for _, _, _, s, i in ranked:
+            cost = estimate_tokens(chunked[s][i])
+            if cost <= budget:
+                keep.add((s, i))
+                budget -= cost
+
+    out = []
+    for s, (label, original) in enumerate(sections):
+        pieces, gap = [], False
+        for i, chunk in enumerate(chunked[s]):
+            if (s, i) in keep:
+                if gap and pieces:
+                    pieces.append(GAP)
+                pieces.append(chunk)
+                gap = False
+            else:
+                gap = True
+        body = " ".join(pieces)
+        if label and body:
+            out.append(f"{label}\n{body}")
+        elif label and not original:
+            out.append(label)  # header-only section such as "[Website Pages]"
+        elif body:
+            out.append(body)
+    return "\n\n".join(out)
+
+
+def compact_text(text, max_tokens):
+    """Compact free text (optionally with "[...]" label lines) to max_tokens.
+
+    Text that already fits the budget is returned unchanged.
+    """
+    if not text or estimate_tokens(text) <= max_tokens:
+        return text
+    return compact_sections(split_sections(text), max_tokens)
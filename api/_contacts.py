@@ -0,0 +1,145 @@
+"""
+Deterministic key-contact extraction from leadership research text.
+
+Finds (name, title, source) candidates for the four roles the analysis
+cares about (CEO, President, COO, VP/Head of Operations) with title
+patterns, a name pattern and a gazetteer of words that are never part of
+a person's name. Each candidate is scored on the same relevance scale as
+the analysis prompt's KEY CONTACTS RULES.
+
+The candidates let the prompt carry a compact table instead of the whole
+research, and still give an analysis its key contacts when the model call
+fails. Matching is per segment (a line, a " | " search-result field or a
+sentence), pairing each title with the nearest name.
+"""
+
+import re
+
+# (role, relevance_score, pattern), most specific first; scores follow the
+# KEY CONTACTS RULES (CEO=80+, President=85+, COO=90+, VP Ops=95)
+ROLE_PATTERNS = [
+    ("VP of Operations", 95, re.compile(
+        r"\b(?:(?:senior |executive )?vice[- ]president|s?vp|director|head)"
+        r"(?:\s*(?:,|of|-|–)\s*|\s+)(?:(?:field|franchise|business|brand|global)\s+)?operations\b",
+        re.IGNORECASE)),
+    ("COO", 90, re.compile(r"\bCOO\b|\bchief operating officer\b", re.IGNORECASE)),
+    ("President", 85, re.compile(r"(?<!vice )(?<!vice-)\b(?:brand |co-)?president\b(?!\s+of\s+(?!operations))",
+                                 re.IGNORECASE)),
+    ("CEO", 80, re.compile(r"\bCEO\b|\bchief executive officer\b", re.IGNORECASE)),
+]
+_NAME_PART = r"(?:Mc|Mac|O['’])?[A-Z][a-z]+(?:-[A-Z][a-z]+)?"
+# A run of capitalised words; _names splits it into names
+NAME_RUN_RE = re.compile(rf"\b{_NAME_PART}(?:\s+(?:[A-Z]\.|{_NAME_PART}))+\b\.?")
+# Capitalised words that show a match is a heading, a title or a company,
+# not a person
+NON_NAME_WORDS = frozenset("""
+    about all and board brand brands business chief co company contact corporate council director
+    directors executive executives founder founders franchise group head home inc industries
+    leadership learn linkedin llc management meet more news office officer officers operating
+    operations our page partners people president press read results search senior services
+    solutions staff team the vice website welcome who
+""".split())
+MAX_NAME_DISTANCE = 80   # characters between a title and its name
+_SEGMENT_RE = re.compile(r"\n|\s\|\s|\s•\s|;\s|(?<=[a-z)]{2})\.\s+(?=[A-Z])")
+_LABEL_RE = re.compile(r"^\[(?:Page: )?([^\[\]\n]{1,80})\]$")
+
+
+def _names(segment):
+    """(name, start, end) for each name in segment's capitalised runs.
+
+    Gazetteer words split a run ("Meet the Leadership Team Maria Alvarez
+    Founder" -> "Maria Alvarez"). Pieces of two or three words are names;
+    a longer piece yields its first and last two words, since the name
+    sits at the end next to the title that follows it, or vice versa.
+    """
+    for run in NAME_RUN_RE.finditer(segment):
+        piece = []
+        for word in [*re.finditer(r"\S+", run.group()), None]:
+            if word is not None and word.group().lower().strip(".") not in NON_NAME_WORDS:
+                piece.append(word)
+                continue
+            if len(piece) > 2 or (len(piece) == 2 and not piece[-1].group().endswith(".")):
+                spans = [piece] if len(piece) <= 3 else [piece[:2], piece[-2:]]
+                for words in spans:
+                    start, end = run.start() + words[0].start(), run.start() + words[-1].end()
+                    yield segment[start:end].rstrip("."), start, end
+            piece = []
+
+
+def _nearest_name(segment, start, end):
+    """The name closest to the title at segment[start:end], if close enough."""
+    best, best_distance = None, MAX_NAME_DISTANCE + 1
+    for name, name_start, name_end in _names(segment):
+        if name_end <= start:
+            distance = start - name_end
+        elif name_start >= end:
+            distance = name_start - end
+        else:
+            continue  # overlaps the title
+        if distance < best_distance:
+            best, best_distance = name, distance
+    return best
+
+
+def _source(label, line):
+    if "linkedin.com" in line.lower():
+        return "LinkedIn"
+    return label or "research"
+
+
+def role_for(title):
+    """The ROLE_PATTERNS role a free-form title belongs to ("" if none)."""
+    for role, _, pattern in ROLE_PATTERNS:
+        if pattern.search(title or ""):
+            return role
+    return ""
+
+
+def extract_contacts(text):
+    """Candidate key contacts in ``text``, best first.
+
+    Returns dicts with name, title, relevance_score and source; a person
+    found under several titles keeps the highest-scoring one.
+    """
+    contacts = {}
+    label = ""
+    for line in (text or "").splitlines():
+        header = _LABEL_RE.match(line.strip())
+        if header:
+            label = {"Website Pages": "company website", "Web Search Results": "web search"}.get(
+                header.group(1), f"company website {header.group(1)}" if header.group(1).startswith("/") else
+                header.group(1))
+            continue
+        for segment in _SEGMENT_RE.split(line):
+            taken = []
+            for role, score, pattern in ROLE_PATTERNS:
+                for match in pattern.finditer(segment):
+                    if any(match.start() < e and s < match.end() for s, e in taken):
+                        continue  # "Vice President of Operations" is not also "President"
+                    taken.append(match.span())
+                    name = _nearest_name(segment, match.start(), match.end())
+                    if not name:
+                        continue
+                    key = name.lower()
+                    if key not in contacts or contacts[key]["relevance_score"] < score:
+                        contacts[key] = {
+                            "name": name,
+                            "title": role if len(match.group()) <= 4 else " ".join(match.group().split()),
+                            "relevance_score": score,
+                            "source": _source(label, line),
+                        }
+    return sorted(contacts.values(), key=lambda c: -c["relevance_score"])
+
+
+def format_candidates(contacts):
+    """Compact candidate table for the prompt."""
+    rows = [f"- {c['name']} | {c['title']} | score {c['relevance_score']} | {c['source']}" for c in contacts]
+    return "\n".join(rows)
+
+
+def fallback_contacts(contacts):
+    """Candidates shaped like the analysis's key_contacts entries."""
+    return [
+        dict(contact, why_relevant=f"Listed as {contact['title']} ({contact['source']}).")
+        for contact in contacts
+    ]
@@ -0,0 +1,316 @@
+"""
+Single-pass, incremental HTML-to-text extraction.
+
+Built on ``html.parser`` so it never backtracks on malformed markup. Text
+inside script/style/nav (and similar) subtrees is skipped, and the
+extractor reports ``done`` once it has collected its character budget, so
+callers can stop reading the response body early. LinkExtractor collects
+a page's links with their anchor text in the same single pass, and
+DocumentExtractor gathers text, naming metadata and links at once (it
+keeps reading for links, e.g. a footer "Team" link, once its text budget
+is full).
+"""
+
+import codecs
+import json
+import re
+from html.parser import HTMLParser
+
+from _http import ResponseLimitError
+
+SKIP_TAGS = frozenset({"script", "style", "nav", "noscript", "template", "svg"})
+READ_CHUNK_BYTES = 16_384
+CHARSET_SNIFF_BYTES = 4096
+_META_CHARSET_RE = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?\s*([A-Za-z0-9_.:-]+)""", re.I)
+_BOMS = (
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+
+
+class TextExtractor(HTMLParser):
+    """Feed HTML in pieces; ``text()`` returns whitespace-collapsed text."""
+
+    def __init__(self, max_chars=None):
+        super().__init__(convert_charrefs=True)
+        self.max_chars = max_chars
+        self._parts = []
+        self._chars = 0
+        self._skip_depth = 0
+        self._pending_space = False
+
+    @property
+    def text_done(self):
+        return self.max_chars is not None and self._chars >= self.max_chars
+
+    @property
+    def done(self):
+        return self.text_done
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIP_TAGS:
+            self._skip_depth += 1
+        self._pending_space = True  # tags separate words, as in the old regex
+
+    def handle_startendtag(self, tag, attrs):
+        self._pending_space = True
+
+    def handle_endtag(self, tag):
+        if tag in SKIP_TAGS and self._skip_depth:
+            self._skip_depth -= 1
+        self._pending_space = True
+
+    def handle_data(self, data):
+        if self._skip_depth or self.text_done:
+            return
+        words = data.split()
+        if not words:
+            self._pending_space = self._pending_space or bool(data)
+            return
+        piece = " ".join(words)
+        if self._parts and (self._pending_space or data[0].isspace()):
+            piece = " " + piece
+        self._parts.append(piece)
+        self._chars += len(piece)
+        self._pending_space = data[-1].isspace()
+
+    def text(self):
+        text = "".join(self._parts)
+        return text[:self.max_chars] if self.max_chars is not None else text
+
+
+class LinkExtractor(HTMLParser):
+    """Feed HTML in pieces; ``links`` holds (href, anchor text) pairs.
+
+    The anchor text falls back to the link's title or aria-label. Only the
+    first ``max_links`` links are kept.
+    """
+
+    def __init__(self, max_links=500):
+        super().__init__(convert_charrefs=True)
+        self.max_links = max_links
+        self.links = []
+        self._href = None
+        self._label = ""
+        self._text = []
+
+    @property
+    def done(self):
+        return len(self.links) >= self.max_links
+
+    def handle_starttag(self, tag, attrs):
+        if tag != "a":
+            return
+        self._close_link()
+        attrs = dict(attrs)
+        if attrs.get("href"):
+            self._href = attrs["href"].strip()
+            self._label = attrs.get("title") or attrs.get("aria-label") or ""
+            self._text = []
+
+    def handle_endtag(self, tag):
+        if tag == "a":
+            self._close_link()
+
+    def handle_data(self, data):
+        if self._href is not None:
+            self._text.append(data)
+
+    def close(self):
+        super().close()
+        self._close_link()
+
+    def _close_link(self):
+        if self._href is None or self.done:
+            self._href = None
+            return
+        text = " ".join("".join(self._text).split()) or " ".join(self._label.split())
+        self.links.append((self._href, text))
+        self._href = None
+
+
+# schema.org types whose "name" is the company's (LocalBusiness subtypes
+# such as "Dentist" or "Plumber" end in neither, so they are listed)
+ORGANIZATION_TYPES = frozenset({
+    "Organization", "Corporation", "LocalBusiness", "ProfessionalService",
+    "HomeAndConstructionBusiness", "MedicalBusiness", "Dentist", "Plumber",
+    "Electrician", "HVACBusiness", "RoofingContractor", "GeneralContractor",
+})
+
+
+class PageDocument:
+    """One fetched page, parsed once for everything that needs it."""
+
+    def __init__(self, url, text="", title="", site_name="", organization_name="", links=()):
+        self.url = url
+        self.text = text
+        self.title = title
+        self.site_name = site_name                  # <meta property="og:site_name">
+        self.organization_name = organization_name  # JSON-LD Organization "name"
+        self.links = list(links)                    # (href, anchor text) pairs
+
+
+def _is_organization(node):
+    types = node.get("@type")
+    types = types if isinstance(types, list) else [types]
+    return any(isinstance(t, str) and (t in ORGANIZATION_TYPES or t.endswith("Organization")) for t in types)
+
+
+def organization_name(ld_json):
+    """The first Organization name in a JSON-LD block ("" if none)."""
+    try:
+        data = json.loads(ld_json)
+    except ValueError:
+        return ""
+    nodes = [data]
+    while nodes:
+        node = nodes.pop(0)
+        if isinstance(node, list):
+            nodes += node
+        elif isinstance(node, dict):
+            name = node.get("name")
+            if _is_organization(node) and isinstance(name, str) and name.strip():
+                return " ".join(name.split())
+            nodes += [v for v in node.values() if isinstance(v, (list, dict))]
+    return ""
+
+
+class DocumentExtractor(TextExtractor):
+    """TextExtractor that also keeps the <title>, og:site_name, JSON-LD
+    Organization name and (href, anchor text) links of the page."""
+
+    def __init__(self, max_chars=None, max_links=500):
+        super().__init__(max_chars)
+        self.title = ""
+        self.site_name = ""
+        self.organization_name = ""
+        self._links = LinkExtractor(max_links)
+        self._capture = None  # "title" or "ld+json" while inside one
+        self._captured = []
+
+    @property
+    def done(self):
+        # Links after the text budget (footer "About"/"Team") still count
+        return self._links.done
+
+    def handle_starttag(self, tag, attrs):
+        super().handle_starttag(tag, attrs)
+        self._links.handle_starttag(tag, attrs)
+        attrs = dict(attrs)
+        if tag == "title" and not self.title:
+            self._capture, self._captured = "title", []
+        elif tag == "script" and (attrs.get("type") or "").lower() == "application/ld+json":
+            self._capture, self._captured = "ld+json", []
+        elif tag == "meta" and (attrs.get("property") or attrs.get("name")) == "og:site_name":
+            self.site_name = self.site_name or " ".join((attrs.get("content") or "").split())
+
+    def handle_startendtag(self, tag, attrs):
+        if tag == "meta":
+            self.handle_starttag(tag, attrs)
+        super().handle_startendtag(tag, attrs)
+
+    def handle_endtag(self, tag):
+        super().handle_endtag(tag)
+        self._links.handle_endtag(tag)
+        if self._capture == "title" and tag == "title":
+            self.title = " ".join("".join(self._captured).split())
+            self._capture = None
+        elif self._capture == "ld+json" and tag == "script":
+            self.organization_name = self.organization_name or organization_name("".join(self._captured))
+            self._capture = None
+
+    def handle_data(self, data):
+        if self._capture:
+            self._captured.append(data)
+        self._links.handle_data(data)
+        super().handle_data(data)
+
+    def close(self):
+        super().close()
+        self._links.close()
+
+    def document(self, url):
+        return PageDocument(url, self.text(), self.title, self.site_name, self.organization_name,
+                            self._links.links)
+
+
+def html_to_text(html, max_chars=None):
+    """Extract visible text from an HTML string."""
+    extractor = TextExtractor(max_chars)
+    extractor.feed(html)
+    extractor.close()
+    return extractor.text()
+
+
+def detect_charset(headers, head):
+    """Pick a body encoding: BOM, then the HTTP charset, then <meta>, else UTF-8.
+
+    ``head`` is the first bytes of the body; unknown encodings are skipped.
+    """
+    for bom, name in _BOMS:
+        if head.startswith(bom):
+            return name
+    candidates = [headers.get_content_charset() if headers is not None else None]
+    match = _META_CHARSET_RE.search(head[:CHARSET_SNIFF_BYTES])
+    if match:
+        candidates.append(match.group(1).decode("ascii", "ignore"))
+    for name in candidates:
+        if not name:
+            continue
+        try:
+            return codecs.lookup(name).name
+        except LookupError:
+            continue
+    return "utf-8"
+
+
+def _feed_response(resp, parser, encoding=None):
+    """Decode a response body into ``parser`` until it is ``done`` or the
+    body ends; hitting the response's size or time limit, or a read timing
+    out, just ends it."""
+    decoder = None
+    try:
+        while not parser.done:
+            chunk = resp.read(READ_CHUNK_BYTES)
+            if decoder is None:
+                name = encoding or detect_charset(getattr(resp, "headers", None), chunk)
+                decoder = codecs.getincrementaldecoder(name)(errors="ignore")
+            if not chunk:
+                parser.feed(decoder.decode(b"", final=True))
+                break
+            parser.feed(decoder.decode(chunk))
+    except (ResponseLimitError, TimeoutError):
+        pass
+    parser.close()
+
+
+def read_text(resp, max_chars=None, encoding=None):
+    """Stream a response body through TextExtractor.
+
+    Stops reading from the socket as soon as ``max_chars`` characters of text
+    have been collected. The encoding is detected from the response when not
+    given. If the response hits its size or time limit, or a read times out,
+    the text read so far is returned.
+    """
+    extractor = TextExtractor(max_chars)
+    _feed_response(resp, extractor, encoding)
+    return extractor.text()
+
+
+def read_document(resp, max_chars=None, encoding=None):
+    """Stream a response body through DocumentExtractor; returns a PageDocument.
+
+    The text stops at ``max_chars`` characters, but the body is read on (to
+    its size and time limits) so links anywhere on the page are kept.
+    """
+    extractor = DocumentExtractor(max_chars)
+    _feed_response(resp, extractor, encoding)
+    return extractor.document(resp.url)
+
+
+def read_links(resp, max_links=500, encoding=None):
+    """Stream a response body through LinkExtractor; returns its links."""
+    extractor = LinkExtractor(max_links)
+    _feed_response(resp, extractor, encoding)
+    return extractor.links
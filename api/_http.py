@@ -0,0 +1,292 @@
+"""
+Shared outbound HTTP client for the serverless endpoints.
+
+Keeps per-host keep-alive connections in a module-level pool, so warm
+invocations (and concurrent threads within one invocation) reuse TCP/TLS
+sessions to api.anthropic.com, newsapi.org and prospect sites instead of
+handshaking on every call.
+
+The interface mirrors ``urllib.request.urlopen``: ``urlopen`` returns a
+file-like response usable as a context manager, follows redirects, and
+raises ``urllib.error.HTTPError`` for 4xx/5xx statuses, so callers keep
+their existing error handling. Unlike urllib, every body read is bounded in
+size and time, so one huge or endless response can't exhaust the function.
+"""
+
+import http.client
+import io
+import threading
+import time
+import urllib.error
+import zlib
+from urllib.parse import urljoin, urlsplit
+
+import _trace
+
+MAX_IDLE_PER_HOST = 8
+MAX_REDIRECTS = 5
+MAX_ERROR_BODY_BYTES = 64_000
+DEFAULT_MAX_BYTES = 5_000_000
+READ_CHUNK_BYTES = 65_536
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+
+_pool = {}
+_pool_lock = threading.Lock()
+
+
+def _pool_key(scheme, netloc):
+    return (scheme, netloc.lower())
+
+
+def _new_connection(scheme, netloc, timeout):
+    if scheme == "https":
+        return http.client.HTTPSConnection(netloc, timeout=timeout)
+    if scheme == "http":
+        return http.client.HTTPConnection(netloc, timeout=timeout)
+    raise urllib.error.URLError(f"unsupported URL scheme: {scheme!r}")
+
+
+def _checkout(key, timeout):
+    """Return (connection, reused) for a host, preferring an idle one."""
+    with _pool_lock:
+        idle = _pool.get(key)
+        conn = idle.pop() if idle else None
+    if conn is None:
+        return _new_connection(key[0], key[1], timeout), False
+    conn.timeout = timeout
+    if conn.sock is not None:
+        conn.sock.settimeout(timeout)
+    return conn, True
+
+
+def _checkin(key, conn):
+    with _pool_lock:
+        idle = _pool.setdefault(key, [])
+        if len(idle) < MAX_IDLE_PER_HOST:
+            idle.append(conn)
+            return
+    conn.close()
+
+
+def close_all():
+    """Close every pooled connection (mainly for tests and benchmarks)."""
+    with _pool_lock:
+        conns = [c for idle in _pool.values() for c in idle]
+        _pool.clear()
+    for conn in conns:
+        conn.close()
+
+
+class ResponseLimitError(Exception):
+    """A response broke a size or time limit and was aborted."""
+
+
+class ResponseRejected(ResponseLimitError):
+    """A response was refused from its headers alone (type or declared size)."""
+
+
+class PooledResponse:
+    """File-like wrapper that hands its connection back to the pool on close.
+
+    Reads are bounded: more than ``max_bytes`` of (decoded) body, or reading
+    past ``deadline`` (a ``time.monotonic()`` value), raises
+    ResponseLimitError and drops the connection. Each socket read is
+    limited to the time left, so a server that drips bytes can't hold a
+    read open past the deadline.
+    """
+
+    def __init__(self, key, conn, resp, url, decode_gzip, max_bytes=None, deadline=None, started=None,
+                 sock=None):
+        self._key = key
+        self._conn = conn
+        self._resp = resp
+        self._sock = sock  # the connection's socket (http.client drops it for Connection: close)
+        self._timeout = conn.timeout
+        self.url = url
+        self.status = resp.status
+        self.reason = resp.reason
+        self.headers = resp.headers
+        self.max_bytes = max_bytes
+        self.deadline = deadline
+        self.bytes_read = 0
+        self.started = started if started is not None else time.monotonic()
+        self._decoder = None
+        encoding = (resp.headers.get("Content-Encoding") or "").lower()
+        if decode_gzip and encoding in ("gzip", "x-gzip", "deflate"):
+            wbits = zlib.MAX_WBITS | 32 if "gzip" in encoding else zlib.MAX_WBITS
+            self._decoder = zlib.decompressobj(wbits)
+
+    def getcode(self):
+        return self.status
+
+    def _account(self, data):
+        self.bytes_read += len(data)
+        if self.max_bytes is not None and self.bytes_read > self.max_bytes:
+            self.close()
+            raise ResponseLimitError(f"response from {self.url} exceeded {self.max_bytes} bytes")
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            self._time_limit_exceeded()
+        return data
+
+    def _time_limit_exceeded(self):
+        self.close()
+        raise ResponseLimitError(f"response from {self.url} exceeded its read time limit")
+
+    def _read_raw(self, read, amt):
+        """``read(amt)`` on the underlying response, in at most one socket
+        read that may wait no longer than the time left before ``deadline``."""
+        if self.deadline is not None and self._sock is not None:
+            remaining = self.deadline - time.monotonic()
+            if remaining <= 0:
+                self._time_limit_exceeded()
+            self._sock.settimeout(min(self._timeout, remaining) if self._timeout else remaining)
+        try:
+            return read(amt)
+        except TimeoutError:
+            if self.deadline is not None and time.monotonic() >= self.deadline - 0.01:
+                self._time_limit_exceeded()
+            raise
+
+    def _read_chunk(self, amt):
+        data = self._read_raw(self._resp.read1, amt)
+        if not data:
+            self._resp.read()  # marks a fully read keep-alive response closed
+        return data
+
+    def read(self, amt=None):
+        """Read up to ``amt`` bytes of the (decoded) body; all of it if None."""
+        if amt is None:
+            chunks = []
+            while True:
+                chunk = self.read(READ_CHUNK_BYTES)
+                if not chunk:
+                    return b"".join(chunks)
+                chunks.append(chunk)
+        if self._resp is None:
+            return b""
+        if self._decoder is None:
+            data = self._read_chunk(amt)
+            if not data:
+                self.close()
+            return self._account(data)
+        # Compressed bodies may yield nothing for a small raw chunk; keep
+        # reading. max_length keeps a decompression bomb from expanding at once.
+        while True:
+            if self._decoder.unconsumed_tail:
+                data = self._decoder.decompress(self._decoder.unconsumed_tail, amt)
+            else:
+                raw = self._read_chunk(amt)
+                if not raw:
+                    data = self._decoder.flush()
+                    self.close()
+                    return self._account(data)
+                data = self._decoder.decompress(raw, amt)
+            if data:
+                return self._account(data)
+
+    def readline(self):
+        """Read one line of an uncompressed body (used for event streams)."""
+        if self._resp is None:
+            return b""
+        if self._decoder is not None:
+            raise ValueError("readline() needs an uncompressed body; pass decode_gzip=False")
+        line = self._read_raw(self._resp.readline, READ_CHUNK_BYTES)
+        if not line:
+            self.close()
+        return self._account(line)
+
+    def close(self):
+        resp, self._resp = self._resp, None
+        if resp is None:
+            return
+        trace = _trace.current()
+        if trace is not None:
+            trace.record_fetch(self.url, self.status, self.bytes_read, time.monotonic() - self.started)
+        # Only a fully drained, keep-alive response leaves a reusable socket
+        reusable = resp.isclosed() and not resp.will_close
+        resp.close()
+        if reusable:
+            _checkin(self._key, self._conn)
+        else:
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _send(method, url, data, headers, timeout):
+    """Issue one request, retrying once if a reused connection went stale."""
+    parts = urlsplit(url)
+    key = _pool_key(parts.scheme, parts.netloc)
+    path = parts.path or "/"
+    if parts.query:
+        path += "?" + parts.query
+
+    while True:
+        conn, reused = _checkout(key, timeout)
+        try:
+            conn.request(method, path, body=data, headers=headers)
+            sock = conn.sock
+            return key, conn, conn.getresponse(), sock
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+            conn.close()
+            if not reused:
+                raise
+        except Exception:
+            conn.close()
+            raise
+
+
+def urlopen(url, data=None, headers=None, method=None, timeout=10, decode_gzip=True,
+            max_bytes=DEFAULT_MAX_BYTES, max_seconds=None, content_types=None):
+    """Open ``url`` over a pooled connection and return a PooledResponse.
+
+    Redirects are followed (up to MAX_REDIRECTS). With ``decode_gzip`` the
+    request advertises gzip and the body is transparently decompressed.
+    Raises urllib.error.HTTPError for 4xx/5xx responses.
+
+    Every response is bounded: reading more than ``max_bytes`` or for longer
+    than ``max_seconds`` raises ResponseLimitError. ResponseRejected is
+    raised before any body is read when Content-Length already exceeds
+    ``max_bytes`` or, if ``content_types`` is given, when the Content-Type
+    contains none of those substrings.
+    """
+    method = method or ("POST" if data is not None else "GET")
+    headers = dict(headers or {})
+    headers.setdefault("Accept-Encoding", "gzip" if decode_gzip else "identity")
+    deadline = time.monotonic() + max_seconds if max_seconds is not None else None
+
+    for _ in range(MAX_REDIRECTS + 1):
+        started = time.monotonic()
+        key, conn, resp, sock = _send(method, url, data, headers, timeout)
+        response = PooledResponse(key, conn, resp, url, decode_gzip, max_bytes, deadline, started, sock)
+
+        location = resp.headers.get("Location")
+        if resp.status in REDIRECT_STATUSES and location:
+            response.read()  # drain so the connection can be reused
+            url = urljoin(url, location)
+            if resp.status == 303 or (resp.status in (301, 302) and method == "POST"):
+                method, data = "GET", None
+                headers.pop("Content-Type", None)
+            continue
+
+        if resp.status >= 400:
+            response.max_bytes = None
+            body = response.read(MAX_ERROR_BODY_BYTES)
+            response.close()
+            raise urllib.error.HTTPError(url, resp.status, resp.reason, resp.headers, io.BytesIO(body))
+
+        declared = resp.headers.get("Content-Length", "")
+        if max_bytes is not None and declared.isdigit() and int(declared) > max_bytes:
+            response.close()
+            raise ResponseRejected(f"{url} declares {declared} bytes (limit {max_bytes})")
+        ctype = (resp.headers.get("Content-Type") or "").lower()
+        if content_types and not any(t in ctype for t in content_types):
+            response.close()
+            raise ResponseRejected(f"{url} has unexpected Content-Type {ctype!r}")
+        return response
+
+    raise urllib.error.HTTPError(url, resp.status, "Too many redirects", resp.headers, io.BytesIO(b""))
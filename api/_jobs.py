@@ -0,0 +1,214 @@
+"""
+Job store for asynchronous runs through the Message Batches API.
+
+A job records which batch it was submitted as, the input items (in order)
+and, once the batch has ended, one result per item. ``refresh_job`` polls
+the batch and persists its results; ``wait_for_job`` polls to completion
+(for scripts and overnight runs outside the serverless functions).
+
+Jobs are written by /api/generate and /api/analyze_batch and read by
+/api/jobs, which on Vercel run as separate functions, so the store must be
+shared between them:
+  KVJobStore - the shared KV store (see _kv.py); the default when it is
+               configured, and required on Vercel
+  JobStore   - a SQLite file, shared only by processes on one filesystem
+               (local runs, scripts, one box)
+
+Environment variables:
+  JOB_STORE    - "kv" or "sqlite" (default: kv if KV_REST_API_URL is set)
+  JOBS_DB_PATH - SQLite file for the sqlite store
+                 (default /tmp/salescopilot-jobs.sqlite3)
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from _claude import batch_result_text, create_batch, get_batch, iter_batch_results
+from _kv import kv_from_env, on_vercel
+
+DEFAULT_DB_PATH = "/tmp/salescopilot-jobs.sqlite3"
+POLL_INTERVAL_SECONDS = 30
+MAX_WAIT_SECONDS = 24 * 3600  # batches expire after 24 hours
+JOB_TTL_SECONDS = 29 * 24 * 3600  # as long as the API keeps batch results
+
+
+class JobStoreUnavailable(Exception):
+    """No job store that every function can reach is configured."""
+
+
+class JobStore:
+    """SQLite table of jobs; values are stored as JSON."""
+
+    def __init__(self, path=DEFAULT_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        with self._connect() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, kind TEXT NOT NULL, batch_id TEXT NOT NULL, "
+                "status TEXT NOT NULL, items TEXT NOT NULL, results TEXT, "
+                "request_counts TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def create(self, kind, batch_id, items):
+        """Record a newly submitted batch and return the job dict."""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock, self._connect() as db:
+            db.execute(
+                "INSERT INTO jobs (id, kind, batch_id, status, items, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, kind, batch_id, "processing", json.dumps(items), now, now),
+            )
+        return self.get(job_id)
+
+    def get(self, job_id):
+        with self._lock, self._connect() as db:
+            row = db.execute(
+                "SELECT id, kind, batch_id, status, items, results, request_counts, "
+                "created_at, updated_at FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "id": row[0],
+            "kind": row[1],
+            "batch_id": row[2],
+            "status": row[3],
+            "items": json.loads(row[4]),
+            "results": json.loads(row[5]) if row[5] else None,
+            "request_counts": json.loads(row[6]) if row[6] else None,
+            "created_at": row[7],
+            "updated_at": row[8],
+        }
+
+    def update(self, job_id, status, request_counts=None, results=None):
+        with self._lock, self._connect() as db:
+            db.execute(
+                "UPDATE jobs SET status = ?, request_counts = ?, results = ?, updated_at = ? "
+                "WHERE id = ?",
+                (status, json.dumps(request_counts), json.dumps(results) if results is not None else None,
+                 time.time(), job_id),
+            )
+
+
+class KVJobStore:
+    """Jobs in the shared KV store, one JSON value per job.
+
+    Updates overwrite the whole job; concurrent refreshes of one job write
+    the same batch state, so the last one winning is harmless.
+    """
+
+    def __init__(self, kv, ttl=JOB_TTL_SECONDS):
+        self.kv = kv
+        self.ttl = ttl
+
+    def _key(self, job_id):
+        return "job:" + job_id
+
+    def _put(self, job):
+        self.kv.command("SET", self._key(job["id"]), json.dumps(job), "EX", self.ttl)
+
+    def create(self, kind, batch_id, items):
+        """Record a newly submitted batch and return the job dict."""
+        now = time.time()
+        job = {
+            "id": uuid.uuid4().hex,
+            "kind": kind,
+            "batch_id": batch_id,
+            "status": "processing",
+            "items": items,
+            "results": None,
+            "request_counts": None,
+            "created_at": now,
+            "updated_at": now,
+        }
+        self._put(job)
+        return job
+
+    def get(self, job_id):
+        value = self.kv.command("GET", self._key(job_id))
+        return json.loads(value) if value else None
+
+    def update(self, job_id, status, request_counts=None, results=None):
+        job = self.get(job_id)
+        if job is None:
+            return
+        job.update(status=status, request_counts=request_counts, results=results, updated_at=time.time())
+        self._put(job)
+
+
+def store_from_env():
+    """Build the job store selected by JOB_STORE.
+
+    Raises JobStoreUnavailable on Vercel when no KV store is configured
+    (unless JOB_STORE=sqlite insists): a job written to one function's
+    /tmp couldn't be read back by /api/jobs.
+    """
+    backend = os.environ.get("JOB_STORE", "").strip().lower()
+    kv = kv_from_env()
+    if backend == "kv" or (not backend and kv is not None):
+        if kv is None:
+            raise JobStoreUnavailable("JOB_STORE=kv needs KV_REST_API_URL and KV_REST_API_TOKEN")
+        return KVJobStore(kv)
+    if not backend and on_vercel():
+        raise JobStoreUnavailable("Batch jobs need the shared KV store: set KV_REST_API_URL and KV_REST_API_TOKEN")
+    return JobStore(os.environ.get("JOBS_DB_PATH", DEFAULT_DB_PATH))
+
+
+def submit_job(store, kind, requests, items):
+    """Submit ``requests`` as one batch and record it as a job.
+
+    ``requests[i]["params"]`` is the Messages request for ``items[i]``;
+    custom IDs are assigned from the item index.
+    """
+    batch = create_batch([
+        {"custom_id": str(index), "params": request["params"]}
+        for index, request in enumerate(requests)
+    ])
+    return store.create(kind, batch["id"], items)
+
+
+def refresh_job(store, job_id, make_result):
+    """Poll a job's batch once; persist the results if it has ended.
+
+    ``make_result(item, text, error)`` turns one reply (or its error) into
+    the stored result for that item. Returns the job, or None if unknown.
+    """
+    job = store.get(job_id)
+    if job is None or job["status"] == "completed":
+        return job
+
+    batch = get_batch(job["batch_id"])
+    counts = batch.get("request_counts")
+    if batch.get("processing_status") != "ended":
+        store.update(job_id, "processing", counts)
+        return store.get(job_id)
+
+    items = job["items"]
+    results = [make_result(item, "", "no result returned") for item in items]
+    for result in iter_batch_results(batch):
+        index = int(result.get("custom_id", -1))
+        if 0 <= index < len(items):
+            text, error = batch_result_text(result)
+            results[index] = make_result(items[index], text, error)
+    store.update(job_id, "completed", counts, results)
+    return store.get(job_id)
+
+
+def wait_for_job(store, job_id, make_result, interval=POLL_INTERVAL_SECONDS, timeout=MAX_WAIT_SECONDS):
+    """Poll ``refresh_job`` until the job completes or ``timeout`` passes."""
+    deadline = time.monotonic() + timeout
+    while True:
+        job = refresh_job(store, job_id, make_result)
+        if job is None or job["status"] == "completed" or time.monotonic() >= deadline:
+            return job
+        time.sleep(interval)
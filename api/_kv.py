@@ -0,0 +1,78 @@
+"""
+Client for the shared key-value store: a Redis database behind Upstash's
+REST API, which is what Vercel's KV / Upstash integration provisions.
+
+Each function instance on Vercel has its own memory and its own /tmp, so
+state that one function writes and another reads (jobs, stored prospects)
+has to live here. Commands are Redis commands sent as JSON arrays over the
+pooled HTTP client; ``pipeline`` sends several in one round trip.
+
+Environment variables (set by the integration):
+  KV_REST_API_URL   - REST endpoint, e.g. https://<db>.upstash.io
+  KV_REST_API_TOKEN - Token for it
+"""
+
+import json
+import os
+
+from _http import urlopen
+
+TIMEOUT_SECONDS = 5
+MAX_RESPONSE_BYTES = 20_000_000
+
+
+class KVError(Exception):
+    """The store answered a command with an error."""
+
+
+class KVClient:
+    def __init__(self, url, token, timeout=TIMEOUT_SECONDS):
+        self.url = url.rstrip("/")
+        self.token = token
+        self.timeout = timeout
+
+    def _post(self, path, body):
+        with urlopen(
+            self.url + path,
+            data=json.dumps(body).encode(),
+            headers={"Authorization": f"Bearer {self.token}", "Content-Type": "application/json"},
+            method="POST",
+            timeout=self.timeout,
+            max_bytes=MAX_RESPONSE_BYTES,
+            max_seconds=self.timeout,
+        ) as resp:
+            return json.loads(resp.read().decode())
+
+    def command(self, *args):
+        """Run one command, e.g. ``command("SET", key, value, "EX", 60)``,
+        and return its result."""
+        reply = self._post("/", [str(arg) for arg in args])
+        if "error" in reply:
+            raise KVError(reply["error"])
+        return reply.get("result")
+
+    def pipeline(self, commands):
+        """Run several commands in one request; returns their results in
+        order. Raises KVError if any of them failed."""
+        if not commands:
+            return []
+        replies = self._post("/pipeline", [[str(arg) for arg in command] for command in commands])
+        errors = [reply["error"] for reply in replies if "error" in reply]
+        if errors:
+            raise KVError("; ".join(errors))
+        return [reply.get("result") for reply in replies]
+
+
+def kv_from_env():
+    """The KVClient configured by KV_REST_API_URL / KV_REST_API_TOKEN, or
+    None if the store isn't set up."""
+    url = os.environ.get("KV_REST_API_URL", "").strip()
+    token = os.environ.get("KV_REST_API_TOKEN", "").strip()
+    if not url or not token:
+        return None
+    return KVClient(url, token)
+
+
+def on_vercel():
+    """True when running as a Vercel function (where /tmp isn't shared)."""
+    return bool(os.environ.get("VERCEL"))
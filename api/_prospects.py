@@ -0,0 +1,474 @@
+"""
+Persistent prospect intelligence: analyses, key contacts and crawl snapshots.
+
+Every complete analysis is recorded under the prospect's domain with the
+company name and its key contacts, and every crawl of a site under its
+domain, so the research outlives the caches and the extension's
+localStorage. Lookups are indexed by domain, normalized company name and
+contact role/title (see /api/prospects); /api/analyze serves a recent
+stored analysis instead of researching the page again.
+
+An analysis is filed under the page URL, the seller and the page text the
+client sent (``page``, a key over the normalized text; "" when the server
+fetched the page), the same inputs the analysis cache is keyed on.
+
+Stores share one small interface (record_analysis, record_crawl,
+fresh_analysis, latest_analysis, prospect, search_company,
+contacts_by_title):
+  KVProspectStore     - the shared KV store (see _kv.py); the default when
+                        it is configured
+  SQLiteProspectStore - local file store; the default elsewhere, except on
+                        Vercel, where /tmp isn't shared between functions
+                        and the default is off
+  NullProspectStore   - records nothing (PROSPECT_STORE=off)
+
+Environment variables:
+  PROSPECT_STORE         - "kv", "sqlite" or "off" (default: see above)
+  PROSPECT_DB_PATH       - SQLite file for the sqlite store
+                           (default /tmp/salescopilot-prospects.sqlite3)
+  PROSPECT_FRESH_SECONDS - Age under which /api/analyze reuses a stored
+                           analysis (default 86400)
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import urlsplit
+
+from _cache import normalize_company, normalize_url
+from _contacts import role_for
+from _kv import kv_from_env, on_vercel
+
+DEFAULT_DB_PATH = "/tmp/salescopilot-prospects.sqlite3"
+FRESH_SECONDS = int(os.environ.get("PROSPECT_FRESH_SECONDS", "86400"))  # 1 day
+MAX_RESULTS = 100
+MAX_INDEX_SCAN = 1000  # KV index entries read for one search, before sorting
+SEP = "\x1f"           # between the parts of a KV key or index entry
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS prospects (
+    domain TEXT PRIMARY KEY, company TEXT NOT NULL, company_norm TEXT NOT NULL,
+    updated_at REAL NOT NULL);
+CREATE INDEX IF NOT EXISTS prospects_company ON prospects (company_norm);
+CREATE TABLE IF NOT EXISTS analyses (
+    url TEXT NOT NULL, seller TEXT NOT NULL, page TEXT NOT NULL, domain TEXT NOT NULL,
+    attempt INTEGER NOT NULL, analysis TEXT NOT NULL, analyzed_at REAL NOT NULL,
+    PRIMARY KEY (url, seller, page));
+CREATE INDEX IF NOT EXISTS analyses_domain ON analyses (domain, analyzed_at);
+CREATE TABLE IF NOT EXISTS contacts (
+    domain TEXT NOT NULL, name_norm TEXT NOT NULL, name TEXT NOT NULL, title TEXT NOT NULL,
+    title_norm TEXT NOT NULL, role TEXT NOT NULL, relevance_score INTEGER, source TEXT,
+    why_relevant TEXT, seen_at REAL NOT NULL, PRIMARY KEY (domain, name_norm));
+CREATE INDEX IF NOT EXISTS contacts_role ON contacts (role, relevance_score);
+CREATE INDEX IF NOT EXISTS contacts_title ON contacts (title_norm);
+CREATE TABLE IF NOT EXISTS crawls (
+    domain TEXT PRIMARY KEY, text TEXT NOT NULL, fetched_at REAL NOT NULL);
+"""
+
+
+def domain_of(url):
+    """Domain a prospect is stored under (no www., lower-case); accepts a
+    bare domain too."""
+    url = (url or "").strip()
+    netloc = urlsplit(url if "//" in url else "//" + url).netloc
+    return netloc.lower().removeprefix("www.")
+
+
+def _prefix_range(prefix):
+    """(low, high) bounds matching every string that starts with ``prefix``,
+    so prefix searches use the index."""
+    return prefix, prefix + "\U0010ffff"
+
+
+def _norm(text):
+    """Lower-cased, whitespace-collapsed name or title, as indexed."""
+    return " ".join((text or "").lower().split())
+
+
+def _contact_row(contact, now):
+    """The stored fields of one key contact."""
+    return {
+        "name": contact["name"],
+        "title": contact.get("title") or "",
+        "role": role_for(contact.get("title")),
+        "relevance_score": contact.get("relevance_score"),
+        "source": contact.get("source"),
+        "why_relevant": contact.get("why_relevant"),
+        "seen_at": now,
+    }
+
+
+def _best_contacts(contacts, limit):
+    """Contacts by relevance_score (unscored last), then most recently seen."""
+    contacts = sorted(contacts, key=lambda c: c["seen_at"], reverse=True)
+    contacts.sort(key=lambda c: (c["relevance_score"] is not None, c["relevance_score"] or 0), reverse=True)
+    return contacts[:limit]
+
+
+class NullProspectStore:
+    """Store that records nothing (PROSPECT_STORE=off)."""
+
+    def record_analysis(self, url, company, seller, attempt, analysis, page=""):
+        pass
+
+    def record_crawl(self, url, text):
+        pass
+
+    def fresh_analysis(self, url, seller, page="", max_age=FRESH_SECONDS):
+        return None
+
+    def latest_analysis(self, url, seller, page=""):
+        return None
+
+    def prospect(self, domain):
+        return None
+
+    def search_company(self, company, limit=MAX_RESULTS):
+        return []
+
+    def contacts_by_title(self, title, limit=MAX_RESULTS):
+        return []
+
+
+class SQLiteProspectStore:
+    """SQLite tables of prospects, their analyses, contacts and crawls."""
+
+    def __init__(self, path=DEFAULT_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        with self._connect() as db:
+            columns = [row[1] for row in db.execute("PRAGMA table_info(analyses)")]
+            if columns and "page" not in columns:
+                # Files from before analyses were keyed on page text
+                db.execute("ALTER TABLE analyses RENAME TO analyses_unkeyed")
+                db.execute("DROP INDEX IF EXISTS analyses_domain")
+            db.executescript(_SCHEMA)
+            if columns and "page" not in columns:
+                db.executescript(
+                    "INSERT INTO analyses SELECT url, seller, '', domain, attempt, analysis, analyzed_at "
+                    "FROM analyses_unkeyed; DROP TABLE analyses_unkeyed;"
+                )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def record_analysis(self, url, company, seller, attempt, analysis, page=""):
+        """Store an analysis of ``url`` for ``seller`` (a key over the
+        seller's details) and ``page``, replacing the previous one, and
+        merge its key_contacts into the domain's contacts."""
+        domain = domain_of(url)
+        now = time.time()
+        rows = [_contact_row(c, now) for c in analysis.get("key_contacts", ())]
+        with self._lock, self._connect() as db:
+            self._upsert_prospect(db, domain, company, now)
+            db.execute(
+                "INSERT OR REPLACE INTO analyses (url, seller, page, domain, attempt, analysis, analyzed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (normalize_url(url), seller, page, domain, attempt, json.dumps(analysis), now),
+            )
+            db.executemany(
+                "INSERT OR REPLACE INTO contacts (domain, name_norm, name, title, title_norm, role, "
+                "relevance_score, source, why_relevant, seen_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (domain, _norm(r["name"]), r["name"], r["title"], _norm(r["title"]), r["role"],
+                     r["relevance_score"], r["source"], r["why_relevant"], now)
+                    for r in rows
+                ],
+            )
+
+    def _upsert_prospect(self, db, domain, company, now):
+        if company:
+            db.execute(
+                "INSERT INTO prospects (domain, company, company_norm, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (domain) DO UPDATE SET company = excluded.company, "
+                "company_norm = excluded.company_norm, updated_at = excluded.updated_at",
+                (domain, company, normalize_company(company), now),
+            )
+        else:
+            db.execute(
+                "INSERT INTO prospects (domain, company, company_norm, updated_at) VALUES (?, '', '', ?) "
+                "ON CONFLICT (domain) DO UPDATE SET updated_at = excluded.updated_at",
+                (domain, now),
+            )
+
+    def record_crawl(self, url, text):
+        """Keep the latest leadership crawl of ``url``'s site."""
+        domain = domain_of(url)
+        now = time.time()
+        with self._lock, self._connect() as db:
+            self._upsert_prospect(db, domain, "", now)
+            db.execute(
+                "INSERT OR REPLACE INTO crawls (domain, text, fetched_at) VALUES (?, ?, ?)",
+                (domain, text, now),
+            )
+
+    def latest_analysis(self, url, seller, page=""):
+        """(analysis, analyzed_at) last stored for ``url``, ``seller`` and
+        ``page``, or None."""
+        with self._lock, self._connect() as db:
+            row = db.execute(
+                "SELECT analysis, analyzed_at FROM analyses WHERE url = ? AND seller = ? AND page = ?",
+                (normalize_url(url), seller, page),
+            ).fetchone()
+        return (json.loads(row[0]), row[1]) if row else None
+
+    def fresh_analysis(self, url, seller, page="", max_age=FRESH_SECONDS):
+        """latest_analysis, if it is at most ``max_age`` seconds old."""
+        stored = self.latest_analysis(url, seller, page)
+        if stored is None or time.time() - stored[1] > max_age:
+            return None
+        return stored
+
+    def prospect(self, domain):
+        """Everything stored for ``domain``, or None if it was never seen."""
+        domain = domain_of(domain)
+        with self._lock, self._connect() as db:
+            row = db.execute(
+                "SELECT company, updated_at FROM prospects WHERE domain = ?", (domain,)
+            ).fetchone()
+            if row is None:
+                return None
+            analyses = db.execute(
+                "SELECT url, attempt, analysis, analyzed_at FROM analyses WHERE domain = ? "
+                "ORDER BY analyzed_at DESC LIMIT ?",
+                (domain, MAX_RESULTS),
+            ).fetchall()
+            contacts = self._contacts(db, "c.domain = ?", (domain,), MAX_RESULTS)
+            crawl = db.execute("SELECT text, fetched_at FROM crawls WHERE domain = ?", (domain,)).fetchone()
+        return {
+            "domain": domain,
+            "company": row[0],
+            "updated_at": row[1],
+            "analyses": [
+                {"url": url, "attempt": attempt, "analysis": json.loads(analysis), "analyzed_at": at}
+                for url, attempt, analysis, at in analyses
+            ],
+            "contacts": contacts,
+            "crawl": {"text": crawl[0], "fetched_at": crawl[1]} if crawl else None,
+        }
+
+    def search_company(self, company, limit=MAX_RESULTS):
+        """Prospects whose normalized company name starts with ``company``'s,
+        each with its contacts."""
+        name = normalize_company(company)
+        if not name:
+            return []
+        with self._lock, self._connect() as db:
+            rows = db.execute(
+                "SELECT domain, company, updated_at FROM prospects "
+                "WHERE company_norm >= ? AND company_norm < ? ORDER BY updated_at DESC LIMIT ?",
+                (*_prefix_range(name), limit),
+            ).fetchall()
+            return [
+                {"domain": domain, "company": company, "updated_at": at,
+                 "contacts": self._contacts(db, "c.domain = ?", (domain,), MAX_RESULTS)}
+                for domain, company, at in rows
+            ]
+
+    def contacts_by_title(self, title, limit=MAX_RESULTS):
+        """Contacts across prospects in ``title``'s role ("coo", "VP Ops"),
+        else whose title starts with it; best first."""
+        role = role_for(title)
+        if role:
+            where, params = "c.role = ?", (role,)
+        else:
+            where = "c.title_norm >= ? AND c.title_norm < ?"
+            params = _prefix_range(_norm(title))
+        with self._lock, self._connect() as db:
+            return self._contacts(db, where, params, limit)
+
+    def _contacts(self, db, where, params, limit):
+        rows = db.execute(
+            "SELECT c.domain, p.company, c.name, c.title, c.role, c.relevance_score, c.source, "
+            f"c.why_relevant, c.seen_at FROM contacts c JOIN prospects p ON p.domain = c.domain WHERE {where} "
+            "ORDER BY c.relevance_score DESC, c.seen_at DESC LIMIT ?",
+            (*params, limit),
+        ).fetchall()
+        keys = ("domain", "company", "name", "title", "role", "relevance_score", "source",
+                "why_relevant", "seen_at")
+        return [dict(zip(keys, row)) for row in rows]
+
+
+class KVProspectStore:
+    """The same records in the shared KV store (see _kv.py), so every
+    function instance reads what any other recorded.
+
+    Per domain: ``prospect:<domain>`` (JSON), the hashes
+    ``analyses:<domain>`` (by url, seller and page) and
+    ``contacts:<domain>`` (by normalized name), and ``crawl:<domain>``.
+    Searches use sorted sets as lexicographic indexes: ``index:company``
+    (company_norm, domain), ``index:title`` (title_norm, domain, name) and
+    ``index:role:<role>`` (domain, name), parts joined by SEP.
+    """
+
+    def __init__(self, kv):
+        self.kv = kv
+
+    def _upsert_prospect(self, domain, company, now):
+        """Commands that create or touch ``domain``'s prospect record."""
+        stored = self.kv.command("GET", "prospect:" + domain)
+        record = json.loads(stored) if stored else {"domain": domain, "company": "", "company_norm": ""}
+        commands = []
+        if company:
+            company_norm = normalize_company(company)
+            if company_norm != record["company_norm"]:
+                if record["company_norm"]:
+                    commands.append(["ZREM", "index:company", record["company_norm"] + SEP + domain])
+                commands.append(["ZADD", "index:company", 0, company_norm + SEP + domain])
+            record.update(company=company, company_norm=company_norm)
+        record["updated_at"] = now
+        commands.append(["SET", "prospect:" + domain, json.dumps(record)])
+        return commands
+
+    def _contact_indexes(self, domain, name_norm, row):
+        """(index key, member) pairs a contact is listed under."""
+        indexes = [("index:title", _norm(row["title"]) + SEP + domain + SEP + name_norm)]
+        if row["role"]:
+            indexes.append(("index:role:" + row["role"], domain + SEP + name_norm))
+        return indexes
+
+    def record_analysis(self, url, company, seller, attempt, analysis, page=""):
+        """As SQLiteProspectStore.record_analysis."""
+        domain = domain_of(url)
+        now = time.time()
+        commands = self._upsert_prospect(domain, company, now)
+        field = SEP.join((normalize_url(url), seller, page))
+        commands.append(["HSET", "analyses:" + domain, field, json.dumps(
+            {"url": normalize_url(url), "attempt": attempt, "analysis": analysis, "analyzed_at": now})])
+
+        rows = {_norm(c["name"]): _contact_row(c, now) for c in analysis.get("key_contacts", ())}
+        if rows:
+            names = list(rows)
+            # A contact whose title changed leaves its old index entries
+            for name_norm, stored in zip(names, self.kv.command("HMGET", "contacts:" + domain, *names)):
+                if stored:
+                    for key, member in self._contact_indexes(domain, name_norm, json.loads(stored)):
+                        commands.append(["ZREM", key, member])
+            pairs = [value for name_norm, row in rows.items() for value in (name_norm, json.dumps(row))]
+            commands.append(["HSET", "contacts:" + domain, *pairs])
+            for name_norm, row in rows.items():
+                for key, member in self._contact_indexes(domain, name_norm, row):
+                    commands.append(["ZADD", key, 0, member])
+        self.kv.pipeline(commands)
+
+    def record_crawl(self, url, text):
+        """Keep the latest leadership crawl of ``url``'s site."""
+        domain = domain_of(url)
+        now = time.time()
+        commands = self._upsert_prospect(domain, "", now)
+        commands.append(["SET", "crawl:" + domain, json.dumps({"text": text, "fetched_at": now})])
+        self.kv.pipeline(commands)
+
+    def latest_analysis(self, url, seller, page=""):
+        """(analysis, analyzed_at) last stored for ``url``, ``seller`` and
+        ``page``, or None."""
+        field = SEP.join((normalize_url(url), seller, page))
+        stored = self.kv.command("HGET", "analyses:" + domain_of(url), field)
+        if not stored:
+            return None
+        stored = json.loads(stored)
+        return stored["analysis"], stored["analyzed_at"]
+
+    def fresh_analysis(self, url, seller, page="", max_age=FRESH_SECONDS):
+        """latest_analysis, if it is at most ``max_age`` seconds old."""
+        stored = self.latest_analysis(url, seller, page)
+        if stored is None or time.time() - stored[1] > max_age:
+            return None
+        return stored
+
+    def _records(self, key_prefix, domains):
+        """{domain: parsed JSON} for the ``<key_prefix><domain>`` keys that exist."""
+        domains = list(dict.fromkeys(domains))
+        values = self.kv.pipeline([["GET", key_prefix + domain] for domain in domains])
+        return {domain: json.loads(value) for domain, value in zip(domains, values) if value}
+
+    def _domain_contacts(self, domains, companies):
+        """{domain: best contacts} for each domain, shaped like the SQLite rows."""
+        domains = list(dict.fromkeys(domains))
+        hashes = self.kv.pipeline([["HGETALL", "contacts:" + domain] for domain in domains])
+        return {
+            domain: _best_contacts([
+                self._contact(domain, companies, json.loads(value)) for value in (flat or [])[1::2]
+            ], MAX_RESULTS)
+            for domain, flat in zip(domains, hashes)
+        }
+
+    def _contact(self, domain, companies, row):
+        return {"domain": domain, "company": companies.get(domain, {}).get("company", ""), **row}
+
+    def prospect(self, domain):
+        """Everything stored for ``domain``, or None if it was never seen."""
+        domain = domain_of(domain)
+        record, analyses, contacts, crawl = self.kv.pipeline([
+            ["GET", "prospect:" + domain],
+            ["HGETALL", "analyses:" + domain],
+            ["HGETALL", "contacts:" + domain],
+            ["GET", "crawl:" + domain],
+        ])
+        if not record:
+            return None
+        record = json.loads(record)
+        analyses = sorted((json.loads(value) for value in (analyses or [])[1::2]),
+                          key=lambda a: a["analyzed_at"], reverse=True)
+        return {
+            "domain": domain,
+            "company": record["company"],
+            "updated_at": record["updated_at"],
+            "analyses": analyses[:MAX_RESULTS],
+            "contacts": _best_contacts([
+                self._contact(domain, {domain: record}, json.loads(value)) for value in (contacts or [])[1::2]
+            ], MAX_RESULTS),
+            "crawl": json.loads(crawl) if crawl else None,
+        }
+
+    def _lex_range(self, key, prefix):
+        low, high = _prefix_range(prefix)
+        return self.kv.command("ZRANGEBYLEX", key, "[" + low, "(" + high, "LIMIT", 0, MAX_INDEX_SCAN) or []
+
+    def search_company(self, company, limit=MAX_RESULTS):
+        """As SQLiteProspectStore.search_company."""
+        name = normalize_company(company)
+        if not name:
+            return []
+        domains = [member.split(SEP)[1] for member in self._lex_range("index:company", name)]
+        records = sorted(self._records("prospect:", domains).values(),
+                         key=lambda r: r["updated_at"], reverse=True)[:limit]
+        contacts = self._domain_contacts([r["domain"] for r in records], {r["domain"]: r for r in records})
+        return [
+            {"domain": r["domain"], "company": r["company"], "updated_at": r["updated_at"],
+             "contacts": contacts[r["domain"]]}
+            for r in records
+        ]
+
+    def contacts_by_title(self, title, limit=MAX_RESULTS):
+        """As SQLiteProspectStore.contacts_by_title."""
+        role = role_for(title)
+        if role:
+            keys = [member.split(SEP) for member in self._lex_range("index:role:" + role, "")]
+        else:
+            keys = [member.split(SEP)[1:] for member in self._lex_range("index:title", _norm(title))]
+        if not keys:
+            return []
+        values = self.kv.pipeline([["HGET", "contacts:" + domain, name_norm] for domain, name_norm in keys])
+        companies = self._records("prospect:", [domain for domain, _ in keys])
+        return _best_contacts([
+            self._contact(domain, companies, json.loads(value))
+            for (domain, _), value in zip(keys, values) if value
+        ], limit)
+
+
+def store_from_env():
+    """Build the prospect store selected by PROSPECT_STORE."""
+    backend = os.environ.get("PROSPECT_STORE", "").strip().lower()
+    kv = kv_from_env()
+    if not backend:
+        backend = "kv" if kv is not None else "off" if on_vercel() else "sqlite"
+    if backend == "off":
+        return NullProspectStore()
+    if backend == "kv":
+        if kv is None:
+            raise ValueError("PROSPECT_STORE=kv needs KV_REST_API_URL and KV_REST_API_TOKEN")
+        return KVProspectStore(kv)
+    return SQLiteProspectStore(os.environ.get("PROSPECT_DB_PATH", DEFAULT_DB_PATH))
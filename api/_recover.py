@@ -0,0 +1,140 @@
+"""
+Tolerant, incremental parsing of the JSON objects models reply with.
+
+Replies sometimes wrap the requested object in prose or code fences, or
+are cut off by max_tokens. ObjectStreamParser finds the first JSON object
+in a stream of text and reports each top-level field as soon as its value
+is complete; ``recover_object`` uses it to salvage every complete field of
+a reply that doesn't parse as a whole, from whichever object in the reply
+(an echoed example, say, or the real answer) holds the most of them.
+"""
+
+import json
+import re
+
+# "{" followed by a key or "}", so braces in surrounding prose are skipped
+_OBJECT_START_RE = re.compile(r'\{\s*(?=["}])')
+
+
+class ObjectStreamParser:
+    """Feed text in pieces; ``feed`` returns the top-level (key, value)
+    pairs completed by that piece.
+
+    A pair whose value isn't valid JSON is skipped. Everything after the
+    object's closing brace is ignored.
+    """
+
+    def __init__(self):
+        self.fields = {}
+        self.closed = False
+        self._prefix = ""     # text seen before the object starts
+        self._buf = None      # text from the opening brace on
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._pair_start = 1
+
+    def object_text(self):
+        """The object's text, once ``closed``."""
+        return self._buf[:self._pos] if self.closed else None
+
+    def feed(self, text):
+        if self.closed:
+            return []
+        if self._buf is None:
+            self._prefix += text
+            match = _OBJECT_START_RE.search(self._prefix)
+            if not match:
+                return []
+            self._buf, self._prefix = self._prefix[match.start():], ""
+        else:
+            self._buf += text
+        return self._scan()
+
+    def _scan(self):
+        completed = []
+        buf = self._buf
+        i = self._pos
+        while i < len(buf):
+            c = buf[i]
+            i += 1
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+            elif c == '"':
+                self._in_string = True
+            elif c in "{[":
+                self._depth += 1
+            elif c in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    completed += self._take_pair(buf[self._pair_start:i - 1])
+                    self.closed = True
+                    break
+            elif c == "," and self._depth == 1:
+                completed += self._take_pair(buf[self._pair_start:i - 1])
+                self._pair_start = i
+        self._pos = i
+        return completed
+
+    def _take_pair(self, pair):
+        if not pair.strip():
+            return []
+        try:
+            parsed = json.loads("{" + pair + "}")
+        except ValueError:
+            return []
+        self.fields.update(parsed)
+        return list(parsed.items())
+
+
+def _recover_at(text, start):
+    """(fields, complete, end) for the object starting at ``start``; ``end``
+    is just past its closing brace, or None if it never closes."""
+    parser = ObjectStreamParser()
+    parser.feed(text[start:])
+    if not parser.closed:
+        return dict(parser.fields), False, None
+    end = start + len(parser.object_text())
+    try:
+        obj = json.loads(parser.object_text())
+        if isinstance(obj, dict):
+            return obj, True, end
+    except ValueError:
+        pass
+    return dict(parser.fields), False, end
+
+
+def recover_object(text, expected=None):
+    """Return (fields, complete) for the best JSON object in ``text``.
+
+    ``complete`` is True when the whole object parsed. Otherwise ``fields``
+    holds just the top-level fields whose values were complete and valid,
+    which is empty if no object was found.
+
+    Every object in the text is tried (objects nested in an earlier one are
+    not candidates); the one recovering the most ``expected`` keys wins (or
+    the most fields, without ``expected``), then a complete object over a
+    partial one, then the earliest.
+    """
+    best, best_score = ({}, False), None
+    closed_until = 0
+    for match in _OBJECT_START_RE.finditer(text):
+        start = match.start()
+        if start < closed_until:
+            continue
+        fields, complete, end = _recover_at(text, start)
+        if end is not None:
+            closed_until = end
+        found = len(fields) if expected is None else sum(1 for key in expected if key in fields)
+        score = (found, complete)
+        if best_score is None or score > best_score:
+            best, best_score = (fields, complete), score
+        if complete and expected is not None and found == len(expected):
+            break  # nothing later can do better
+    return best
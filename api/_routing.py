@@ -0,0 +1,54 @@
+"""
+Per-request model routing.
+
+Picks the model and max_tokens for each call from the task, the size of its
+input and the time left in the request. Work that needs little reasoning
+(short outreach snippets, pages with almost no leadership research to sift)
+goes to the fast model, as does any call that must finish inside a tight
+latency budget; everything else goes to the large model.
+
+Environment variables (all optional):
+  MODEL_ROUTING              - "auto" (default), "large" or "fast" to pin one model
+  MODEL_LARGE                - large model (default claude-sonnet-4-20250514)
+  MODEL_FAST                 - fast model (default claude-haiku-4-5-20251001)
+  ROUTE_FAST_SNIPPET_TOKENS  - snippet prompts up to this size use the fast model (default 1200)
+  ROUTE_FAST_RESEARCH_TOKENS - analyses with at most this much leadership research
+                               use the fast model (default 100)
+  ROUTE_FAST_OUTREACH_TOKENS - outreach rewrites (regenerate) with a prompt up to
+                               this size use the fast model (default 0: never)
+  ROUTE_LARGE_MIN_SECONDS    - below this latency budget, use the fast model (default 20)
+"""
+
+import os
+
+LARGE_MODEL = os.environ.get("MODEL_LARGE", "claude-sonnet-4-20250514")
+FAST_MODEL = os.environ.get("MODEL_FAST", "claude-haiku-4-5-20251001")
+ROUTING = os.environ.get("MODEL_ROUTING", "auto").strip().lower()
+
+MAX_TOKENS = {"snippet": 400, "analyze": 1500, "outreach": 300}
+FAST_BELOW_TOKENS = {
+    "snippet": int(os.environ.get("ROUTE_FAST_SNIPPET_TOKENS", "1200")),
+    "analyze": int(os.environ.get("ROUTE_FAST_RESEARCH_TOKENS", "100")),
+    "outreach": int(os.environ.get("ROUTE_FAST_OUTREACH_TOKENS", "0")),
+}
+LARGE_MIN_SECONDS = float(os.environ.get("ROUTE_LARGE_MIN_SECONDS", "20"))
+
+
+def choose_model(task, input_tokens, latency_budget=None):
+    """Return (model, max_tokens) for one call.
+
+    ``input_tokens`` is the size of the input that drives difficulty: the
+    whole prompt for "snippet" and "outreach", the leadership research for
+    "analyze".
+    ``latency_budget`` is the number of seconds the call may take, if bounded.
+    """
+    max_tokens = MAX_TOKENS[task]
+    if ROUTING == "large":
+        return LARGE_MODEL, max_tokens
+    if ROUTING == "fast":
+        return FAST_MODEL, max_tokens
+    if latency_budget is not None and latency_budget < LARGE_MIN_SECONDS:
+        return FAST_MODEL, max_tokens
+    if input_tokens <= FAST_BELOW_TOKENS[task]:
+        return FAST_MODEL, max_tokens
+    return LARGE_MODEL, max_tokens
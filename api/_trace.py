@@ -0,0 +1,155 @@
+"""
+Lightweight per-request tracing.
+
+A Trace collects span timings, bytes fetched per URL, token usage per
+Anthropic call and counters (retries, stage timeouts). It lives in a
+context variable, so the shared clients in _http.py and _claude.py record
+into whichever request is active without threading it through every call;
+work submitted to thread pools carries it (and any other per-request
+context, such as the admission client) along via ``in_context``.
+
+With no active trace every hook is a context-variable lookup and a None
+check, so tracing costs next to nothing when it is off.
+
+Environment variables:
+  TRACE_REQUESTS - "1" to trace every request (default off; a request can
+                   also opt in with an "X-Trace: 1" header)
+"""
+
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+TRACE_ALL = os.environ.get("TRACE_REQUESTS", "").strip().lower() in ("1", "true", "on")
+
+_current = contextvars.ContextVar("trace", default=None)
+
+
+class Trace:
+    """Everything recorded for one request; safe to update from any thread."""
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.perf_counter()
+        self.spans = []
+        self.fetches = []
+        self.usage = []
+        self.counters = {}
+        self.notes = {}
+        self._lock = threading.Lock()
+
+    def add_span(self, name, seconds, ok=True):
+        span = {"name": name, "ms": round(seconds * 1000, 1)}
+        if not ok:
+            span["ok"] = False
+        with self._lock:
+            self.spans.append(span)
+
+    def record_fetch(self, url, status, nbytes, seconds):
+        with self._lock:
+            self.fetches.append({"url": url, "status": status, "bytes": nbytes, "ms": round(seconds * 1000, 1)})
+
+    def record_usage(self, model, usage):
+        with self._lock:
+            self.usage.append(dict(usage, model=model))
+
+    def incr(self, counter, n=1):
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + n
+
+    def note(self, key, value):
+        with self._lock:
+            self.notes[key] = value
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "event": "trace",
+                "name": self.name,
+                "total_ms": round((time.perf_counter() - self.started) * 1000, 1),
+                "spans": list(self.spans),
+                "fetches": list(self.fetches),
+                "usage": list(self.usage),
+                "counters": dict(self.counters),
+                "notes": dict(self.notes),
+            }
+
+    def server_timing(self):
+        """Server-Timing header value: one entry per span, then the total."""
+        with self._lock:
+            spans = list(self.spans)
+        entries = [f"{_token(s['name'])}_{i};desc=\"{s['name']}\";dur={s['ms']}" for i, s in enumerate(spans)]
+        total = round((time.perf_counter() - self.started) * 1000, 1)
+        return ", ".join(entries + [f"total;dur={total}"])
+
+    def emit(self):
+        print(json.dumps(self.to_dict()), flush=True)
+
+
+def _token(name):
+    return "".join(c if c.isalnum() else "-" for c in name) or "span"
+
+
+def wanted(headers):
+    """True if this request should be traced (TRACE_REQUESTS or X-Trace: 1)."""
+    return TRACE_ALL or (headers is not None and headers.get("X-Trace", "") == "1")
+
+
+@contextmanager
+def tracing(name, enabled=True):
+    """Make a new Trace current for the block; yields it (None if disabled)."""
+    if not enabled:
+        yield None
+        return
+    trace = Trace(name)
+    token = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+
+
+def current():
+    return _current.get()
+
+
+@contextmanager
+def span(name):
+    """Time the block as a span of the current trace, if any."""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    ok = False
+    try:
+        yield
+        ok = True
+    finally:
+        trace.add_span(name, time.perf_counter() - started, ok)
+
+
+def traced(name, fn):
+    """Wrap ``fn`` so each call is recorded as a span named ``name``."""
+    def wrapper(*args, **kwargs):
+        with span(name):
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+def in_context(fn):
+    """Bind ``fn`` to a copy of the caller's context (and so its trace).
+
+    Call this once per submission to a thread pool; each call makes a fresh
+    copy, since one context can't be entered by two threads at once.
+    """
+    return _bind(contextvars.copy_context(), fn)
+
+
+def _bind(ctx, fn):
+    def run(*args, **kwargs):
+        return ctx.run(fn, *args, **kwargs)
+    return run
@@ -5,134 +5,484 @@ sales intelligence. The Chrome extension sends page text directly
 
 Falls back to server-side fetch if page_text is not provided.
 
+Regenerating (same page and seller, higher "attempt") reuses the cached
+earlier analysis and asks the model only for a new outreach; send
+"regenerate": "full" to re-run the whole analysis instead.
+
+Complete analyses, their key contacts and the crawled research are kept in
+the prospect store (_prospects.py, queried through /api/prospects). A
+first analysis of a page already analyzed for the same seller within
+PROSPECT_FRESH_SECONDS is served from the store; send "refresh": true to
+research it again. Stored analyses are filed under the page text sent, as
+the cache is, so an analysis of different text is never served for it.
+
 Environment variables required:
   ANTHROPIC_API_KEY - Your Anthropic API key
+
+Optional tuning:
+  ANALYSIS_CACHE_TTL    - Seconds an analysis result stays cached (default 21600)
+  LEADERSHIP_CACHE_TTL  - Seconds crawl/web-search research stays fresh (default 604800)
+  CACHE_BACKEND         - Cache store, see _cache.py (default in-process memory)
+  MODEL_ROUTING         - Model choice per request, see _routing.py (default "auto")
+  PROSPECT_STORE        - Prospect store, see _prospects.py (default the shared KV
+                          store when configured)
+  RATE_LIMIT_BACKEND    - Token budgets per client (X-Client-Id or IP) and API key,
+                          see _admission.py (default in-process memory)
+  ANALYZE_HEDGE_SECONDS - Race a second Claude request when the first hasn't
+                          answered (streaming: started) within this many
+                          seconds; 0 disables hedging (default 0)
+  TRACE_REQUESTS        - "1" to log a trace of every request and return its
+                          spans in a Server-Timing header; see _trace.py
+                          (a single request can opt in with "X-Trace: 1")
 """
 
+import copy
 import json
 import os
 import re
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
 from http.server import BaseHTTPRequestHandler
-import urllib.request
 import urllib.error
 
-ANTHROPIC_API_URL = "https://api.anthropic.com/v1/messages"
-ANTHROPIC_VERSION = "2023-06-01"
-MODEL = "claude-sonnet-4-20250514"
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _admission import AdmissionRejected, client, client_id  # noqa: E402
+from _cache import cache_from_env, cache_key, get_or_compute, normalize_text, normalize_url  # noqa: E402
+from _claude import post_messages, stream_messages, iter_text  # noqa: E402
+from _contacts import extract_contacts, fallback_contacts, format_candidates  # noqa: E402
+from _compact import CHARS_PER_TOKEN, compact_sections, compact_text, estimate_tokens  # noqa: E402
+from _html import read_document, read_links, read_text  # noqa: E402
+from _recover import ObjectStreamParser, recover_object  # noqa: E402
+from _prospects import store_from_env as prospect_store_from_env  # noqa: E402
+from _http import ResponseLimitError, ResponseRejected, urlopen  # noqa: E402  (shared pooled client, see _http.py)
+from _routing import FAST_MODEL, LARGE_MODEL, choose_model  # noqa: E402
+from _trace import current, in_context, span, traced, tracing, wanted  # noqa: E402
+
 MAX_BODY_BYTES = 200_000
-MAX_PAGE_TEXT_CHARS = 6000
+PAGE_TEXT_TOKENS = 1500        # budget for page content in the prompt
+LEADERSHIP_TEXT_TOKENS = 1500  # budget for crawl + web search research
+LEADERSHIP_EXCERPT_TOKENS = 400  # research kept next to a pre-extracted contact table
+RAW_TEXT_FACTOR = 3            # raw text read per unit of budget, for ranking
+FETCH_HEADERS = {"User-Agent": "Mozilla/5.0 (compatible; SalesCopilot/2.0)"}
+HTML_TYPES = ("html",)          # prospect-site fetches only accept HTML
+MAX_HTML_BYTES = 2_000_000      # per prospect-site response
+HEDGE_AFTER_SECONDS = float(os.environ.get("ANALYZE_HEDGE_SECONDS", "0")) or None
+
+
+def call_claude(system, user_prompt, max_tokens=600, model=LARGE_MODEL, deadline=None, history=()):
+    """Call the Anthropic Messages API and return the reply text.
+
+    Retries stop at ``deadline`` (a ``time.monotonic()`` value), if given.
+    ``history`` holds earlier messages of the conversation, if any.
+    """
+    data = post_messages({
+        "model": model,
+        "max_tokens": max_tokens,
+        "system": system,
+        "messages": [*history, {"role": "user", "content": user_prompt}],
+    }, timeout=60, deadline=deadline, hedge_after=HEDGE_AFTER_SECONDS)
+    return data["content"][0]["text"].strip()
 
 
-def call_claude(system, user_prompt, max_tokens=600):
-    """Call the Anthropic Messages API directly via urllib."""
-    api_key = os.environ.get("ANTHROPIC_API_KEY", "").strip()
-    payload = json.dumps({
-        "model": MODEL,
+def stream_claude(system, user_prompt, max_tokens=600, model=LARGE_MODEL, deadline=None):
+    """Stream a Messages API reply, yielding text deltas as they arrive."""
+    return iter_text(stream_messages({
+        "model": model,
         "max_tokens": max_tokens,
         "system": system,
         "messages": [{"role": "user", "content": user_prompt}],
-    }).encode()
-
-    req = urllib.request.Request(
-        ANTHROPIC_API_URL,
-        data=payload,
-        headers={
-            "Content-Type": "application/json",
-            "x-api-key": api_key,
-            "anthropic-version": ANTHROPIC_VERSION,
-        },
-        method="POST",
-    )
-    with urllib.request.urlopen(req, timeout=60) as resp:
-        data = json.loads(resp.read().decode())
-    return data["content"][0]["text"].strip()
+    }, timeout=60, deadline=deadline, hedge_after=HEDGE_AFTER_SECONDS))
 
 
 def add_cors_headers(handler):
     handler.send_header("Access-Control-Allow-Origin", "*")
     handler.send_header("Access-Control-Allow-Methods", "POST, OPTIONS")
-    handler.send_header("Access-Control-Allow-Headers", "Content-Type")
+    handler.send_header("Access-Control-Allow-Headers", "Content-Type, X-Client-Id")
+    handler.send_header("Access-Control-Expose-Headers", "X-Cache, Server-Timing, Retry-After")
+    trace = current()
+    if trace is not None:
+        handler.send_header("Server-Timing", trace.server_timing())
+        handler.send_header("Timing-Allow-Origin", "*")
 
 
-def send_json(handler, status, data):
+def send_json(handler, status, data, headers=None):
     handler.send_response(status)
     add_cors_headers(handler)
     handler.send_header("Content-Type", "application/json")
+    for name, value in (headers or {}).items():
+        handler.send_header(name, value)
     handler.end_headers()
     handler.wfile.write(json.dumps(data).encode())
 
 
+def wants_event_stream(handler, body):
+    """True if the client opted in to Server-Sent Events for this request."""
+    return body.get("stream") is True or "text/event-stream" in handler.headers.get("Accept", "")
+
+
+def start_event_stream(handler, headers=None):
+    handler.send_response(200)
+    add_cors_headers(handler)
+    handler.send_header("Content-Type", "text/event-stream")
+    handler.send_header("Cache-Control", "no-cache")
+    for name, value in (headers or {}).items():
+        handler.send_header(name, value)
+    handler.end_headers()
+
+
+def send_event(handler, event, data):
+    handler.wfile.write(f"event: {event}\ndata: {json.dumps(data)}\n\n".encode())
+    handler.wfile.flush()
+
+
 # ---------------------------------------------------------------------------
 # Server-side page fetch (fallback)
 # ---------------------------------------------------------------------------
 
-def _strip_html(html):
-    """Strip script/style tags and HTML markup, returning plain text."""
-    text = re.sub(r"<script[^>]*>.*?</script>", "", html, flags=re.DOTALL | re.IGNORECASE)
-    text = re.sub(r"<style[^>]*>.*?</style>", "", text, flags=re.DOTALL | re.IGNORECASE)
-    text = re.sub(r"<[^>]+>", " ", text)
-    text = re.sub(r"\s+", " ", text).strip()
-    return text
+def fetch_page_document(url):
+    """Fetch and parse a page in one pass; None if it can't be read.
 
-
-def fetch_page_text(url):
-    """Fetch the text content of a URL (basic extraction)."""
+    The PageDocument carries the text, the naming metadata (title,
+    og:site_name, JSON-LD Organization) and the links, so the page text,
+    derive_company_name and path discovery share one download.
+    """
     try:
-        req = urllib.request.Request(url, headers={
-            "User-Agent": "Mozilla/5.0 (compatible; SalesCopilot/2.0)"
-        })
-        with urllib.request.urlopen(req, timeout=10) as resp:
-            html = resp.read().decode("utf-8", errors="ignore")
-
-        return _strip_html(html)[:MAX_PAGE_TEXT_CHARS]
+        with urlopen(url, headers=FETCH_HEADERS, timeout=10, max_bytes=MAX_HTML_BYTES,
+                     max_seconds=10, content_types=HTML_TYPES) as resp:
+            return read_document(resp, PAGE_TEXT_TOKENS * CHARS_PER_TOKEN * RAW_TEXT_FACTOR)
     except Exception:
-        return ""
+        return None
+
+
+def document_text(document):
+    """Page text for the prompt, compacted to PAGE_TEXT_TOKENS ("" if none)."""
+    return compact_text(document.text, PAGE_TEXT_TOKENS) if document is not None else ""
+
+
+class PageFetch:
+    """The prospect page, fetched at most once per request.
+
+    Every stage that needs the page calls ``document()``; the first call
+    downloads it and the others wait for that download.
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self._lock = threading.Lock()
+        self._fetched = False
+        self._document = None
+
+    def document(self):
+        """The page's PageDocument, or None if it couldn't be fetched."""
+        with self._lock:
+            if not self._fetched:
+                with span("page-fetch"):
+                    self._document = fetch_page_document(self.url)
+                self._fetched = True
+            return self._document
+
+    def peek(self):
+        """The PageDocument if a stage already fetched it, without fetching."""
+        return self._document if self._fetched else None
 
 
 # ---------------------------------------------------------------------------
 # Leadership page discovery — crawl /about, /team, etc. to find executives
 # ---------------------------------------------------------------------------
 
+# Common paths, crawled when a site's own links reveal none (see leadership_paths)
 LEADERSHIP_PATHS = [
     "/about", "/about-us", "/about/team", "/about/leadership",
     "/team", "/our-team", "/leadership", "/management",
     "/company", "/company/team", "/company/leadership",
     "/people", "/executives", "/management-team",
 ]
+CRAWL_MAX_CONCURRENCY = 4   # simultaneous requests against one origin
+CRAWL_DEADLINE_SECONDS = 15  # total budget for the whole crawl
+
+# Leadership research depends only on the company, so it is cached far longer
+# than analyses. Stale entries are served while a background refresh runs.
+LEADERSHIP_FRESH_SECONDS = int(os.environ.get("LEADERSHIP_CACHE_TTL", "604800"))  # 7 days
+LEADERSHIP_STALE_SECONDS = 30 * 86400
+DEAD_PATH_TTL = 86400
+LEADERSHIP_CACHE = cache_from_env(
+    "leadership", max_entries=1024, ttl=LEADERSHIP_FRESH_SECONDS + LEADERSHIP_STALE_SECONDS
+)
 
-def fetch_leadership_text(base_url, max_chars=4000):
-    """Try common leadership/about pages and return combined text."""
-    from urllib.parse import urlparse, urlunparse
 
-    parsed = urlparse(base_url)
-    origin = urlunparse((parsed.scheme, parsed.netloc, "", "", "", ""))
+def _fetch_leadership_page(target, max_chars):
+    """Fetch one candidate page and return its plain text.
 
-    combined = []
-    chars_so_far = 0
+    Returns None when the path is durably unusable (4xx, non-HTML or a
+    near-empty page) so the crawl can remember it, and "" for transient
+    failures such as timeouts or 5xx responses.
+    """
+    try:
+        with urlopen(target, headers=FETCH_HEADERS, timeout=5, max_bytes=MAX_HTML_BYTES,
+                     max_seconds=5, content_types=HTML_TYPES) as resp:
+            # Only process if we got a 200 and it's HTML
+            if resp.status != 200:
+                return None
+            text = read_text(resp, max_chars)
+        return text if len(text) > 100 else None  # skip near-empty pages
+    except ResponseRejected:
+        return None
+    except urllib.error.HTTPError as e:
+        return None if 400 <= e.code < 500 else ""
+    except Exception:
+        return ""
+
+
+# Path discovery: rather than probing LEADERSHIP_PATHS blindly, rank the
+# site's own links (homepage anchors, sitemap URLs) by leadership keywords.
+DISCOVERY_SECONDS = 5        # budget for reading homepage, robots.txt and sitemap
+DISCOVERED_PATHS_MAX = 5     # top-ranked candidates actually crawled
+MAX_SITEMAP_BYTES = 5_000_000
+MAX_SITEMAPS = 3             # sitemap files read per site (index children included)
+LEADERSHIP_KEYWORDS = {
+    "leadership": 6, "executive": 5, "management": 5, "team": 4, "founder": 4,
+    "who-we-are": 4, "our-people": 4, "people": 3, "board": 3, "staff": 3,
+    "about": 2, "our-story": 2, "company": 1,
+}
+# Links that mention a keyword but are never the team page
+NON_LEADERSHIP_WORDS = (
+    "career", "job", "blog", "news", "press", "event", "product", "privacy", "terms",
+    "cookie", "login", "cart", "contact", "support", "case-stud", "webinar", "podcast",
+)
+NON_HTML_EXTENSIONS = (".pdf", ".jpg", ".jpeg", ".png", ".gif", ".svg", ".webp", ".zip", ".xml", ".mp4")
+_SITEMAP_LINE_RE = re.compile(r"^\s*sitemap\s*:\s*(\S+)", re.IGNORECASE | re.MULTILINE)
+_LOC_RE = re.compile(r"<loc>\s*(?:<!\[CDATA\[)?\s*(.*?)\s*(?:\]\]>)?\s*</loc>", re.IGNORECASE | re.DOTALL)
+
+
+def _site_host(netloc):
+    return netloc.lower().removeprefix("www.")
+
+
+def score_leadership_link(path, text=""):
+    """Keyword score of a candidate path (plus its anchor text); 0 = skip."""
+    path = path.lower()
+    if path.endswith(NON_HTML_EXTENSIONS):
+        return 0
+    words = re.sub(r"[^a-z0-9]+", "-", f"{path} {text}".lower()).strip("-")
+    if any(word in words for word in NON_LEADERSHIP_WORDS):
+        return 0
+    score = sum(weight for keyword, weight in LEADERSHIP_KEYWORDS.items() if keyword in words)
+    if not score:
+        return 0
+    # Prefer shallow pages: /about/team over /about/team/jane-doe
+    depth = len([segment for segment in path.split("/") if segment])
+    return score - max(depth - 2, 0) * 2
+
+
+def rank_leadership_links(links, origin):
+    """Top same-site paths from (url, anchor text) pairs, best first."""
+    from urllib.parse import urljoin, urlparse
+
+    host = _site_host(urlparse(origin).netloc)
+    scores = {}
+    for href, text in links:
+        if href.startswith(("#", "mailto:", "tel:", "javascript:")):
+            continue
+        parsed = urlparse(urljoin(origin + "/", href))
+        if parsed.scheme not in ("http", "https") or _site_host(parsed.netloc) != host:
+            continue
+        path = parsed.path.rstrip("/")
+        if not path:
+            continue
+        score = score_leadership_link(path, text)
+        if score > 0:
+            scores[path] = max(scores.get(path, 0), score)
+    ranked = sorted(scores, key=lambda path: (-scores[path], len(path)))
+    return ranked[:DISCOVERED_PATHS_MAX]
+
+
+def _homepage_links(origin, max_seconds):
+    with urlopen(origin + "/", headers=FETCH_HEADERS, timeout=5, max_bytes=MAX_HTML_BYTES,
+                 max_seconds=max_seconds, content_types=HTML_TYPES) as resp:
+        return read_links(resp)
 
-    for path in LEADERSHIP_PATHS:
-        if chars_so_far >= max_chars:
+
+def _page_links(page, origin, max_seconds):
+    """Links of the already-fetched prospect page (same site, same nav),
+    else of the homepage."""
+    from urllib.parse import urljoin
+
+    document = page.document()
+    if document is None:
+        return _homepage_links(origin, max_seconds)
+    return [(urljoin(document.url, href), text) for href, text in document.links]
+
+
+def _sitemap_links(origin, max_seconds):
+    """(url, "") pairs from the sitemaps named in robots.txt, else /sitemap.xml."""
+    stop_at = time.monotonic() + max_seconds
+    try:
+        # Half the time at most, so a slow robots.txt leaves some for the fallback
+        with urlopen(origin + "/robots.txt", headers=FETCH_HEADERS, timeout=5, max_bytes=500_000,
+                     max_seconds=max_seconds / 2, content_types=("text",)) as resp:
+            robots = resp.read().decode("utf-8", errors="ignore")
+        queue = _SITEMAP_LINE_RE.findall(robots)
+    except (urllib.error.HTTPError, ResponseRejected, ResponseLimitError, OSError):
+        # No usable robots.txt (wrong type, too slow, reset): try the default
+        queue = []
+    queue = queue or [origin + "/sitemap.xml"]
+
+    links = []
+    for _ in range(MAX_SITEMAPS):
+        remaining = stop_at - time.monotonic()
+        if not queue or remaining <= 0:
             break
-        try:
-            target = origin + path
-            req = urllib.request.Request(target, headers={
-                "User-Agent": "Mozilla/5.0 (compatible; SalesCopilot/2.0)"
-            })
-            with urllib.request.urlopen(req, timeout=5) as resp:
-                # Only process if we got a 200 and it's HTML
-                if resp.status == 200:
-                    ctype = resp.headers.get("Content-Type", "")
-                    if "html" in ctype.lower():
-                        html = resp.read().decode("utf-8", errors="ignore")
-                        text = _strip_html(html)
-                        if len(text) > 100:  # skip near-empty pages
-                            chunk = text[:max_chars - chars_so_far]
-                            combined.append(f"[Page: {path}]\n{chunk}")
-                            chars_so_far += len(chunk)
-        except Exception:
+        with urlopen(queue.pop(0), headers=FETCH_HEADERS, timeout=5, max_bytes=MAX_SITEMAP_BYTES,
+                     max_seconds=remaining, content_types=("xml",)) as resp:
+            xml = resp.read().decode("utf-8", errors="ignore")
+        locs = _LOC_RE.findall(xml)
+        if "<sitemapindex" in xml[:2000].lower():
+            # Child sitemaps for pages come before posts, products, etc.
+            queue += sorted(locs, key=lambda loc: "page" not in loc.lower())
+        else:
+            links += [(loc, "") for loc in locs]
+    return links
+
+
+def discover_leadership_paths(origin, max_seconds=DISCOVERY_SECONDS, page=None):
+    """Rank the site's own links to find its leadership pages.
+
+    Reads the page anchors and the sitemap(s) concurrently; the anchors come
+    from ``page`` (the request's PageFetch) when given, else the homepage.
+    Returns the top DISCOVERED_PATHS_MAX paths ([] if the site has none that
+    match), or None if neither source could be read.
+    """
+    sources = {"homepage": _homepage_links, "sitemap": _sitemap_links}
+    if page is not None:
+        sources["homepage"] = lambda origin, max_seconds: _page_links(page, origin, max_seconds)
+    pool = ThreadPoolExecutor(max_workers=len(sources))
+    futures = {pool.submit(in_context(fn), origin, max_seconds): name for name, fn in sources.items()}
+    links, read_any = [], False
+    try:
+        for future in as_completed(futures, timeout=max_seconds + 1):
+            try:
+                links += future.result()
+                read_any = True
+            except Exception:
+                pass
+    except TimeoutError:
+        pass
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+    return rank_leadership_links(links, origin) if read_any else None
+
+
+def leadership_paths(origin, page=None):
+    """Paths to crawl for leadership pages, best first.
+
+    Discovered paths are persisted per site (LEADERSHIP_CACHE), so only the
+    first request for a site pays for discovery; sites where it finds
+    nothing fall back to the common LEADERSHIP_PATHS.
+    """
+    from urllib.parse import urlparse
+
+    paths = get_or_compute(
+        LEADERSHIP_CACHE,
+        cache_key("paths", _site_host(urlparse(origin).netloc)),
+        lambda: discover_leadership_paths(origin, page=page),
+        fresh_for=LEADERSHIP_FRESH_SECONDS,
+        stale_for=LEADERSHIP_STALE_SECONDS,
+        should_store=lambda paths: paths is not None,
+    )
+    return paths or LEADERSHIP_PATHS
+
+
+def _ordered_leadership_sections(paths, pages, raw_chars):
+    """Collect finished pages in path-priority order until raw_chars is reached.
+
+    Returns (sections, complete): complete is True once the sections are
+    final, i.e. every higher-priority page has finished and enough raw text
+    has been gathered for compaction to choose from.
+    """
+    sections = []
+    chars_so_far = 0
+    complete = True
+    for path in paths:
+        if chars_so_far >= raw_chars:
+            break
+        if path not in pages:
+            complete = False
             continue
+        text = pages[path]
+        if text:
+            sections.append((f"[Page: {path}]", text))
+            chars_so_far += len(text)
+    return sections, complete and chars_so_far >= raw_chars
+
+
+def fetch_leadership_text(base_url, max_chars=4000, deadline=CRAWL_DEADLINE_SECONDS, page=None):
+    """Fetch the site's leadership/about pages concurrently and return combined text.
+
+    The candidate pages come from leadership_paths (discovered from the
+    site's links, else the common paths); discovery on a site's first
+    request counts against the deadline and reuses ``page``, if given.
+    Pages are fetched in parallel (at most CRAWL_MAX_CONCURRENCY at a time)
+    within a global deadline, and outstanding fetches are cancelled once the
+    highest-priority pages hold RAW_TEXT_FACTOR x max_chars of text.
+    The pages are then compacted to max_chars: boilerplate shared between
+    pages is dropped and the most leadership-relevant chunks are kept, still
+    in path-rank order.
+    """
+    from urllib.parse import urlparse, urlunparse
 
-    return "\n\n".join(combined)
+    parsed = urlparse(base_url)
+    origin = urlunparse((parsed.scheme, parsed.netloc, "", "", "", ""))
+    stop_at = time.monotonic() + deadline
+
+    # Skip paths this origin already answered with 404 / non-HTML
+    dead_key = cache_key("dead-paths", origin.lower())
+    dead = set(LEADERSHIP_CACHE.get(dead_key) or [])
+    paths = [path for path in leadership_paths(origin, page) if path not in dead]
+
+    raw_chars = max_chars * RAW_TEXT_FACTOR
+    pool = ThreadPoolExecutor(max_workers=CRAWL_MAX_CONCURRENCY)
+    futures = {
+        pool.submit(in_context(_fetch_leadership_page), origin + path, raw_chars): path
+        for path in paths
+    }
+    pages = {}
+    pending = set(futures)
+    try:
+        while pending:
+            remaining = stop_at - time.monotonic()
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                pages[futures[future]] = future.result()
+            if _ordered_leadership_sections(paths, pages, raw_chars)[1]:
+                break
+    finally:
+        # Don't wait on stragglers; their own socket timeout bounds them
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    newly_dead = {path for path, text in pages.items() if text is None}
+    if newly_dead:
+        LEADERSHIP_CACHE.set(dead_key, sorted(dead | newly_dead), ttl=DEAD_PATH_TTL)
+
+    sections, _ = _ordered_leadership_sections(paths, pages, raw_chars)
+    return compact_sections(sections, max_chars // CHARS_PER_TOKEN) if sections else ""
+
+
+def cached_leadership_text(base_url, page=None):
+    """fetch_leadership_text, cached per origin with stale-while-revalidate."""
+    from urllib.parse import urlparse
+
+    origin = urlparse(base_url).netloc.lower().removeprefix("www.")
+    return get_or_compute(
+        LEADERSHIP_CACHE,
+        cache_key("crawl", origin),
+        lambda: fetch_leadership_text(base_url, page=page),
+        fresh_for=LEADERSHIP_FRESH_SECONDS,
+        stale_for=LEADERSHIP_STALE_SECONDS,
+    )
 
 
 # ---------------------------------------------------------------------------
@@ -158,8 +508,8 @@ def search_leadership_claude(company_name):
         f"Include even partial matches from search result titles."
     )
 
-    payload = json.dumps({
-        "model": "claude-haiku-4-5-20251001",
+    payload = {
+        "model": FAST_MODEL,
         "max_tokens": 1024,
         "tools": [
             {
@@ -169,26 +519,16 @@ def search_leadership_claude(company_name):
             }
         ],
         "messages": [{"role": "user", "content": prompt}],
-    }).encode()
-
-    req = urllib.request.Request(
-        ANTHROPIC_API_URL,
-        data=payload,
-        headers={
-            "Content-Type": "application/json",
-            "x-api-key": api_key,
-            "anthropic-version": ANTHROPIC_VERSION,
-        },
-        method="POST",
-    )
+    }
 
     try:
-        with urllib.request.urlopen(req, timeout=55) as resp:
-            data = json.loads(resp.read().decode())
+        data = post_messages(payload, timeout=55)
 
-        # Debug: return raw response structure
         stop_reason = data.get("stop_reason", "unknown")
         block_types = [b.get("type", "?") for b in data.get("content", [])]
+        trace = current()
+        if trace is not None:
+            trace.note("search", {"stop_reason": stop_reason, "block_types": block_types})
 
         # Extract all text blocks and search result snippets
         texts = []
@@ -215,6 +555,18 @@ def search_leadership_claude(company_name):
         return ""
 
 
+def cached_leadership_search(company_name):
+    """search_leadership_claude, cached per company name (stale-while-revalidate)."""
+    return get_or_compute(
+        LEADERSHIP_CACHE,
+        cache_key("search", normalize_text(company_name).lower()),
+        lambda: search_leadership_claude(company_name),
+        fresh_for=LEADERSHIP_FRESH_SECONDS,
+        stale_for=LEADERSHIP_STALE_SECONDS,
+        should_store=lambda text: bool(text) and not text.startswith("(no_text_found"),
+    )
+
+
 # ---------------------------------------------------------------------------
 # Case study knowledge base — real metrics for credibility statements
 # ---------------------------------------------------------------------------
@@ -279,29 +631,10 @@ SYSTEM_PROMPT = (
 )
 
 
-def build_analyze_prompt(url, page_text, company, attempt=0, leadership_text=""):
-    company_context = ""
-    if company and company.get("name"):
-        company_context = f"""
-Seller Context:
-  Company: {company['name']}
-  What they do: {company.get('description', 'N/A')}
-  Target Industries: {company.get('target_industries', 'N/A')}
-"""
-
-    # Vary the angle on each regeneration to avoid repeating the same message
-    angle_instructions = ""
-    if attempt > 0:
-        angles = [
-            "Focus on a DIFFERENT observation than before. Try a hiring signal or team growth angle.",
-            "Focus on a DIFFERENT observation than before. Try a competitive landscape or market timing angle.",
-            "Focus on a DIFFERENT observation than before. Try a technology stack or product launch angle.",
-            "Focus on a DIFFERENT observation than before. Try a leadership change or company milestone angle.",
-            "Focus on a DIFFERENT observation than before. Try an industry trend or customer pain angle.",
-        ]
-        angle_instructions = f"\nIMPORTANT: {angles[attempt % len(angles)]}\n"
-
-    return f"""Analyze this web page and return a JSON object with exactly these keys:
+# The instructions, schema and case studies never change between requests, so
+# they go in the system prompt behind a prompt-caching breakpoint; only the
+# per-request material (URL, page text, research, angle) goes in the message.
+ANALYZE_INSTRUCTIONS = f"""Analyze the web page in the user message and return a JSON object with exactly these keys:
 
 {{
   "overview": "1 sentence: who is this company/person and what do they do",
@@ -369,64 +702,519 @@ STRICT RULES FOR THE OUTREACH (THESE ARE HARD LIMITS):
 - Be specific. Reference real details from the page.
 - The credibility sentence MUST reference a real case study company and metric from the list above. Pick the one closest to the prospect's industry, size, or pain point.
 - Shorter is ALWAYS better. Every word must earn its place.
-{angle_instructions}
 RULES FOR OTHER FIELDS:
 - "overview" should be 1 concise sentence
 - "tags" should be 2-4 short labels (e.g., "SaaS", "Series B", "Hiring", "Enterprise")
 - "insights" should be 2-4 bullets of sales intelligence (funding, growth, hiring, tech stack, news, leadership)
-- Return ONLY the JSON object, nothing else
+- Return ONLY the JSON object, nothing else"""
+
+
+def build_analyze_system():
+    """System blocks for analyze calls; the static prefix is marked cacheable."""
+    return [
+        {"type": "text", "text": SYSTEM_PROMPT},
+        {"type": "text", "text": ANALYZE_INSTRUCTIONS, "cache_control": {"type": "ephemeral"}},
+    ]
+
+
+def _seller_context(company):
+    if not (company and company.get("name")):
+        return ""
+    return f"""
+Seller Context:
+  Company: {company['name']}
+  What they do: {company.get('description', 'N/A')}
+  Target Industries: {company.get('target_industries', 'N/A')}
+"""
+
+
+def _angle_instructions(attempt):
+    """Vary the angle on each regeneration to avoid repeating the same message."""
+    if attempt <= 0:
+        return ""
+    angles = [
+        "Focus on a DIFFERENT observation than before. Try a hiring signal or team growth angle.",
+        "Focus on a DIFFERENT observation than before. Try a competitive landscape or market timing angle.",
+        "Focus on a DIFFERENT observation than before. Try a technology stack or product launch angle.",
+        "Focus on a DIFFERENT observation than before. Try a leadership change or company milestone angle.",
+        "Focus on a DIFFERENT observation than before. Try an industry trend or customer pain angle.",
+    ]
+    return f"IMPORTANT: {angles[attempt % len(angles)]}\n\n"
+
 
-URL: {url}
+def leadership_block(leadership_text):
+    """The research as the prompt carries it.
+
+    When _contacts finds candidate contacts, the model gets their compact
+    table plus a short excerpt of the research to verify them against,
+    instead of the full research budget.
+    """
+    contacts = extract_contacts(leadership_text)
+    if not contacts:
+        return compact_text(leadership_text, LEADERSHIP_TEXT_TOKENS)
+    return f"""Candidate key contacts (pre-extracted from the research; verify them against it, drop wrong ones, add any missed):
+{format_candidates(contacts)}
+
+Research excerpt:
+{compact_text(leadership_text, LEADERSHIP_EXCERPT_TOKENS)}"""
+
+
+def build_analyze_prompt(url, page_text, company, attempt=0, leadership_text=""):
+    """Build the per-request user message that follows ANALYZE_INSTRUCTIONS."""
+    company_context = _seller_context(company)
+    angle_instructions = _angle_instructions(attempt)
+
+    return f"""{angle_instructions}URL: {url}
 
 Page Content:
-{page_text[:MAX_PAGE_TEXT_CHARS]}
+{compact_text(page_text, PAGE_TEXT_TOKENS)}
 {f"""
 Leadership Research (crawled from company website, LinkedIn, and web search — use this to find executive contacts):
-{leadership_text[:6000]}
+{leadership_block(leadership_text)}
 """ if leadership_text else ""}
 {company_context}"""
 
 
-def analyze_page(url, page_text, company, attempt=0, leadership_text=""):
-    """Call Claude and parse the structured JSON response."""
-    prompt = build_analyze_prompt(url, page_text, company, attempt, leadership_text)
-    raw = call_claude(SYSTEM_PROMPT, prompt, max_tokens=1500)
-
-    # Strip ```json ... ``` markers if present
+def _strip_fences(raw):
+    """Strip ```json ... ``` markers if present."""
     cleaned = raw.strip()
     if cleaned.startswith("```"):
         cleaned = re.sub(r"^```(?:json)?\s*", "", cleaned)
         cleaned = re.sub(r"\s*```$", "", cleaned)
+    return cleaned
 
-    try:
-        result = json.loads(cleaned)
-    except json.JSONDecodeError:
-        result = {
-            "overview": cleaned[:300],
-            "insights": [],
-            "tags": [],
-            "outreach": {
-                "observation": "",
-                "problem": "",
-                "credibility": "",
-                "solution": "",
-                "ctc": "",
-            },
-        }
+
+OUTREACH_PARTS = ("observation", "problem", "credibility", "solution", "ctc")
+ANALYSIS_DEFAULTS = {
+    "overview": "",
+    "tags": [],
+    "insights": [],
+    "key_contacts": [],
+    "pre_meeting_brief": {},
+    "outreach": {part: "" for part in OUTREACH_PARTS},
+}
+
+
+def _valid_field(key, value):
+    """Schema check for one top-level analysis field."""
+    if key == "key_contacts":
+        return isinstance(value, list) and all(isinstance(c, dict) and c.get("name") for c in value)
+    if key == "outreach":
+        return isinstance(value, dict) and all(isinstance(value.get(p), str) for p in OUTREACH_PARTS)
+    return isinstance(value, type(ANALYSIS_DEFAULTS[key]))
+
+
+def missing_fields(fields):
+    """Analysis keys that are absent or don't match the expected schema."""
+    return [key for key in ANALYSIS_DEFAULTS if key not in fields or not _valid_field(key, fields[key])]
+
+
+def parse_analysis(raw):
+    """Parse Claude's reply into the analysis dict, tolerating stray output.
+
+    Every complete field is recovered from prose-wrapped or truncated
+    replies. Fields still missing or malformed get empty defaults and are
+    listed under "incomplete".
+    """
+    fields, _ = recover_object(raw, [*ANALYSIS_DEFAULTS, "outreach_line"])
 
     # Ensure outreach is structured (handle old-format responses gracefully)
-    if "outreach_line" in result and "outreach" not in result:
-        result["outreach"] = {
-            "observation": result.pop("outreach_line", ""),
-            "problem": "",
-            "credibility": "",
-            "solution": "",
-            "ctc": "",
-        }
+    if "outreach_line" in fields and "outreach" not in fields:
+        fields["outreach"] = dict(ANALYSIS_DEFAULTS["outreach"], observation=fields.pop("outreach_line") or "")
+
+    missing = missing_fields(fields)
+    result = dict(fields)
+    for key in missing:
+        result[key] = copy.deepcopy(ANALYSIS_DEFAULTS[key])
+    if missing:
+        if not fields:
+            result["overview"] = _strip_fences(raw)[:300]  # prose-only reply
+        result["incomplete"] = missing
+    return result
+
+
+REPAIR_REQUEST = (
+    "Your reply was cut off or didn't match the format. Return ONLY a JSON object with "
+    "these keys, filled in exactly as the instructions specify: {keys}"
+)
+
+
+def complete_analysis(prompt, raw, analysis, max_tokens, deadline=None):
+    """Re-request only the fields listed in analysis["incomplete"].
 
+    The follow-up continues the original conversation on the large model,
+    so the cached instructions and the page content are reused. Fields it
+    still can't supply stay at their defaults; a failed follow-up leaves the
+    analysis as it was.
+    """
+    missing = analysis["incomplete"]
+    history = [
+        {"role": "user", "content": prompt},
+        {"role": "assistant", "content": raw.strip() or "{}"},
+    ]
+    try:
+        reply = call_claude(build_analyze_system(), REPAIR_REQUEST.format(keys=", ".join(missing)),
+                            max_tokens, LARGE_MODEL, deadline, history)
+    except Exception:
+        return analysis
+    fixed, _ = recover_object(reply, missing)
+
+    result = dict(analysis)
+    repaired = [key for key in missing if key in fixed and _valid_field(key, fixed[key])]
+    for key in repaired:
+        result[key] = fixed[key]
+    still_missing = [key for key in missing if key not in repaired]
+    if still_missing:
+        result["incomplete"] = still_missing
+    else:
+        result.pop("incomplete")
+    result["repaired"] = {"model": LARGE_MODEL, "fields": repaired}
+    return result
+
+
+def with_local_contacts(analysis, leadership_text):
+    """Fill key_contacts from _contacts when the model didn't supply them."""
+    if "key_contacts" not in analysis.get("incomplete", ()):
+        return analysis
+    contacts = extract_contacts(leadership_text)
+    if not contacts:
+        return analysis
+    result = dict(analysis, key_contacts=fallback_contacts(contacts))
+    result["incomplete"] = [key for key in analysis["incomplete"] if key != "key_contacts"]
+    if not result["incomplete"]:
+        result.pop("incomplete")
     return result
 
 
+def local_analysis(leadership_text, error):
+    """Analysis holding only the locally extracted contacts, for when the
+    Claude call failed; None if the research names nobody."""
+    contacts = extract_contacts(leadership_text)
+    if not contacts:
+        return None
+    analysis = copy.deepcopy(ANALYSIS_DEFAULTS)
+    analysis["key_contacts"] = fallback_contacts(contacts)
+    analysis["incomplete"] = [key for key in ANALYSIS_DEFAULTS if key != "key_contacts"]
+    analysis["error"] = f"{type(error).__name__}: {error}"
+    return analysis
+
+
+def route_analysis(leadership_text, latency_budget=None):
+    """(model, max_tokens) for an analysis backed by this much research."""
+    research_tokens = estimate_tokens(leadership_text) if leadership_text else 0
+    return choose_model("analyze", research_tokens, latency_budget)
+
+
+def analyze_page(url, page_text, company, attempt=0, leadership_text="", latency_budget=None):
+    """Call Claude and parse the structured JSON response.
+
+    The model is routed per request (see _routing.py) and reported in the
+    "model" field. Fields the reply is missing (fast model or not) are
+    re-requested once from the large model; see complete_analysis. Key
+    contacts still missing, or the whole reply if the call fails, fall
+    back to the contacts _contacts finds in the research (the result is
+    then "incomplete" and never cached). Admission rejections still raise.
+    """
+    prompt = build_analyze_prompt(url, page_text, company, attempt, leadership_text)
+    model, max_tokens = route_analysis(leadership_text, latency_budget)
+    deadline = time.monotonic() + latency_budget if latency_budget is not None else None
+    try:
+        with span("claude"):
+            raw = call_claude(build_analyze_system(), prompt, max_tokens, model, deadline)
+    except AdmissionRejected:
+        raise
+    except Exception as e:
+        analysis = local_analysis(leadership_text, e)
+        if analysis is None:
+            raise
+        return dict(analysis, model=None)
+    analysis = parse_analysis(raw)
+    if analysis.get("incomplete"):
+        with span("claude-repair"):
+            analysis = complete_analysis(prompt, raw, analysis, max_tokens, deadline)
+    return dict(with_local_contacts(analysis, leadership_text), model=model)
+
+
+def analyze_page_stream(url, page_text, company, attempt=0, leadership_text="", latency_budget=None):
+    """Streaming analyze_page.
+
+    Yields ("delta", text) pieces and, as each top-level field of the reply
+    completes, ("field", (key, value)); then ("result", dict). Fields
+    filled in by complete_analysis or from the local contacts (as in
+    analyze_page) are yielded as "field" before the result.
+    """
+    prompt = build_analyze_prompt(url, page_text, company, attempt, leadership_text)
+    model, max_tokens = route_analysis(leadership_text, latency_budget)
+    deadline = time.monotonic() + latency_budget if latency_budget is not None else None
+    parser = ObjectStreamParser()
+    parts = []
+    try:
+        with span("claude"):
+            for text in stream_claude(build_analyze_system(), prompt, max_tokens, model, deadline):
+                parts.append(text)
+                yield "delta", text
+                for field in parser.feed(text):
+                    yield "field", field
+    except AdmissionRejected:
+        raise
+    except Exception as e:
+        analysis = local_analysis(leadership_text, e)
+        if analysis is None:
+            raise
+        yield "field", ("key_contacts", analysis["key_contacts"])
+        yield "result", dict(analysis, model=None)
+        return
+    raw = "".join(parts)
+    analysis = parse_analysis(raw)
+    filled = []
+    if analysis.get("incomplete"):
+        with span("claude-repair"):
+            analysis = complete_analysis(prompt, raw, analysis, max_tokens, deadline)
+        filled = analysis.get("repaired", {}).get("fields", [])
+    completed = with_local_contacts(analysis, leadership_text)
+    if completed is not analysis:
+        filled = [*filled, "key_contacts"]
+    for key in filled:
+        yield "field", (key, completed[key])
+    yield "result", dict(completed, model=model)
+
+
+# ---------------------------------------------------------------------------
+# Analysis result cache — repeat analyses of the same page skip all work
+# ---------------------------------------------------------------------------
+
+ANALYSIS_CACHE_TTL = int(os.environ.get("ANALYSIS_CACHE_TTL", "21600"))  # 6 hours
+ANALYSIS_CACHE = cache_from_env("analysis", max_entries=256, ttl=ANALYSIS_CACHE_TTL)
+# Complete analyses are also kept, far longer, in the prospect store
+PROSPECTS = prospect_store_from_env()
+
+
+def cache_analysis(key, analysis):
+    """Store an analysis unless some of its fields couldn't be recovered."""
+    if not analysis.get("incomplete"):
+        ANALYSIS_CACHE.set(key, analysis)
+
+
+def seller_fields(company):
+    """The seller details that feed the prompt."""
+    company = company or {}
+    return [company.get(k, "") for k in ("name", "description", "target_industries")]
+
+
+def seller_key(company):
+    """Key the prospect store files a seller's analyses under."""
+    return cache_key("seller", seller_fields(company))
+
+
+def page_key(page_text):
+    """Key the prospect store files an analysis of client-sent ``page_text``
+    under; "" when the server fetched the page itself."""
+    page_text = normalize_text(page_text)
+    return cache_key("page", page_text) if page_text else ""
+
+
+def analysis_cache_key(url, page_text, company, attempt):
+    """Key an analysis on everything that feeds the prompt from the request."""
+    return cache_key("analysis", normalize_url(url), normalize_text(page_text), seller_fields(company), attempt)
+
+
+def use_prospects(url, operation, *args):
+    """PROSPECTS.<operation>(url, *args). A store failure is logged and
+    returns None, so it never fails the analysis."""
+    try:
+        return getattr(PROSPECTS, operation)(url, *args)
+    except Exception as e:
+        print(json.dumps({"event": "prospect_store_error", "operation": operation, "url": url,
+                          "error": str(e)}), flush=True)
+        return None
+
+
+def save_analysis(key, url, company, attempt, analysis, prospect_name="", page=""):
+    """cache_analysis, and record a complete analysis in the prospect store
+    (under ``prospect_name`` if known; the stored name is kept otherwise).
+    ``page`` is the page_key of the text the client sent."""
+    cache_analysis(key, analysis)
+    if not analysis.get("incomplete"):
+        use_prospects(url, "record_analysis", prospect_name, seller_key(company), attempt, analysis, page)
+
+
+def stored_analysis(url, company, page="", fresh=True):
+    """(analysis, analyzed_at) from the prospect store for this page, page
+    text key and seller, only a recent one when ``fresh``; else None."""
+    return use_prospects(url, "fresh_analysis" if fresh else "latest_analysis", seller_key(company), page)
+
+
+# ---------------------------------------------------------------------------
+# Regenerate — a new outreach angle on top of the previous analysis
+# ---------------------------------------------------------------------------
+
+# What the outreach rewrite sees in place of the page and the research
+OUTREACH_CONTEXT_FIELDS = ("overview", "tags", "insights", "key_contacts", "pre_meeting_brief")
+
+
+def previous_analysis(url, page_text, company, attempt):
+    """The cached analysis of this page and seller from an earlier attempt.
+
+    Tries the attempt just before, then the original (attempt 0), then the
+    latest one in the prospect store.
+    """
+    for earlier in dict.fromkeys((attempt - 1, 0)):
+        if earlier < 0:
+            continue
+        found = ANALYSIS_CACHE.get(analysis_cache_key(url, page_text, company, earlier))
+        if found is not None:
+            return found
+    stored = stored_analysis(url, company, page_key(page_text), fresh=False)
+    return stored[0] if stored is not None else None
+
+
+def build_outreach_prompt(previous, company, attempt):
+    """User message asking only for a new "outreach" object."""
+    context = {key: previous.get(key) for key in OUTREACH_CONTEXT_FIELDS}
+    return f"""{_angle_instructions(attempt)}You already analyzed this page. Your analysis (use it as the research for the outreach):
+{json.dumps(context, ensure_ascii=False)}
+
+The outreach you wrote last time (write a different one):
+{json.dumps(previous.get("outreach", {}), ensure_ascii=False)}
+{_seller_context(company)}
+Return ONLY a JSON object with one key, "outreach", holding the five parts exactly as the instructions specify."""
+
+
+def regenerate_outreach(previous, company, attempt, latency_budget=None):
+    """Rewrite only the outreach of ``previous`` for a new angle.
+
+    Reuses the cached system prompt, sends the earlier analysis instead of
+    the page and research, and asks for a few hundred output tokens instead
+    of a whole analysis. Returns the updated analysis, or None if the reply
+    had no valid outreach (the caller then runs a full analysis).
+    """
+    prompt = build_outreach_prompt(previous, company, attempt)
+    model, max_tokens = choose_model("outreach", estimate_tokens(prompt), latency_budget)
+    deadline = time.monotonic() + latency_budget if latency_budget is not None else None
+    with span("claude-outreach"):
+        raw = call_claude(build_analyze_system(), prompt, max_tokens, model, deadline)
+    outreach = recover_object(raw, ("outreach",))[0].get("outreach")
+    if not _valid_field("outreach", outreach):
+        return None
+    analysis = {key: value for key, value in previous.items() if key != "repaired"}
+    return dict(analysis, outreach=outreach, model=model, regenerated="outreach")
+
+
+# ---------------------------------------------------------------------------
+# Research stages — page fetch, crawl and web search run concurrently
+# ---------------------------------------------------------------------------
+
+REQUEST_DEADLINE_SECONDS = 58  # just under the function's maxDuration
+RESEARCH_DEADLINE_SECONDS = 35  # leaves room for analyze_page within maxDuration
+PAGE_STAGE_SECONDS = 12
+SEARCH_STAGE_SECONDS = 35
+
+
+def _clean_name(name):
+    return " ".join(re.sub(r"[™®©]", "", name).split())
+
+
+def derive_company_name(url, document=None):
+    """Guess the company name for the web search.
+
+    Uses the fetched page's JSON-LD Organization name or og:site_name,
+    then a short segment of its <title>, else the domain.
+    """
+    from urllib.parse import urlparse
+
+    if document is not None:
+        for name in (document.organization_name, document.site_name):
+            name = _clean_name(name)
+            if name and len(name) <= 60:
+                return name
+
+    domain = urlparse(url).netloc.replace("www.", "").split(".")[0]
+    if "-" in domain:
+        return "-".join(w.capitalize() for w in domain.split("-"))
+
+    if document is not None and document.title:
+        # Split on common separators
+        for p in re.split(r'\s*[|–—]\s*|\s+-\s+', document.title):
+            p = _clean_name(p)
+            if 1 <= len(p.split()) <= 4 and len(p) <= 35:
+                return p
+    return domain.capitalize()
+
+
+def leadership_stages(url, prospect_name="", page=None):
+    """The crawl and web-search stages for run_stages, shared per company.
+
+    ``page`` is the request's PageFetch of ``url``; the search takes the
+    company name from it and the crawl reuses its links.
+    """
+    page = page or PageFetch(url)
+    return {
+        "crawl": (lambda: cached_leadership_text(url, page), CRAWL_DEADLINE_SECONDS + 1, ""),
+        "search": (
+            lambda: cached_leadership_search(prospect_name or derive_company_name(url, page.document())),
+            SEARCH_STAGE_SECONDS,
+            "",
+        ),
+    }
+
+
+def run_stages(stages, deadline, on_result=None):
+    """Run independent I/O stages concurrently and return {name: result}.
+
+    ``stages`` maps a name to ``(fn, timeout, default)``. Each stage is given
+    the smaller of its own timeout and the time left before ``deadline``
+    (a ``time.monotonic()`` value); a stage that overruns or raises yields its
+    default, so the caller always gets a result for every stage. If given,
+    ``on_result(name, ok)`` is called from this thread as each stage settles.
+    """
+    started = time.monotonic()
+    pool = ThreadPoolExecutor(max_workers=max(len(stages), 1))
+    futures = {pool.submit(in_context(traced(name, fn))): name for name, (fn, _, _) in stages.items()}
+    cutoffs = {name: min(started + timeout, deadline) for name, (_, timeout, _) in stages.items()}
+    results = {}
+
+    def settle(name, result, ok):
+        results[name] = result
+        if on_result:
+            on_result(name, ok)
+
+    pending = set(futures)
+    try:
+        while pending:
+            next_cutoff = min(cutoffs[futures[f]] for f in pending)
+            done, pending = wait(
+                pending,
+                timeout=max(next_cutoff - time.monotonic(), 0),
+                return_when=FIRST_COMPLETED,
+            )
+            for future in done:
+                name = futures[future]
+                try:
+                    settle(name, future.result(), True)
+                except Exception:
+                    settle(name, stages[name][2], False)
+            now = time.monotonic()
+            for future in [f for f in pending if cutoffs[futures[f]] <= now]:
+                pending.discard(future)
+                settle(futures[future], stages[futures[future]][2], False)
+                trace = current()
+                if trace is not None:
+                    trace.incr("stage_timeouts")
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+    return {name: results[name] for name in stages}
+
+
+def combine_leadership(leadership_text, claude_search):
+    """Merge crawled pages and web search output into one research block."""
+    all_leadership_parts = []
+    if leadership_text:
+        all_leadership_parts.append(f"[Website Pages]\n{leadership_text}")
+    if claude_search:
+        all_leadership_parts.append(f"[Web Search Results]\n{claude_search}")
+    return "\n\n".join(all_leadership_parts)
+
+
 # ---------------------------------------------------------------------------
 # HTTP handler
 # ---------------------------------------------------------------------------
@@ -438,6 +1226,16 @@ class handler(BaseHTTPRequestHandler):
         self.end_headers()
 
     def do_POST(self):
+        with tracing("analyze", wanted(self.headers)) as trace, client(client_id(self)):
+            try:
+                self._handle_post()
+            finally:
+                if trace is not None:
+                    trace.emit()
+
+    def _handle_post(self):
+        started = time.monotonic()
+        streaming = False  # once the event stream has started, errors go out as events
         try:
             content_length = int(self.headers.get("Content-Length", 0))
             if content_length > MAX_BODY_BYTES:
@@ -451,66 +1249,133 @@ class handler(BaseHTTPRequestHandler):
             if not url:
                 return send_json(self, 400, {"message": "No URL provided"})
 
+            attempt = body.get("attempt", 0)
+            stream = wants_event_stream(self, body)
+
+            # Repeat analyses of the same page/seller/angle come from cache
+            key = analysis_cache_key(url, page_text, company, attempt)
+            cached = ANALYSIS_CACHE.get(key)
+            if cached is not None:
+                payload = {"status": "success", "analysis": cached, "url": url}
+                if stream:
+                    start_event_stream(self, {"X-Cache": "HIT"})
+                    streaming = True
+                    return send_event(self, "result", payload)
+                return send_json(self, 200, payload, {"X-Cache": "HIT"})
+
+            # A recent stored analysis of this page and text for this seller skips the research
+            prospect_name = body.get("prospect_name", "").strip()
+            text_key = page_key(page_text)
+            if not attempt and not body.get("refresh"):
+                stored = stored_analysis(url, company, text_key)
+                if stored is not None:
+                    payload = {"status": "success", "analysis": stored[0], "url": url, "analyzed_at": stored[1]}
+                    if stream:
+                        start_event_stream(self, {"X-Cache": "STORE"})
+                        streaming = True
+                        return send_event(self, "result", payload)
+                    return send_json(self, 200, payload, {"X-Cache": "STORE"})
+
+            # Regenerate: keep the earlier analysis and rewrite only its outreach
+            previous = None
+            if attempt and body.get("regenerate") != "full":
+                previous = previous_analysis(url, page_text, company, attempt)
+            if previous is not None:
+                latency_budget = started + REQUEST_DEADLINE_SECONDS - time.monotonic()
+                analysis = regenerate_outreach(previous, company, attempt, latency_budget)
+                if analysis is not None:
+                    save_analysis(key, url, company, attempt, analysis, prospect_name, text_key)
+                    payload = {"status": "success", "analysis": analysis, "url": url}
+                    if not stream:
+                        return send_json(self, 200, payload, {"X-Cache": "MISS"})
+                    start_event_stream(self, {"X-Cache": "MISS"})
+                    streaming = True
+                    send_event(self, "field", {"key": "outreach", "value": analysis["outreach"]})
+                    return send_event(self, "result", payload)
+
+            # Page fetch, crawl and web search run side by side. The page is
+            # downloaded once (PageFetch): the search waits on it for the
+            # company name, and a first crawl of the site for its links.
+            page = PageFetch(url)
+            stages = leadership_stages(url, prospect_name, page)
             # Prefer client-supplied page text; fall back to server fetch
             if not page_text:
-                page_text = fetch_page_text(url)
+                stages["page"] = (lambda: document_text(page.document()), PAGE_STAGE_SECONDS, "")
+
+            # Opt-in streaming: progress per stage, then tokens, then the result
+            if stream:
+                start_event_stream(self, {"X-Cache": "MISS"})
+                streaming = True
+
+            def report_stage(name, ok):
+                send_event(self, "progress", {"stage": name, "status": "done" if ok else "skipped"})
+
+            research = run_stages(
+                stages,
+                time.monotonic() + RESEARCH_DEADLINE_SECONDS,
+                report_stage if stream else None,
+            )
+
+            page_text = page_text or research.get("page", "")
             if not page_text:
                 page_text = "(Could not fetch page content; analyze based on URL alone)"
 
-            # Use client-extracted company name if available, else derive from domain
-            company_name = body.get("prospect_name", "").strip()
-            if not company_name:
-                from urllib.parse import urlparse
-                parsed_domain = urlparse(url)
-                domain = parsed_domain.netloc.replace("www.", "").split(".")[0]
-                if "-" in domain:
-                    company_name = "-".join(
-                        w.capitalize() for w in domain.split("-")
-                    )
-                else:
-                    company_name = domain.capitalize()
-                    # Try to extract a better name from page title tag
-                    try:
-                        html_req = urllib.request.Request(url, headers={
-                            "User-Agent": "Mozilla/5.0 (compatible; SalesCopilot/2.0)"
-                        })
-                        with urllib.request.urlopen(html_req, timeout=5) as resp:
-                            raw_html = resp.read().decode("utf-8", errors="ignore")[:5000]
-                        title_match = re.search(r"<title[^>]*>(.*?)</title>", raw_html, re.IGNORECASE | re.DOTALL)
-                        if title_match:
-                            title_text = title_match.group(1).strip()
-                            # Split on common separators
-                            parts = re.split(r'\s*[|–—]\s*|\s+-\s+', title_text)
-                            for p in parts:
-                                p = re.sub(r'[™®©]', '', p).strip()
-                                words = p.split()
-                                if 1 <= len(words) <= 4 and len(p) <= 35:
-                                    company_name = p
-                                    break
-                    except Exception:
-                        pass
-
-            # Fetch leadership/about pages from the company website
-            leadership_text = fetch_leadership_text(url)
-
-            # Use Claude web search to find leadership (reliable, no blocking)
-            claude_search = search_leadership_claude(company_name)
-
-            # Combine all leadership intel
-            all_leadership_parts = []
-            if leadership_text:
-                all_leadership_parts.append(f"[Website Pages]\n{leadership_text}")
-            if claude_search:
-                all_leadership_parts.append(f"[Web Search Results]\n{claude_search}")
-            all_leadership = "\n\n".join(all_leadership_parts)
-
-            attempt = body.get("attempt", 0)
-            analysis = analyze_page(url, page_text, company, attempt, all_leadership)
-            send_json(self, 200, {"status": "success", "analysis": analysis, "url": url})
+            all_leadership = combine_leadership(research["crawl"], research["search"])
+            if research["crawl"]:
+                use_prospects(url, "record_crawl", research["crawl"])
+            prospect_name = prospect_name or derive_company_name(url, page.peek())
+
+            # Whatever the research left of the request's time bounds the model choice
+            latency_budget = started + REQUEST_DEADLINE_SECONDS - time.monotonic()
+            if stream:
+                return self._stream_analysis(url, page_text, company, attempt, all_leadership, key,
+                                             latency_budget, prospect_name, text_key)
+            analysis = analyze_page(url, page_text, company, attempt, all_leadership, latency_budget)
+            save_analysis(key, url, company, attempt, analysis, prospect_name, text_key)
+            send_json(self, 200, {"status": "success", "analysis": analysis, "url": url}, {"X-Cache": "MISS"})
+
+        except AdmissionRejected as e:
+            self._send_error(streaming, 429, {"message": "Token budget exceeded; try again shortly",
+                                              "retry_after": int(e.headers["Retry-After"])},
+                             {"Retry-After": e.headers["Retry-After"]})
 
         except urllib.error.HTTPError as e:
             error_body = e.read().decode() if e.readable() else str(e)
-            send_json(self, 502, {"message": f"Claude API error ({e.code}): {error_body}"})
+            self._send_error(streaming, 502, {"message": f"Claude API error ({e.code}): {error_body}"})
 
         except Exception as e:
-            send_json(self, 500, {"message": f"Internal error: {type(e).__name__}: {str(e)}"})
+            self._send_error(streaming, 500, {"message": f"Internal error: {type(e).__name__}: {str(e)}"})
+
+    def _send_error(self, streaming, status, data, headers=None):
+        """Report a failure as a JSON response, or as an "error" event once
+        the event stream's headers have gone out."""
+        if streaming:
+            send_event(self, "error", data)
+        else:
+            send_json(self, status, data, headers)
+
+    def _stream_analysis(self, url, page_text, company, attempt, leadership_text, key, latency_budget=None,
+                         prospect_name="", text_key=""):
+        """Send the analysis as SSE: "delta" text and "field" events, then one "result"."""
+        try:
+            for kind, value in analyze_page_stream(url, page_text, company, attempt, leadership_text,
+                                                   latency_budget):
+                if kind == "delta":
+                    send_event(self, "delta", {"text": value})
+                elif kind == "field":
+                    send_event(self, "field", {"key": value[0], "value": value[1]})
+                else:
+                    save_analysis(key, url, company, attempt, value, prospect_name, text_key)
+                    send_event(self, "result", {"status": "success", "analysis": value, "url": url})
+                    trace = current()
+                    if trace is not None:
+                        # Headers went out before the work; send the timings last
+                        send_event(self, "trace", trace.to_dict())
+        except AdmissionRejected as e:
+            send_event(self, "error", {"message": "Token budget exceeded; try again shortly",
+                                       "retry_after": int(e.headers["Retry-After"])})
+        except urllib.error.HTTPError as e:
+            error_body = e.read().decode() if e.readable() else str(e)
+            send_event(self, "error", {"message": f"Claude API error ({e.code}): {error_body}"})
+        except Exception as e:
+            send_event(self, "error", {"message": f"Internal error: {type(e).__name__}: {str(e)}"})
@@ -0,0 +1,387 @@
+"""
+Serverless API endpoint for analyzing a list of prospect URLs in one request
+(e.g. a CRM export). Runs the same page fetch / crawl / web search / analyze
+pipeline as /api/analyze for every URL, so results match the single-URL path.
+
+URLs on the same domain share one round of leadership research. Results are
+streamed back as NDJSON: one line per URL in completion order, then a final
+summary line. The whole run is bounded by BATCH_DEADLINE_SECONDS, inside
+the function's maxDuration: URLs not analyzed by then are reported as
+errors (resubmit them, or use "mode": "batch"), and the summary line is
+always sent.
+
+Environment variables required:
+  ANTHROPIC_API_KEY - Your Anthropic API key
+
+Optional tuning:
+  BATCH_CONCURRENCY        - URLs (and companies researched) in parallel (default 6)
+  BATCH_DEADLINE_SECONDS   - Time allowed for a streamed run (default 270)
+  JOB_RESEARCH_SECONDS     - Time "mode": "batch" gathers pages and research (default 25)
+  JOB_RESEARCH_CONCURRENCY - URLs gathered in parallel for a job (default 12)
+
+Send "mode": "batch" to submit the analyses as a Message Batches job
+instead (cheaper, for overnight runs): the response is 202 with a job_id to
+read back from /api/jobs. See _jobs.py for the job store. The pages and
+research are gathered first, for at most JOB_RESEARCH_SECONDS; URLs not
+ready by then are submitted with what the request sent, and their results
+say "researched": false.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import urlparse
+import urllib.error
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _admission import AdmissionRejected, client, client_id  # noqa: E402
+from _jobs import JobStoreUnavailable, store_from_env, submit_job  # noqa: E402
+from _trace import in_context  # noqa: E402
+from analyze import (  # noqa: E402
+    ANALYSIS_CACHE,
+    RESEARCH_DEADLINE_SECONDS,
+    PageFetch,
+    add_cors_headers,
+    analysis_cache_key,
+    analyze_page,
+    build_analyze_prompt,
+    build_analyze_system,
+    combine_leadership,
+    document_text,
+    leadership_stages,
+    page_key,
+    parse_analysis,
+    route_analysis,
+    run_stages,
+    save_analysis,
+    send_json,
+)
+
+MAX_URLS = 200
+MAX_BODY_BYTES = 2_000_000
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", "6"))
+# maxDuration is 300s; leave time to write the last lines
+BATCH_DEADLINE_SECONDS = float(os.environ.get("BATCH_DEADLINE_SECONDS", "270"))
+MIN_ANALYZE_SECONDS = 20  # don't start a URL with less time than this left
+TIME_LIMIT_MESSAGE = "Not analyzed within the request's time limit; resubmit it or use \"mode\": \"batch\""
+JOB_RESEARCH_SECONDS = float(os.environ.get("JOB_RESEARCH_SECONDS", "25"))
+JOB_RESEARCH_CONCURRENCY = int(os.environ.get("JOB_RESEARCH_CONCURRENCY", "12"))
+NO_PAGE_TEXT = "(Could not fetch page content; analyze based on URL alone)"
+
+
+def company_domain(url):
+    """Domain used to merge URLs of the same company (no www., lower-case)."""
+    return urlparse(url).netloc.lower().removeprefix("www.")
+
+
+def research_company(url, prospect_name="", page=None):
+    """Crawl + web search for one company, combined into a research block."""
+    research = run_stages(
+        leadership_stages(url, prospect_name, page),
+        time.monotonic() + RESEARCH_DEADLINE_SECONDS,
+    )
+    return combine_leadership(research["crawl"], research["search"])
+
+
+class SharedResearch:
+    """Runs research_company at most once per domain and shares the result.
+
+    Research starts the first time a domain is asked for, so a domain whose
+    URLs are all cached analyses is never researched.
+    """
+
+    def __init__(self, pool, prospect_names):
+        self._pool = pool
+        self._names = prospect_names
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def get(self, url, page=None):
+        """Return a future for the research of ``url``'s domain.
+
+        ``page`` is the PageFetch of ``url``, reused if this URL starts it.
+        """
+        domain = company_domain(url)
+        with self._lock:
+            future = self._futures.get(domain)
+            if future is None:
+                future = self._pool.submit(in_context(research_company), url, self._names.get(domain, ""), page)
+                self._futures[domain] = future
+        return future
+
+    def finished(self, url):
+        """True if the research of ``url``'s domain has completed."""
+        with self._lock:
+            future = self._futures.get(company_domain(url))
+        return future is not None and future.done()
+
+
+def _prepare_one(item, research, deadline=None):
+    """Return (page_text, leadership_text) for one URL.
+
+    Research still running at ``deadline`` is given up on (left empty).
+    """
+    url = item["url"]
+    page = PageFetch(url)
+    # Start (or join) the company's research while this page is fetched
+    leadership = research.get(url, page)
+    page_text = item["page_text"] or document_text(page.document()) or NO_PAGE_TEXT
+    timeout = RESEARCH_DEADLINE_SECONDS + 5
+    if deadline is not None:
+        timeout = max(min(timeout, deadline - time.monotonic()), 0)
+    try:
+        all_leadership = leadership.result(timeout=timeout)
+    except Exception:
+        all_leadership = ""
+    return page_text, all_leadership
+
+
+def _analyze_one(item, company, attempt, research, deadline):
+    """Analyze one URL by ``deadline``; never raises, errors are reported in
+    the result."""
+    url = item["url"]
+    try:
+        key = analysis_cache_key(url, item["page_text"], company, attempt)
+        cached = ANALYSIS_CACHE.get(key)
+        if cached is not None:
+            return {"status": "success", "url": url, "analysis": cached, "cache": "HIT"}
+        if deadline - time.monotonic() < MIN_ANALYZE_SECONDS:
+            return {"status": "error", "url": url, "message": TIME_LIMIT_MESSAGE}
+
+        # Research gets what's left after reserving the analysis its minimum
+        page_text, all_leadership = _prepare_one(item, research, deadline - MIN_ANALYZE_SECONDS)
+        analysis = analyze_page(url, page_text, company, attempt, all_leadership,
+                                latency_budget=deadline - time.monotonic())
+        save_analysis(key, url, company, attempt, analysis, item["prospect_name"],
+                      page_key(item["page_text"]))
+        return {"status": "success", "url": url, "analysis": analysis, "cache": "MISS"}
+    except AdmissionRejected as e:
+        return {"status": "error", "url": url, "message": "Token budget exceeded; try again shortly",
+                "retry_after": int(e.headers["Retry-After"])}
+    except urllib.error.HTTPError as e:
+        error_body = e.read().decode() if e.readable() else str(e)
+        return {"status": "error", "url": url, "message": f"Claude API error ({e.code}): {error_body}"}
+    except Exception as e:
+        return {"status": "error", "url": url, "message": f"Internal error: {type(e).__name__}: {str(e)}"}
+
+
+def iter_analyses(items, company, attempt=0, max_workers=BATCH_CONCURRENCY, deadline=None):
+    """Yield (index, result) for each item as soon as its analysis is ready.
+
+    ``items`` are dicts with "url", "page_text" and "prospect_name". At most
+    ``max_workers`` URLs are analyzed, and at most ``max_workers`` companies
+    researched, at a time. Every item gets a result by ``deadline`` (a
+    ``time.monotonic()`` value, default BATCH_DEADLINE_SECONDS from now):
+    those still queued or running then are yielded as errors and abandoned.
+    """
+    deadline = deadline if deadline is not None else time.monotonic() + BATCH_DEADLINE_SECONDS
+    names = _research_names(items)
+    workers = max(1, min(max_workers, len(items)))
+    # Not context managers: leaving those would wait for abandoned work
+    research_pool = ThreadPoolExecutor(max_workers=workers)
+    pool = ThreadPoolExecutor(max_workers=workers)
+    try:
+        research = SharedResearch(research_pool, names)
+        futures = {
+            pool.submit(in_context(_analyze_one), item, company, attempt, research, deadline): index
+            for index, item in enumerate(items)
+        }
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=max(deadline - time.monotonic(), 0),
+                                 return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                yield futures[future], future.result()
+        for future in sorted(pending, key=futures.get):
+            index = futures[future]
+            yield index, {"status": "error", "url": items[index]["url"], "message": TIME_LIMIT_MESSAGE}
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+        research_pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _research_names(items):
+    """First prospect_name given for each domain."""
+    names = {}
+    for item in items:
+        domain = company_domain(item["url"])
+        if item["prospect_name"] and not names.get(domain):
+            names[domain] = item["prospect_name"]
+    return names
+
+
+def analysis_result(item, text, error=None):
+    """Job result for one URL, shaped like the NDJSON result lines (plus
+    "researched": false for a URL submitted without its research)."""
+    if error:
+        result = {"status": "error", "url": item["url"], "message": error}
+    else:
+        analysis = parse_analysis(text)
+        if item.get("model"):
+            analysis["model"] = item["model"]
+        result = {"status": "success", "url": item["url"], "analysis": analysis}
+    if item.get("researched") is False:
+        result["researched"] = False
+    return result
+
+
+def prepare_items(items, deadline, max_workers=JOB_RESEARCH_CONCURRENCY):
+    """(page_text, leadership_text, researched) for every item, gathered
+    until ``deadline``.
+
+    Items whose page or research isn't ready by then get the request's page
+    text (or a stand-in) and no research, and ``researched`` is False.
+    """
+    workers = max(1, min(max_workers, len(items)))
+    # Not context managers: leaving those would wait for unfinished work
+    research_pool = ThreadPoolExecutor(max_workers=workers)
+    pool = ThreadPoolExecutor(max_workers=workers)
+    try:
+        research = SharedResearch(research_pool, _research_names(items))
+        futures = [pool.submit(in_context(_prepare_one), item, research, deadline) for item in items]
+        wait(futures, timeout=max(deadline - time.monotonic(), 0))
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+        research_pool.shutdown(wait=False, cancel_futures=True)
+
+    prepared = []
+    for item, future in zip(items, futures):
+        if not future.done() or future.cancelled() or future.exception() is not None:
+            prepared.append((item["page_text"] or NO_PAGE_TEXT, "", False))
+        elif not research.finished(item["url"]):
+            prepared.append((future.result()[0], "", False))
+        else:
+            prepared.append((*future.result(), True))
+    return prepared
+
+
+def submit_analyze_job(items, company, attempt, store, deadline=None):
+    """Gather the pages and research (until ``deadline``, default
+    JOB_RESEARCH_SECONDS from now), then submit the analyses as one
+    Message Batch; see prepare_items.
+
+    The prompts and model routing are those of analyze_page, minus the
+    large-model fallback (a batch can't retry a single reply).
+    """
+    deadline = deadline if deadline is not None else time.monotonic() + JOB_RESEARCH_SECONDS
+    prepared = prepare_items(items, deadline)
+
+    requests, job_items = [], []
+    for item, (page_text, leadership, researched) in zip(items, prepared):
+        model, max_tokens = route_analysis(leadership)
+        requests.append({"params": {
+            "model": model,
+            "max_tokens": max_tokens,
+            "system": build_analyze_system(),
+            "messages": [{
+                "role": "user",
+                "content": build_analyze_prompt(item["url"], page_text, company, attempt, leadership),
+            }],
+        }})
+        # Page text is already in the prompt; the job only needs to name each URL
+        job_items.append({"url": item["url"], "prospect_name": item["prospect_name"], "model": model,
+                          "researched": researched})
+    return submit_job(store, "analyze", requests, job_items)
+
+
+def parse_items(urls):
+    """Normalize the request's "urls" list; returns None if an entry is invalid.
+
+    Entries may be plain URL strings or objects with "url" and optional
+    "page_text" / "prospect_name".
+    """
+    items = []
+    for entry in urls:
+        if isinstance(entry, str):
+            entry = {"url": entry}
+        if not isinstance(entry, dict) or not str(entry.get("url", "")).strip():
+            return None
+        items.append({
+            "url": str(entry["url"]).strip(),
+            "page_text": str(entry.get("page_text") or "").strip(),
+            "prospect_name": str(entry.get("prospect_name") or "").strip(),
+        })
+    return items
+
+
+def send_line(handler, data):
+    handler.wfile.write((json.dumps(data) + "\n").encode())
+    handler.wfile.flush()
+
+
+# ---------------------------------------------------------------------------
+# HTTP handler
+# ---------------------------------------------------------------------------
+
+class handler(BaseHTTPRequestHandler):
+    def do_OPTIONS(self):
+        self.send_response(200)
+        add_cors_headers(self)
+        self.end_headers()
+
+    def do_POST(self):
+        # Claude calls are budgeted per client, from its batch bucket (see _admission.py)
+        with client(client_id(self), batch=True):
+            self._handle_post()
+
+    def _handle_post(self):
+        try:
+            content_length = int(self.headers.get("Content-Length", 0))
+            if content_length > MAX_BODY_BYTES:
+                return send_json(self, 413, {"message": "Request body too large"})
+
+            body = json.loads(self.rfile.read(content_length))
+            urls = body.get("urls", [])
+            company = body.get("company", {})
+            attempt = body.get("attempt", 0)
+
+            if not isinstance(urls, list) or not urls:
+                return send_json(self, 400, {"message": "No URLs provided"})
+            if len(urls) > MAX_URLS:
+                return send_json(self, 400, {"message": f"Maximum {MAX_URLS} URLs per request"})
+            items = parse_items(urls)
+            if items is None:
+                return send_json(self, 400, {"message": "Every entry needs a url"})
+
+            if body.get("mode") == "batch":
+                job = submit_analyze_job(items, company, attempt, store_from_env())
+                researched = sum(1 for item in job["items"] if item["researched"])
+                return send_json(self, 202, {"status": "queued", "job_id": job["id"], "batch_id": job["batch_id"],
+                                             "researched": researched, "total": len(items)})
+
+        except JobStoreUnavailable as e:
+            return send_json(self, 503, {"message": str(e)})
+
+        except urllib.error.HTTPError as e:
+            error_body = e.read().decode() if e.readable() else str(e)
+            return send_json(self, 502, {"message": f"Claude API error ({e.code}): {error_body}"})
+
+        except Exception as e:
+            return send_json(self, 500, {"message": f"Internal error: {type(e).__name__}: {str(e)}"})
+
+        self.send_response(200)
+        add_cors_headers(self)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+
+        sent = failed = 0
+        try:
+            for index, result in iter_analyses(items, company, attempt):
+                sent += 1
+                failed += result["status"] != "success"
+                send_line(self, dict(result, index=index))
+        finally:
+            # URLs without a line (the run broke off) count as failed. If the
+            # client is gone this write fails too; don't let it replace the
+            # exception that ended the run.
+            try:
+                send_line(self, {"status": "done", "total": len(items), "failed": failed + len(items) - sent})
+            except OSError:
+                pass
@@ -4,98 +4,225 @@ Serverless API endpoint for generating personalized outreach snippets using Clau
 Environment variables required:
   ANTHROPIC_API_KEY - Your Anthropic API key
   NEWS_API_KEY      - (Optional) News API key for fetching recent company news
+
+Optional tuning:
+  GENERATE_CONCURRENCY - Targets processed in parallel per request (default 5)
+  MODEL_ROUTING        - Model choice per snippet, see _routing.py (default "auto")
+  NEWS_CACHE_TTL       - Seconds a company's news stays cached (default 21600)
+  NEWS_TOKEN_BUDGET    - Approximate prompt tokens for the news block (default 600)
+  CACHE_BACKEND        - Cache backend, see _cache.py (default "memory")
+  RATE_LIMIT_BACKEND   - Token budgets per client and API key, see _admission.py
+
+Send "mode": "batch" to submit the snippets as a Message Batches job instead
+(cheaper, for overnight runs): the response is 202 with a job_id to read
+back from /api/jobs. See _jobs.py for the job store.
 """
 
 import json
 import os
+import re
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+import sys
 from http.server import BaseHTTPRequestHandler
-import urllib.request
 import urllib.parse
 import urllib.error
 
-ANTHROPIC_API_URL = "https://api.anthropic.com/v1/messages"
-ANTHROPIC_VERSION = "2023-06-01"
-MODEL = "claude-sonnet-4-20250514"
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _admission import AdmissionRejected, client, client_id  # noqa: E402
+from _cache import cache_from_env, cache_key, get_or_compute, normalize_company, normalize_text  # noqa: E402
+from _claude import post_messages  # noqa: E402
+from _jobs import JobStoreUnavailable, store_from_env, submit_job  # noqa: E402
+from _compact import CHARS_PER_TOKEN, estimate_tokens  # noqa: E402
+from _http import urlopen  # noqa: E402  (shared pooled client, see _http.py)
+from _routing import LARGE_MODEL, choose_model  # noqa: E402
+from _trace import in_context  # noqa: E402
+
 MAX_TARGETS = 10
+MAX_JOB_TARGETS = 200
 MAX_BODY_BYTES = 50_000
+GENERATE_CONCURRENCY = int(os.environ.get("GENERATE_CONCURRENCY", "5"))
 
 
-def call_claude(system, user_prompt, max_tokens=400):
-    """Call the Anthropic Messages API directly via urllib."""
-    api_key = os.environ.get("ANTHROPIC_API_KEY", "").strip()
-    payload = json.dumps({
-        "model": MODEL,
+def call_claude(system, user_prompt, max_tokens=400, model=LARGE_MODEL):
+    """Call the Anthropic Messages API and return the reply text."""
+    data = post_messages({
+        "model": model,
         "max_tokens": max_tokens,
         "system": system,
         "messages": [{"role": "user", "content": user_prompt}],
-    }).encode()
-
-    req = urllib.request.Request(
-        ANTHROPIC_API_URL,
-        data=payload,
-        headers={
-            "Content-Type": "application/json",
-            "x-api-key": api_key,
-            "anthropic-version": ANTHROPIC_VERSION,
-        },
-        method="POST",
-    )
-    with urllib.request.urlopen(req, timeout=60) as resp:
-        data = json.loads(resp.read().decode())
+    }, timeout=60)
     return data["content"][0]["text"].strip()
 
 
 def add_cors_headers(handler):
     handler.send_header("Access-Control-Allow-Origin", "*")
     handler.send_header("Access-Control-Allow-Methods", "POST, OPTIONS")
-    handler.send_header("Access-Control-Allow-Headers", "Content-Type")
+    handler.send_header("Access-Control-Allow-Headers", "Content-Type, X-Client-Id")
+    handler.send_header("Access-Control-Expose-Headers", "Retry-After")
 
 
-def send_json(handler, status, data):
+def send_json(handler, status, data, headers=None):
     handler.send_response(status)
     add_cors_headers(handler)
     handler.send_header("Content-Type", "application/json")
+    for name, value in (headers or {}).items():
+        handler.send_header(name, value)
     handler.end_headers()
     handler.wfile.write(json.dumps(data).encode())
 
 
+def wants_event_stream(handler, body):
+    """True if the client opted in to Server-Sent Events for this request."""
+    return body.get("stream") is True or "text/event-stream" in handler.headers.get("Accept", "")
+
+
+def start_event_stream(handler):
+    handler.send_response(200)
+    add_cors_headers(handler)
+    handler.send_header("Content-Type", "text/event-stream")
+    handler.send_header("Cache-Control", "no-cache")
+    handler.end_headers()
+
+
+def send_event(handler, event, data):
+    handler.wfile.write(f"event: {event}\ndata: {json.dumps(data)}\n\n".encode())
+    handler.wfile.flush()
+
+
+# ---------------------------------------------------------------------------
+# Company news (NewsAPI), cached per company
+# ---------------------------------------------------------------------------
+
+NEWS_CACHE_TTL = int(os.environ.get("NEWS_CACHE_TTL", "21600"))  # 6 hours
+NEWS_CACHE = cache_from_env("news", max_entries=1024, ttl=NEWS_CACHE_TTL)
+NEWS_TOKEN_BUDGET = int(os.environ.get("NEWS_TOKEN_BUDGET", "600"))
+
+# NewsAPI cuts "content" off with e.g. "… [+2817 chars]"
+_TRUNCATED_RE = re.compile(r"\s*(?:…|\.\.\.)?\s*\[\+\d+ chars\]$")
+
+
+def _query_news(company_name, api_key):
+    """Articles from NewsAPI, reduced to the fields the prompt uses.
+
+    Raises on failure, so failures aren't cached.
+    """
+    params = urllib.parse.urlencode({
+        "q": f'"{company_name}"',
+        "language": "en",
+        "sortBy": "publishedAt",
+        "pageSize": 5,
+        "apiKey": api_key,
+        "searchIn": "title,description",
+    })
+    url = f"https://newsapi.org/v2/everything?{params}"
+    with urlopen(url, timeout=10, max_bytes=1_000_000, max_seconds=10,
+                 content_types=("json",)) as resp:
+        data = json.loads(resp.read().decode())
+    return [
+        {
+            "title": article.get("title") or "",
+            "description": article.get("description") or "",
+            "content": article.get("content") or "",
+            "source": {"name": (article.get("source") or {}).get("name") or "Unknown"},
+            "publishedAt": article.get("publishedAt") or "",
+        }
+        for article in data.get("articles", [])
+    ]
+
+
 def fetch_company_news(company_name):
-    """Fetch recent news articles about a company using News API (optional)."""
+    """Fetch recent news articles about a company using News API (optional).
+
+    Results are cached per normalized company name, and concurrent lookups
+    of the same company share one NewsAPI call.
+    """
     api_key = os.environ.get("NEWS_API_KEY")
     if not api_key:
         return []
 
     try:
-        params = urllib.parse.urlencode({
-            "q": f'"{company_name}"',
-            "language": "en",
-            "sortBy": "publishedAt",
-            "pageSize": 5,
-            "apiKey": api_key,
-            "searchIn": "title,description",
-        })
-        url = f"https://newsapi.org/v2/everything?{params}"
-        req = urllib.request.Request(url)
-        with urllib.request.urlopen(req, timeout=10) as resp:
-            data = json.loads(resp.read().decode())
-            return data.get("articles", [])
+        return get_or_compute(
+            NEWS_CACHE,
+            cache_key("news", normalize_company(company_name)),
+            lambda: _query_news(company_name, api_key),
+            fresh_for=NEWS_CACHE_TTL,
+            should_store=lambda articles: True,  # "no news" is worth caching too
+        )
     except Exception:
         return []
 
 
+class SharedNews:
+    """fetch_company_news at most once per company within one request.
+
+    The first target asking for a company fetches its news; targets for the
+    same company wait for that result instead of fetching again.
+    """
+
+    def __init__(self):
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def get(self, company_name):
+        key = normalize_company(company_name)
+        with self._lock:
+            future = self._futures.get(key)
+            owner = future is None
+            if owner:
+                future = self._futures[key] = Future()
+        if owner:
+            future.set_result(fetch_company_news(company_name))
+        return future.result()
+
+
+def target_news(target, news):
+    """News articles for a target; only company targets get news."""
+    if target.get("type") != "company":
+        return []
+    return news.get(target["name"]) if news is not None else fetch_company_news(target["name"])
+
+
+def _shorten(text, max_chars):
+    """Cut text at a word boundary to at most max_chars."""
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars].rsplit(" ", 1)[0].rstrip(" ,;:") + "…"
+
+
+def format_news(news_articles, max_tokens=NEWS_TOKEN_BUDGET):
+    """The prompt's "Recent News" block, kept to about max_tokens.
+
+    Articles arrive newest first. Each keeps its title and source; the
+    descriptions and contents fill whatever budget is left, and content
+    that only repeats the description is dropped.
+    """
+    budget = max_tokens * CHARS_PER_TOKEN
+    news_context = "\nRecent News:\n"
+    for kept, article in enumerate(news_articles):
+        title = article.get("title", "")
+        source_name = (article.get("source") or {}).get("name", "Unknown")
+        source = f"Source: {source_name} ({article.get('publishedAt', '')})\n\n"
+        budget -= len(title) + len(source)
+        if budget < 0 and kept:
+            break
+        news_context += f"Title: {title}\n"
+        description = (article.get("description") or "").strip()
+        content = _TRUNCATED_RE.sub("", article.get("content") or "").strip()
+        if content and normalize_text(content)[:80] in normalize_text(description):
+            content = ""
+        for label, text in (("Description", description), ("Content", content)):
+            if text and budget > 40:
+                text = _shorten(text, budget)
+                budget -= len(text)
+                news_context += f"{label}: {text}\n"
+        news_context += source
+    return news_context
+
+
 def build_prompt(target, company, news_articles):
     """Build the Claude prompt for generating an outreach snippet."""
-    news_context = ""
-    if news_articles:
-        news_context = "\nRecent News:\n"
-        for article in news_articles:
-            news_context += f"Title: {article.get('title', '')}\n"
-            if article.get("description"):
-                news_context += f"Description: {article['description']}\n"
-            if article.get("content"):
-                news_context += f"Content: {article['content']}\n"
-            source_name = article.get("source", {}).get("name", "Unknown")
-            news_context += f"Source: {source_name} ({article.get('publishedAt', '')})\n\n"
+    news_context = format_news(news_articles) if news_articles else ""
 
     return f"""Generate a personalized outreach message for {target['name']} ({target['type']}) from {company['name']}.
 
@@ -133,20 +260,96 @@ SYSTEM_PROMPT = (
 )
 
 
-def generate_snippets(targets, company):
-    """Call Claude to generate outreach snippets for each target."""
-    results = []
-    for target in targets:
-        news_articles = []
-        if target.get("type") == "company":
-            news_articles = fetch_company_news(target["name"])
-        prompt = build_prompt(target, company, news_articles)
-        snippet = call_claude(SYSTEM_PROMPT, prompt, max_tokens=400)
-        results.append({
-            "name": target["name"],
-            "type": target["type"],
-            "snippet": snippet,
-        })
+def route_snippet(prompt):
+    """(model, max_tokens) for a snippet; long news context needs the large model."""
+    return choose_model("snippet", estimate_tokens(SYSTEM_PROMPT) + estimate_tokens(prompt))
+
+
+def _generate_one(target, company, news=None):
+    """Fetch news and generate the snippet for a single target.
+
+    ``news`` is the request's SharedNews, if any. A failure is reported in
+    the result's "error" field, except AdmissionRejected, which is raised so
+    the request is answered 429 as /api/analyze does.
+    """
+    result = {"name": target["name"], "type": target["type"], "snippet": ""}
+    try:
+        prompt = build_prompt(target, company, target_news(target, news))
+        model, max_tokens = route_snippet(prompt)
+        result["model"] = model
+        result["snippet"] = call_claude(SYSTEM_PROMPT, prompt, max_tokens, model)
+    except AdmissionRejected:
+        raise
+    except urllib.error.HTTPError as e:
+        error_body = e.read().decode() if e.readable() else str(e)
+        result["error"] = f"Claude API error ({e.code}): {error_body}"
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {str(e)}"
+    return result
+
+
+def snippet_params(target, company, news=None):
+    """Messages request body for one target's snippet (fetches its news)."""
+    prompt = build_prompt(target, company, target_news(target, news))
+    model, max_tokens = route_snippet(prompt)
+    return {
+        "model": model,
+        "max_tokens": max_tokens,
+        "system": SYSTEM_PROMPT,
+        "messages": [{"role": "user", "content": prompt}],
+    }
+
+
+def snippet_result(target, text, error=None):
+    """Job result for one target, shaped like _generate_one's."""
+    result = {"name": target["name"], "type": target["type"], "snippet": text}
+    if target.get("model"):
+        result["model"] = target["model"]
+    if error:
+        result["error"] = error
+    return result
+
+
+def submit_generate_job(targets, company, store, max_workers=GENERATE_CONCURRENCY):
+    """Build every target's prompt and submit them as one Message Batch."""
+    news = SharedNews()
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(targets)))) as pool:
+        requests = [{"params": params} for params in pool.map(lambda t: snippet_params(t, company, news), targets)]
+    items = [dict(target, model=request["params"]["model"]) for target, request in zip(targets, requests)]
+    return submit_job(store, "generate", requests, items)
+
+
+def iter_snippets(targets, company, max_workers=GENERATE_CONCURRENCY):
+    """Yield (index, result) for each target as soon as its snippet is ready.
+
+    Targets are processed concurrently, at most max_workers at a time; news
+    for a company named by several targets is fetched once. AdmissionRejected
+    from any target is raised, and targets not yet started are dropped.
+    """
+    news = SharedNews()
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(targets)))) as pool:
+        futures = {
+            pool.submit(in_context(_generate_one), target, company, news): index
+            for index, target in enumerate(targets)
+        }
+        try:
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+
+def generate_snippets(targets, company, max_workers=GENERATE_CONCURRENCY):
+    """Call Claude to generate outreach snippets for each target.
+
+    Results keep the input order. A target that fails gets an empty snippet
+    and an "error" message instead of failing the whole batch; only
+    AdmissionRejected fails it (see _generate_one).
+    """
+    results = [None] * len(targets)
+    for index, result in iter_snippets(targets, company, max_workers):
+        results[index] = result
     return results
 
 
@@ -157,6 +360,11 @@ class handler(BaseHTTPRequestHandler):
         self.end_headers()
 
     def do_POST(self):
+        # Claude calls are budgeted per client (see _admission.py)
+        with client(client_id(self)):
+            self._handle_post()
+
+    def _handle_post(self):
         try:
             content_length = int(self.headers.get("Content-Length", 0))
             if content_length > MAX_BODY_BYTES:
@@ -166,16 +374,43 @@ class handler(BaseHTTPRequestHandler):
             targets = body.get("targets", [])
             company = body.get("company", {})
 
+            batch_mode = body.get("mode") == "batch"
+            max_targets = MAX_JOB_TARGETS if batch_mode else MAX_TARGETS
+
             if not targets:
                 return send_json(self, 400, {"message": "No targets provided"})
-            if len(targets) > MAX_TARGETS:
-                return send_json(self, 400, {"message": f"Maximum {MAX_TARGETS} targets per request"})
+            if len(targets) > max_targets:
+                return send_json(self, 400, {"message": f"Maximum {max_targets} targets per request"})
             if not company.get("name") or not company.get("description"):
                 return send_json(self, 400, {"message": "Company name and description are required"})
 
+            if batch_mode:
+                job = submit_generate_job(targets, company, store_from_env())
+                return send_json(self, 202, {"status": "queued", "job_id": job["id"], "batch_id": job["batch_id"]})
+
+            if wants_event_stream(self, body):
+                # Send each snippet as it lands, then the full ordered list
+                start_event_stream(self)
+                results = [None] * len(targets)
+                try:
+                    for index, result in iter_snippets(targets, company):
+                        results[index] = result
+                        send_event(self, "snippet", dict(result, index=index))
+                except AdmissionRejected as e:
+                    return send_event(self, "error", {"message": "Token budget exceeded; try again shortly",
+                                                      "retry_after": int(e.headers["Retry-After"])})
+                return send_event(self, "done", {"status": "success", "results": results})
+
             results = generate_snippets(targets, company)
             send_json(self, 200, {"status": "success", "results": results})
 
+        except AdmissionRejected as e:
+            send_json(self, 429, {"message": "Token budget exceeded; try again shortly"},
+                      {"Retry-After": e.headers["Retry-After"]})
+
+        except JobStoreUnavailable as e:
+            send_json(self, 503, {"message": str(e)})
+
         except urllib.error.HTTPError as e:
             error_body = e.read().decode() if e.readable() else str(e)
             send_json(self, 502, {"message": f"Claude API error ({e.code}): {error_body}"})
@@ -0,0 +1,77 @@
+"""
+Serverless API endpoint for reading back asynchronous (Message Batches) jobs
+submitted with "mode": "batch" to /api/generate or /api/analyze_batch.
+
+GET /api/jobs?id=<job_id> polls the job's batch once and returns the job.
+While the batch runs, "status" is "processing" with the batch's
+request_counts; once it has ended, "status" is "completed" and "results"
+holds one entry per submitted item, in submission order.
+
+Environment variables required:
+  ANTHROPIC_API_KEY - Your Anthropic API key
+  KV_REST_API_URL / KV_REST_API_TOKEN - The shared store jobs are kept in
+                      (see _jobs.py; 503 on Vercel without it)
+"""
+
+import json
+import os
+import sys
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlparse
+import urllib.error
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _jobs import JobStoreUnavailable, refresh_job, store_from_env  # noqa: E402
+from analyze_batch import analysis_result  # noqa: E402
+from generate import snippet_result  # noqa: E402
+
+RESULT_BUILDERS = {
+    "analyze": analysis_result,
+    "generate": snippet_result,
+}
+
+
+def add_cors_headers(handler):
+    handler.send_header("Access-Control-Allow-Origin", "*")
+    handler.send_header("Access-Control-Allow-Methods", "GET, OPTIONS")
+    handler.send_header("Access-Control-Allow-Headers", "Content-Type")
+
+
+def send_json(handler, status, data):
+    handler.send_response(status)
+    add_cors_headers(handler)
+    handler.send_header("Content-Type", "application/json")
+    handler.end_headers()
+    handler.wfile.write(json.dumps(data).encode())
+
+
+class handler(BaseHTTPRequestHandler):
+    def do_OPTIONS(self):
+        self.send_response(200)
+        add_cors_headers(self)
+        self.end_headers()
+
+    def do_GET(self):
+        try:
+            job_id = parse_qs(urlparse(self.path).query).get("id", [""])[0].strip()
+            if not job_id:
+                return send_json(self, 400, {"message": "No job id provided"})
+
+            store = store_from_env()
+            job = store.get(job_id)
+            if job is None:
+                return send_json(self, 404, {"message": "Unknown job id"})
+
+            job = refresh_job(store, job_id, RESULT_BUILDERS[job["kind"]])
+            job.pop("items", None)
+            send_json(self, 200, job)
+
+        except JobStoreUnavailable as e:
+            send_json(self, 503, {"message": str(e)})
+
+        except urllib.error.HTTPError as e:
+            error_body = e.read().decode() if e.readable() else str(e)
+            send_json(self, 502, {"message": f"Claude API error ({e.code}): {error_body}"})
+
+        except Exception as e:
+            send_json(self, 500, {"message": f"Internal error: {type(e).__name__}: {str(e)}"})
@@ -0,0 +1,96 @@
+"""
+Serverless API endpoint for looking up stored prospect intelligence: the
+analyses, key contacts and crawl snapshots /api/analyze has recorded (see
+_prospects.py). Every lookup is an indexed query against the store, so no
+page is fetched and no model is called.
+
+GET /api/prospects?domain=<domain or URL>
+    Everything stored for one prospect (404 if never analyzed).
+GET /api/prospects?company=<name>
+    Prospects whose company name starts with ``name`` (legal forms and
+    punctuation ignored), with their contacts.
+GET /api/prospects?title=<title>
+    Contacts across prospects in the title's role ("coo", "VP Ops"), or
+    whose title starts with it; best first.
+
+``limit`` caps the company and title results (default and maximum 100).
+
+The store holds every seller's research, so each request must send
+``Authorization: Bearer <PROSPECTS_API_TOKEN>``; without the token
+configured the endpoint answers 503.
+
+Environment variables:
+  PROSPECTS_API_TOKEN - Token callers must present
+  PROSPECT_STORE      - Prospect store, see _prospects.py
+  PROSPECT_DB_PATH    - SQLite file for the sqlite store
+"""
+
+import hmac
+import json
+import os
+import sys
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _prospects import MAX_RESULTS, store_from_env  # noqa: E402
+
+
+def add_cors_headers(handler):
+    handler.send_header("Access-Control-Allow-Origin", "*")
+    handler.send_header("Access-Control-Allow-Methods", "GET, OPTIONS")
+    handler.send_header("Access-Control-Allow-Headers", "Content-Type, Authorization")
+
+
+def send_json(handler, status, data):
+    handler.send_response(status)
+    add_cors_headers(handler)
+    handler.send_header("Content-Type", "application/json")
+    handler.end_headers()
+    handler.wfile.write(json.dumps(data).encode())
+
+
+def authorized(handler):
+    """(status, message) refusing the request, or None if it carries the token."""
+    token = os.environ.get("PROSPECTS_API_TOKEN", "").strip()
+    if not token:
+        return 503, "Prospect lookups are disabled: PROSPECTS_API_TOKEN is not set"
+    sent = handler.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+    if not hmac.compare_digest(sent.encode(), token.encode()):
+        return 401, "Missing or invalid Authorization token"
+    return None
+
+
+class handler(BaseHTTPRequestHandler):
+    def do_OPTIONS(self):
+        self.send_response(200)
+        add_cors_headers(self)
+        self.end_headers()
+
+    def do_GET(self):
+        try:
+            refused = authorized(self)
+            if refused is not None:
+                return send_json(self, refused[0], {"message": refused[1]})
+            query = {key: values[0].strip() for key, values in parse_qs(urlparse(self.path).query).items()}
+            try:
+                limit = min(max(int(query.get("limit") or MAX_RESULTS), 1), MAX_RESULTS)
+            except ValueError:
+                return send_json(self, 400, {"message": "limit must be a number"})
+
+            store = store_from_env()
+            if query.get("domain"):
+                prospect = store.prospect(query["domain"])
+                if prospect is None:
+                    return send_json(self, 404, {"message": "No stored intelligence for this domain"})
+                return send_json(self, 200, {"status": "success", "prospect": prospect})
+            if query.get("company"):
+                prospects = store.search_company(query["company"], limit)
+                return send_json(self, 200, {"status": "success", "prospects": prospects})
+            if query.get("title"):
+                contacts = store.contacts_by_title(query["title"], limit)
+                return send_json(self, 200, {"status": "success", "contacts": contacts})
+            send_json(self, 400, {"message": "Provide domain, company or title"})
+
+        except Exception as e:
+            send_json(self, 500, {"message": f"Internal error: {type(e).__name__}: {str(e)}"})
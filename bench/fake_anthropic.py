@@ -0,0 +1,253 @@
+"""
+Local stand-in for the Anthropic Messages API, for benchmarks and tests.
+
+Answers POST /v1/messages like the real API, streaming or not, with a
+configurable time to first token, output speed and error injection:
+  - analyze calls (system mentions the analysis schema) get a valid analysis
+  - web_search calls get a text block plus web_search_tool_result blocks
+  - anything else (outreach snippets) gets a short snippet
+
+Message Batches work too: POST /v1/messages/batches answers every request
+at once (errored at error_rate), and GET /v1/messages/batches/<id> reports
+the batch ended batch_seconds later, with its results at results_url.
+
+Run standalone:
+  python bench/fake_anthropic.py --port 8801 --latency-ms 400 --tokens-per-second 80
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ANALYSIS = {
+    "overview": "A multi-location home services franchise growing through acquisitions.",
+    "tags": ["Franchise", "Home Services", "Acquisition", "Hiring"],
+    "insights": [
+        "Recently acquired a competitor, adding 6 locations",
+        "Hiring technicians and dispatchers in three metros",
+        "Runs 24/7 emergency service across 40 locations",
+    ],
+    "key_contacts": [
+        {"name": "Maria Alvarez", "title": "Founder & CEO", "source": "company website"},
+        {"name": "Priya Raman", "title": "VP of Operations", "source": "company website"},
+    ],
+    "pre_meeting_brief": {
+        "company_snapshot": "40-location franchise network, 600+ employees.",
+        "likely_priorities": ["Integrating acquired locations", "Dispatcher hiring"],
+        "talking_points": ["Onboarding acquired franchisees", "Call handling at peak"],
+    },
+    "outreach": {
+        "observation": "Congrats on the Lone Star Rooter acquisition.",
+        "problem": "Folding 6 new locations into dispatch usually strains call handling.",
+        "credibility": "We helped a 50-location brand cut missed calls by 38%.",
+        "solution": "We can route overflow calls so no job goes unanswered.",
+        "ctc": "Open to a quick look next week?",
+    },
+}
+SNIPPET = (
+    "Saw the news about your expansion this quarter. Teams scaling that fast usually "
+    "lose time to manual scheduling; we cut that by a third for similar operators. "
+    "Worth a 15-minute call next week?\nSource: Company website (2025)"
+)
+SEARCH_TEXT = "Maria Alvarez - Founder & CEO; Derek Olsen - President; Priya Raman - VP of Operations"
+
+
+class Config:
+    latency_ms = 300          # time to first token
+    tokens_per_second = 100   # output speed after the first token
+    error_rate = 0.0          # fraction of requests answered with error_status
+    error_status = 529
+    retry_after = 0.5
+    fail_next = 0             # answer this many upcoming requests with error_status
+    batch_seconds = 1.0       # how long a message batch stays in progress
+
+
+class FakeMessagesHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = Config
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status, data, headers=None):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _should_fail(self):
+        cfg = self.config
+        with self.server.lock:
+            self.server.requests += 1
+            if cfg.fail_next > 0:
+                cfg.fail_next -= 1
+                return True
+        return random.random() < cfg.error_rate
+
+    def _send_error(self):
+        cfg = self.config
+        self._send_json(
+            cfg.error_status,
+            {"type": "error", "error": {"type": "overloaded_error", "message": "Overloaded"}},
+            {"retry-after": str(cfg.retry_after)},
+        )
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        cfg = self.config
+        if self._should_fail():
+            return self._send_error()
+        if self.path.rstrip("/").endswith("/batches"):
+            return self._create_batch(request)
+
+        message = self._message(request)
+        text = "".join(block.get("text", "") for block in message["content"] if block["type"] == "text")
+        time.sleep(cfg.latency_ms / 1000)
+
+        if request.get("stream"):
+            return self._stream(request, text, message["usage"])
+        time.sleep(message["usage"]["output_tokens"] / cfg.tokens_per_second)
+        self._send_json(200, message)
+
+    def _message(self, request):
+        """The reply to one Messages request body."""
+        system = json.dumps(request.get("system", ""))
+        if request.get("tools"):
+            content = [
+                {"type": "server_tool_use", "id": "srvtoolu_1", "name": "web_search", "input": {}},
+                {"type": "web_search_tool_result", "tool_use_id": "srvtoolu_1", "content": [
+                    {"type": "web_search_result", "title": "Leadership | Example", "url": "https://example.com/team",
+                     "snippet": SEARCH_TEXT},
+                ]},
+                {"type": "text", "text": SEARCH_TEXT},
+            ]
+        elif "Analyze" in system:
+            content = [{"type": "text", "text": json.dumps(ANALYSIS)}]
+        else:
+            content = [{"type": "text", "text": SNIPPET}]
+
+        text = "".join(block.get("text", "") for block in content if block["type"] == "text")
+        output_tokens = max(len(text) // 4, 1)
+        input_tokens = len(json.dumps(request)) // 4
+        usage = {"input_tokens": input_tokens, "output_tokens": output_tokens,
+                 "cache_creation_input_tokens": 0, "cache_read_input_tokens": 0}
+        return {
+            "id": "msg_bench", "type": "message", "role": "assistant", "model": request.get("model"),
+            "content": content, "stop_reason": "end_turn", "usage": usage,
+        }
+
+    def _create_batch(self, request):
+        results = []
+        for entry in request.get("requests", []):
+            if random.random() < self.config.error_rate:
+                result = {"type": "errored", "error": {"type": "error", "error": {
+                    "type": "overloaded_error", "message": "Overloaded"}}}
+            else:
+                result = {"type": "succeeded", "message": self._message(entry["params"])}
+            results.append({"custom_id": entry["custom_id"], "result": result})
+        with self.server.lock:
+            batch_id = f"msgbatch_{len(self.server.batches) + 1:06d}"
+            self.server.batches[batch_id] = {
+                "results": results, "ends_at": time.monotonic() + self.config.batch_seconds,
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            }
+        self._send_json(200, self._batch(batch_id))
+
+    def _batch(self, batch_id):
+        stored = self.server.batches[batch_id]
+        ended = time.monotonic() >= stored["ends_at"]
+        counts = {"processing": 0, "succeeded": 0, "errored": 0, "canceled": 0, "expired": 0}
+        for result in stored["results"]:
+            counts[result["result"]["type"] if ended else "processing"] += 1
+        return {
+            "id": batch_id, "type": "message_batch", "created_at": stored["created_at"],
+            "processing_status": "ended" if ended else "in_progress", "request_counts": counts,
+            "results_url": f"http://{self.headers['Host']}/v1/messages/batches/{batch_id}/results" if ended else None,
+        }
+
+    def do_GET(self):
+        # /v1/messages/batches/<id> and /v1/messages/batches/<id>/results
+        parts = self.path.strip("/").split("/")
+        batch_id = parts[3] if len(parts) in (4, 5) and parts[:3] == ["v1", "messages", "batches"] else None
+        if batch_id not in self.server.batches:
+            return self._send_json(404, {"type": "error", "error": {"type": "not_found_error",
+                                                                    "message": "Batch not found"}})
+        if self._should_fail():
+            return self._send_error()
+        if len(parts) == 4:
+            return self._send_json(200, self._batch(batch_id))
+        body = "".join(json.dumps(result) + "\n" for result in self.server.batches[batch_id]["results"]).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/binary")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream(self, request, text, usage):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def event(name, data):
+            payload = f"event: {name}\ndata: {json.dumps(data)}\n\n".encode()
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(payload), payload))
+            self.wfile.flush()
+
+        event("message_start", {"type": "message_start", "message": {
+            "id": "msg_bench", "model": request.get("model"), "usage": dict(usage, output_tokens=1)}})
+        event("content_block_start", {"type": "content_block_start", "index": 0,
+                                      "content_block": {"type": "text", "text": ""}})
+        chunk_chars = 16  # about 4 tokens per delta
+        for i in range(0, len(text), chunk_chars):
+            time.sleep(chunk_chars / 4 / self.config.tokens_per_second)
+            event("content_block_delta", {"type": "content_block_delta", "index": 0,
+                                          "delta": {"type": "text_delta", "text": text[i:i + chunk_chars]}})
+        event("content_block_stop", {"type": "content_block_stop", "index": 0})
+        event("message_delta", {"type": "message_delta", "delta": {"stop_reason": "end_turn"},
+                                "usage": {"output_tokens": usage["output_tokens"]}})
+        event("message_stop", {"type": "message_stop"})
+        self.wfile.write(b"0\r\n\r\n")
+
+
+def serve(port=0, latency_ms=None, tokens_per_second=None, error_rate=None, error_status=None, **options):
+    """Start the fake API in a background thread; returns the server.
+
+    Each server gets its own copy of Config (``server.config``, with any
+    overrides applied, including other Config fields as keywords), so tests
+    can change it while the server runs. ``server.requests`` counts the
+    requests answered.
+    """
+    overrides = dict(options, latency_ms=latency_ms, tokens_per_second=tokens_per_second,
+                     error_rate=error_rate, error_status=error_status)
+    config = type("Config", (Config,), {k: v for k, v in overrides.items() if v is not None})
+    handler = type("FakeMessagesHandler", (FakeMessagesHandler,), {"config": config})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.config, server.requests, server.lock, server.batches = config, 0, threading.Lock(), {}
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8801)
+    parser.add_argument("--latency-ms", type=float, default=Config.latency_ms)
+    parser.add_argument("--tokens-per-second", type=float, default=Config.tokens_per_second)
+    parser.add_argument("--error-rate", type=float, default=Config.error_rate)
+    parser.add_argument("--error-status", type=int, default=Config.error_status)
+    args = parser.parse_args()
+    server = serve(args.port, args.latency_ms, args.tokens_per_second, args.error_rate, args.error_status)
+    print(f"fake Messages API on http://127.0.0.1:{server.server_address[1]}", flush=True)
+    threading.Event().wait()
+
+
+if __name__ == "__main__":
+    main()
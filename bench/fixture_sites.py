@@ -0,0 +1,76 @@
+"""
+Local web server for the recorded company sites in bench/fixtures/.
+
+Each site directory gets its own port (the leadership crawl is per origin).
+"/" serves index.html and "/<name>" serves <name>.html, so every site has
+/about and /team; any other crawl path gets a 404, as on a real site.
+
+Run standalone:
+  python bench/fixture_sites.py --port 8810 --latency-ms 50
+"""
+
+import argparse
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def site_names():
+    return sorted(
+        name for name in os.listdir(FIXTURES_DIR)
+        if os.path.isfile(os.path.join(FIXTURES_DIR, name, "index.html"))
+    )
+
+
+def make_handler(site_dir, latency_ms=0):
+    class SiteHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            time.sleep(latency_ms / 1000)
+            name = self.path.split("?")[0].strip("/") or "index"
+            path = os.path.join(site_dir, name + ".html")
+            if "/" in name or ".." in name or not os.path.isfile(path):
+                body, status = b"<html><body>Not found</body></html>", 404
+            else:
+                with open(path, "rb") as f:
+                    body, status = f.read(), 200
+            self.send_response(status)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return SiteHandler
+
+
+def serve(first_port=0, latency_ms=0):
+    """Start one server per fixture site; returns {site name: base URL}."""
+    urls = {}
+    for offset, name in enumerate(site_names()):
+        port = first_port + offset if first_port else 0
+        server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(os.path.join(FIXTURES_DIR, name), latency_ms))
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        urls[name] = f"http://127.0.0.1:{server.server_address[1]}/"
+    return urls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8810, help="port of the first site")
+    parser.add_argument("--latency-ms", type=float, default=0)
+    args = parser.parse_args()
+    for name, url in serve(args.port, args.latency_ms).items():
+        print(f"{name}: {url}", flush=True)
+    threading.Event().wait()
+
+
+if __name__ == "__main__":
+    main()
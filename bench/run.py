@@ -0,0 +1,228 @@
+"""
+Offline load driver for the /api/analyze and /api/generate handlers.
+
+Starts the fake Messages API (fake_anthropic.py) and the fixture sites
+(fixture_sites.py) in a child process, points the API modules at them,
+serves both ``handler`` classes locally and drives them at a fixed
+concurrency. No tokens are spent and no real site is contacted.
+
+Reports p50/p95/p99 latency, throughput and peak RSS of this process (the
+handlers; the fakes run elsewhere) per endpoint. Save a run with --out and
+compare later runs against it with --baseline.
+
+Examples:
+  python bench/run.py
+  python bench/run.py --endpoint analyze --requests 100 --concurrency 10 --stream
+  python bench/run.py --out bench/baseline.json
+  python bench/run.py --baseline bench/baseline.json --error-rate 0.05
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import resource
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+API_DIR = os.path.join(os.path.dirname(BENCH_DIR), "api")
+
+SELLER = {
+    "name": "Benchmark Co",
+    "description": "Call handling and scheduling software for multi-location service businesses",
+    "target_industries": "Home services, dental, logistics",
+}
+TARGETS = [
+    {"name": "Acme Plumbing & Drain", "type": "company"},
+    {"name": "Maria Alvarez", "type": "person"},
+    {"name": "Northwind Logistics", "type": "company"},
+]
+
+_FAKES_SCRIPT = """
+import sys, threading
+sys.path.insert(0, {bench_dir!r})
+import fake_anthropic, fixture_sites
+api = fake_anthropic.serve(0, {latency_ms}, {tokens_per_second}, {error_rate})
+print(f"http://127.0.0.1:{{api.server_address[1]}}", flush=True)
+for url in fixture_sites.serve(0, {site_latency_ms}).values():
+    print(url, flush=True)
+print("ready", flush=True)
+threading.Event().wait()
+"""
+
+
+def start_fakes(args):
+    """Run the fake API and fixture sites in a child process.
+
+    Returns (process, api_base_url, [site urls]).
+    """
+    script = _FAKES_SCRIPT.format(
+        bench_dir=BENCH_DIR, latency_ms=args.latency_ms, tokens_per_second=args.tokens_per_second,
+        error_rate=args.error_rate, site_latency_ms=args.site_latency_ms,
+    )
+    proc = subprocess.Popen([sys.executable, "-c", script], stdout=subprocess.PIPE, text=True)
+    lines = []
+    for line in proc.stdout:
+        line = line.strip()
+        if line == "ready":
+            break
+        lines.append(line)
+    return proc, lines[0], lines[1:]
+
+
+def serve_handler(handler_cls):
+    quiet = type("Quiet" + handler_cls.__name__, (handler_cls,), {"log_message": lambda self, *a: None})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), quiet)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}/"
+
+
+def request_bodies(endpoint, sites, count, stream):
+    for i in range(count):
+        if endpoint == "analyze":
+            # A distinct attempt per request, so warm caches still see fresh work
+            # (full analyses, not outreach-only regenerates)
+            yield {"url": sites[i % len(sites)], "company": SELLER, "attempt": i, "stream": stream,
+                   "regenerate": "full"}
+        else:
+            yield {"targets": TARGETS, "company": SELLER, "stream": stream}
+
+
+def timed_request(url, body):
+    """POST ``body``; returns (seconds, seconds to first byte, ok)."""
+    data = json.dumps(body).encode()
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, data, {"Content-Type": "application/json"}),
+                                    timeout=120) as resp:
+            first = resp.read(1)
+            ttfb = time.perf_counter() - started
+            payload = first + resp.read()
+        ok = resp.status == 200 and b'"error"' not in payload and b"event: error" not in payload
+    except Exception:
+        return time.perf_counter() - started, None, False
+    return time.perf_counter() - started, ttfb, ok
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def run_endpoint(url, bodies, concurrency):
+    bodies = list(bodies)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda body: timed_request(url, body), bodies))
+    wall = time.perf_counter() - started
+    latencies = [r[0] for r in results if r[2]]
+    ttfbs = [r[1] for r in results if r[2] and r[1] is not None]
+
+    def ms(value):
+        return round(value * 1000, 1) if value is not None else None
+
+    return {
+        "requests": len(results),
+        "errors": sum(1 for r in results if not r[2]),
+        "concurrency": concurrency,
+        "p50_ms": ms(percentile(latencies, 50)),
+        "p95_ms": ms(percentile(latencies, 95)),
+        "p99_ms": ms(percentile(latencies, 99)),
+        "ttfb_p50_ms": ms(percentile(ttfbs, 50)),
+        "throughput_rps": round(len(latencies) / wall, 2) if wall else None,
+        "wall_s": round(wall, 2),
+    }
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def compare(report, baseline):
+    """Print each metric's change against a saved baseline report."""
+    for endpoint, stats in report["endpoints"].items():
+        base = baseline.get("endpoints", {}).get(endpoint)
+        if not base:
+            continue
+        print(f"\n{endpoint} vs baseline:")
+        for metric in ("p50_ms", "p95_ms", "p99_ms", "throughput_rps", "errors"):
+            old, new = base.get(metric), stats.get(metric)
+            if old is None or new is None:
+                continue
+            change = f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+            print(f"  {metric:15} {old:>10} -> {new:>10}  ({change})")
+    old_rss = baseline.get("peak_rss_mb")
+    if old_rss:
+        print(f"\npeak_rss_mb     {old_rss:>10} -> {report['peak_rss_mb']:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoint", choices=("analyze", "generate", "both"), default="both")
+    parser.add_argument("--requests", type=int, default=50, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--stream", action="store_true", help="use the SSE variants")
+    parser.add_argument("--latency-ms", type=float, default=300, help="fake API time to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=100, help="fake API output speed")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of fake API calls that 529")
+    parser.add_argument("--site-latency-ms", type=float, default=20, help="fixture site response delay")
+    parser.add_argument("--warm-cache", action="store_true", help="keep the in-process caches on")
+    parser.add_argument("--verbose", action="store_true", help="show the handlers' JSON log lines")
+    parser.add_argument("--out", help="write the JSON report here")
+    parser.add_argument("--baseline", help="compare against a previously saved report")
+    args = parser.parse_args()
+
+    proc, api_url, sites = start_fakes(args)
+    logs = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(open(os.devnull, "w"))
+    try:
+        with logs:
+            os.environ["ANTHROPIC_BASE_URL"] = api_url
+            os.environ.setdefault("ANTHROPIC_API_KEY", "bench")
+            os.environ.pop("NEWS_API_KEY", None)
+            if not args.warm_cache:
+                os.environ["CACHE_BACKEND"] = "off"
+                os.environ["PROSPECT_STORE"] = "off"
+            # A load test from one client would just measure the token budgets
+            os.environ.setdefault("RATE_LIMIT_BACKEND", "off")
+            sys.path.insert(0, API_DIR)
+            import analyze
+            import generate
+
+            handlers = {"analyze": analyze.handler, "generate": generate.handler}
+            endpoints = ["analyze", "generate"] if args.endpoint == "both" else [args.endpoint]
+            report = {
+                "config": {k: v for k, v in vars(args).items() if k not in ("out", "baseline")},
+                "endpoints": {},
+            }
+            for endpoint in endpoints:
+                url = serve_handler(handlers[endpoint])
+                bodies = request_bodies(endpoint, sites, args.requests, args.stream)
+                report["endpoints"][endpoint] = run_endpoint(url, bodies, args.concurrency)
+            report["peak_rss_mb"] = peak_rss_mb()
+    finally:
+        proc.terminate()
+        proc.wait()
+
+    print(json.dumps(report, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -312,40 +312,63 @@ async function analyzeCurrentPage(apiUrl, pageUrl, company) {
 
         // Step 1: Searching for key contacts (happens server-side via Claude web search)
         setProgress(1);
-        startProgressTicker(1, 4, 20000); // tick through steps over ~20s (server does web search + analysis)
+        startProgressTicker(1, 4, 20000); // fallback pacing until the first server event arrives
 
         const response = await fetch(apiUrl + '/api/analyze', {
             method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
+            headers: { 'Content-Type': 'application/json', 'Accept': 'text/event-stream' },
             body: JSON.stringify({
                 url: pageUrl,
                 page_text: pageText,
                 company: company,
                 attempt: _scAttempt,
-                prospect_name: companyName
+                prospect_name: companyName,
+                stream: true
             })
         });
 
-        stopProgressTicker();
-
         if (!response.ok) {
+            stopProgressTicker();
             const err = await response.json().catch(() => ({}));
             throw new Error(err.message || 'API returned status ' + response.status);
         }
 
+        // Server streams progress per research stage, then tokens, then the result
+        var data = null;
+        var step = 1;
+        var advance = function (to) {
+            if (to > step) {
+                step = to;
+                setProgress(step);
+            }
+        };
+        await readEventStream(response, function (event, payload) {
+            stopProgressTicker();
+            if (event === 'progress') {
+                advance(payload.stage === 'search' ? 3 : 2);
+            } else if (event === 'delta') {
+                advance(4);
+            } else if (event === 'result') {
+                data = payload;
+            } else if (event === 'error') {
+                throw new Error(payload.message || 'Analysis failed');
+            }
+        });
+
+        stopProgressTicker();
+
         // Step 5: Developing point of view (parsing response)
         setProgress(5);
-        const data = await response.json();
-        await _sleep(600);
+        await _sleep(300);
 
         // All done
         completeAllProgress();
         await _sleep(400);
 
-        if (data.status === 'success' && data.analysis) {
+        if (data && data.status === 'success' && data.analysis) {
             renderStructuredResults(resultDiv, data.analysis);
         } else {
-            throw new Error(data.message || 'Analysis failed');
+            throw new Error((data && data.message) || 'Analysis failed');
         }
     } catch (error) {
         stopProgressTicker();
@@ -358,6 +381,30 @@ async function analyzeCurrentPage(apiUrl, pageUrl, company) {
     }
 }
 
+// Parse a Server-Sent Events response body, calling onEvent(name, data) per event
+async function readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+        const chunk = await reader.read();
+        if (chunk.done) break;
+        buffer += decoder.decode(chunk.value, { stream: true });
+        let sep;
+        while ((sep = buffer.indexOf('\n\n')) >= 0) {
+            const block = buffer.slice(0, sep);
+            buffer = buffer.slice(sep + 2);
+            let event = 'message';
+            let data = '';
+            block.split('\n').forEach(function (line) {
+                if (line.indexOf('event: ') === 0) event = line.slice(7);
+                else if (line.indexOf('data: ') === 0) data += line.slice(6);
+            });
+            if (data) onEvent(event, JSON.parse(data));
+        }
+    }
+}
+
 function _sleep(ms) {
     return new Promise(function (resolve) { setTimeout(resolve, ms); });
 }
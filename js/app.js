@@ -174,10 +174,11 @@ document.addEventListener('DOMContentLoaded', function () {
         try {
             const response = await fetch(apiUrl + '/api/generate', {
                 method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
+                headers: { 'Content-Type': 'application/json', 'Accept': 'text/event-stream' },
                 body: JSON.stringify({
                     targets: targets,
-                    company: company
+                    company: company,
+                    stream: true
                 })
             });
 
@@ -186,33 +187,22 @@ document.addEventListener('DOMContentLoaded', function () {
                 throw new Error(err.message || 'API returned status ' + response.status);
             }
 
-            const data = await response.json();
+            // Cards appear one by one as the server streams each snippet
+            let received = 0;
+            resultsCard.style.display = 'block';
+            await readEventStream(response, function (event, payload) {
+                if (event === 'snippet') {
+                    received++;
+                    generateStatus.textContent = received + ' of ' + targets.length + ' ready...';
+                    renderResultCard(payload);
+                } else if (event === 'error') {
+                    throw new Error(payload.message || 'Generation failed');
+                }
+            });
 
-            if (!data.results || data.results.length === 0) {
+            if (received === 0) {
                 resultsContainer.innerHTML = '<div class="alert alert-warning">No results generated.</div>';
-            } else {
-                data.results.forEach(function (result) {
-                    const card = document.createElement('div');
-                    card.className = 'result-card';
-                    card.innerHTML =
-                        '<div class="d-flex justify-content-between align-items-start mb-2">' +
-                        '<div><strong>' + escapeHtml(result.name) + '</strong> ' +
-                        '<span class="badge bg-secondary">' + escapeHtml(result.type) + '</span></div>' +
-                        '<button class="btn btn-sm btn-outline-primary btn-copy">Copy</button>' +
-                        '</div>' +
-                        '<div class="snippet-text">' + escapeHtml(result.snippet) + '</div>';
-                    resultsContainer.appendChild(card);
-
-                    card.querySelector('.btn-copy').addEventListener('click', function () {
-                        navigator.clipboard.writeText(result.snippet).then(() => {
-                            this.textContent = 'Copied!';
-                            setTimeout(() => { this.textContent = 'Copy'; }, 2000);
-                        });
-                    });
-                });
             }
-
-            resultsCard.style.display = 'block';
         } catch (error) {
             resultsCard.style.display = 'block';
             resultsContainer.innerHTML = '<div class="alert alert-danger">Error: ' + escapeHtml(error.message) + '</div>';
@@ -225,7 +215,53 @@ document.addEventListener('DOMContentLoaded', function () {
         }
     });
 
+    function renderResultCard(result) {
+        const card = document.createElement('div');
+        card.className = 'result-card';
+        card.innerHTML =
+            '<div class="d-flex justify-content-between align-items-start mb-2">' +
+            '<div><strong>' + escapeHtml(result.name) + '</strong> ' +
+            '<span class="badge bg-secondary">' + escapeHtml(result.type) + '</span></div>' +
+            '<button class="btn btn-sm btn-outline-primary btn-copy">Copy</button>' +
+            '</div>' +
+            (result.error
+                ? '<div class="alert alert-danger mb-0">Error: ' + escapeHtml(result.error) + '</div>'
+                : '<div class="snippet-text">' + escapeHtml(result.snippet) + '</div>');
+        resultsContainer.appendChild(card);
+
+        card.querySelector('.btn-copy').addEventListener('click', function () {
+            navigator.clipboard.writeText(result.snippet).then(() => {
+                this.textContent = 'Copied!';
+                setTimeout(() => { this.textContent = 'Copy'; }, 2000);
+            });
+        });
+    }
+
     // --- Utility ---
+    // Parse a Server-Sent Events response body, calling onEvent(name, data) per event
+    async function readEventStream(response, onEvent) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        while (true) {
+            const chunk = await reader.read();
+            if (chunk.done) break;
+            buffer += decoder.decode(chunk.value, { stream: true });
+            let sep;
+            while ((sep = buffer.indexOf('\n\n')) >= 0) {
+                const block = buffer.slice(0, sep);
+                buffer = buffer.slice(sep + 2);
+                let event = 'message';
+                let data = '';
+                block.split('\n').forEach(function (line) {
+                    if (line.indexOf('event: ') === 0) event = line.slice(7);
+                    else if (line.indexOf('data: ') === 0) data += line.slice(6);
+                });
+                if (data) onEvent(event, JSON.parse(data));
+            }
+        }
+    }
+
     function escapeHtml(text) {
         const div = document.createElement('div');
         div.textContent = text;
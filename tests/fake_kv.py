@@ -0,0 +1,151 @@
+"""
+In-memory stand-in for the Upstash Redis REST API (see api/_kv.py), with
+just the commands the stores use. ``serve()`` starts one in a background
+thread; ``server.url`` and ``server.token`` configure a KVClient for it.
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TOKEN = "test-token"
+# There is no Lua here: EVAL runs the Python registered for the script's text,
+# as ``SCRIPTS[script](redis, keys, args)``
+SCRIPTS = {}
+
+
+class Redis:
+    """The data and command semantics, kept apart from the HTTP layer."""
+
+    def __init__(self):
+        self.data = {}
+        self.expires = {}
+        self.lock = threading.Lock()
+
+    def _live(self, key):
+        if key in self.expires and self.expires[key] <= time.time():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return self.data.get(key)
+
+    def run(self, command):
+        name, args = command[0].upper(), command[1:]
+        with self.lock:
+            return getattr(self, "cmd_" + name.lower())(*args)
+
+    def cmd_get(self, key):
+        return self._live(key)
+
+    def cmd_set(self, key, value, *options):
+        self.data[key] = value
+        self.expires.pop(key, None)
+        options = [option.upper() for option in options]
+        if "EX" in options:
+            self.expires[key] = time.time() + int(options[options.index("EX") + 1])
+        return "OK"
+
+    def cmd_del(self, *keys):
+        removed = sum(1 for key in keys if self._live(key) is not None)
+        for key in keys:
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return removed
+
+    def cmd_expire(self, key, seconds):
+        if self._live(key) is None:
+            return 0
+        self.expires[key] = time.time() + float(seconds)
+        return 1
+
+    def cmd_eval(self, script, numkeys, *args):
+        return SCRIPTS[script](self, list(args[:int(numkeys)]), list(args[int(numkeys):]))
+
+    def cmd_hset(self, key, *pairs):
+        self._live(key)
+        fields = self.data.setdefault(key, {})
+        added = sum(1 for field in pairs[::2] if field not in fields)
+        fields.update(zip(pairs[::2], pairs[1::2]))
+        return added
+
+    def cmd_hget(self, key, field):
+        return (self._live(key) or {}).get(field)
+
+    def cmd_hmget(self, key, *fields):
+        return [self.cmd_hget(key, field) for field in fields]
+
+    def cmd_hgetall(self, key):
+        return [part for item in (self._live(key) or {}).items() for part in item]
+
+    def cmd_zadd(self, key, *pairs):
+        # Every index is added at score 0, so members sort by value alone
+        members = self.data.setdefault(key, set())
+        added = sum(1 for member in pairs[1::2] if member not in members)
+        members.update(pairs[1::2])
+        return added
+
+    def cmd_zrem(self, key, *members):
+        present = self._live(key) or set()
+        removed = sum(1 for member in members if member in present)
+        present.difference_update(members)
+        return removed
+
+    def cmd_zrangebylex(self, key, low, high, *limit):
+        def above(member):
+            if low == "-":
+                return True
+            bound = low[1:].encode()
+            return member.encode() >= bound if low[0] == "[" else member.encode() > bound
+
+        def below(member):
+            if high == "+":
+                return True
+            bound = high[1:].encode()
+            return member.encode() <= bound if high[0] == "[" else member.encode() < bound
+
+        found = sorted((m for m in self._live(key) or () if above(m) and below(m)), key=str.encode)
+        if limit:
+            offset, count = int(limit[1]), int(limit[2])
+            found = found[offset:offset + count]
+        return found
+
+
+class KVHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # headers and body go out in separate writes
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _reply(self, command):
+        try:
+            return {"result": self.server.redis.run(command)}
+        except (AttributeError, LookupError, TypeError, ValueError) as e:
+            return {"error": f"ERR {type(e).__name__}: {e}"}
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        if self.headers.get("Authorization") != f"Bearer {TOKEN}":
+            return self._send_json(401, {"error": "Unauthorized"})
+        self.server.commands += len(body) if self.path == "/pipeline" else 1
+        if self.path == "/pipeline":
+            return self._send_json(200, [self._reply(command) for command in body])
+        self._send_json(200, self._reply(body))
+
+
+def serve():
+    """Start a fake KV REST API in a background thread; returns the server."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), KVHandler)
+    server.daemon_threads = True
+    server.redis, server.commands = Redis(), 0
+    server.url, server.token = f"http://127.0.0.1:{server.server_port}", TOKEN
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,33 @@
+"""
+Shared setup for the test suite: puts api/ and bench/ on the import path
+and turns the process-wide caches, stores and budgets off, so each test
+starts from a clean slate and only sets up what it exercises.
+
+Run from the repository root:
+  python -m unittest discover -s tests
+"""
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES_DIR = os.path.join(ROOT, "bench", "fixtures")
+
+for path in (os.path.join(ROOT, "bench"), os.path.join(ROOT, "api")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+os.environ.setdefault("ANTHROPIC_API_KEY", "test")
+os.environ.setdefault("CACHE_BACKEND", "off")
+os.environ.setdefault("RATE_LIMIT_BACKEND", "off")
+os.environ.setdefault("PROSPECT_STORE", "off")
+
+
+def fixture_pages():
+    """(name, html) for every recorded fixture page, e.g. ("acme-plumbing/team", ...)."""
+    pages = []
+    for site in sorted(os.listdir(FIXTURES_DIR)):
+        for page in sorted(os.listdir(os.path.join(FIXTURES_DIR, site))):
+            with open(os.path.join(FIXTURES_DIR, site, page), encoding="utf-8") as f:
+                pages.append((f"{site}/{page.removesuffix('.html')}", f.read()))
+    return pages
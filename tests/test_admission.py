@@ -0,0 +1,159 @@
+import time
+import unittest
+from unittest import mock
+
+import support  # noqa: F401
+import _admission
+import fake_kv
+import generate
+from _admission import (AdmissionRejected, Bucket, KVBucketStore, MemoryBucketStore, admit, buckets_for, client,
+                        estimate_cost)
+from _kv import KVClient
+
+# A 1200-token client bucket refilling at 600 tokens a second; the key
+# bucket is large enough never to matter
+SMALL_BUCKETS = {"CLIENT_TOKENS_PER_MINUTE": 36_000, "CLIENT_BURST_TOKENS": 1200,
+                 "KEY_TOKENS_PER_MINUTE": 10_000_000, "KEY_BURST_TOKENS": 10_000_000,
+                 "BATCH_TOKENS_PER_MINUTE": 36_000, "BATCH_BURST_TOKENS": 3000}
+
+
+def payload(max_tokens):
+    return {"model": "m", "max_tokens": max_tokens, "messages": [{"role": "user", "content": "Hi"}]}
+
+
+def bucket_script(change):
+    """What a KVBucketStore script does, in Python, for fake_kv."""
+    def run(redis, keys, args):
+        n = len(keys)
+        buckets = [Bucket(key, float(args[2 * i]) * 60, float(args[2 * i + 1])) for i, key in enumerate(keys)]
+        states = [redis._live(key) for key in keys]
+        states = [(float(s["tokens"]), float(s["updated_at"])) if s else None for s in states]
+        result, states = change(buckets, states, float(args[2 * n]), *map(float, args[2 * n + 1:]))
+        for key, (tokens, updated_at) in zip(keys, states or ()):
+            redis.data[key] = {"tokens": repr(tokens), "updated_at": repr(updated_at)}
+        return repr(result)
+    return run
+
+
+fake_kv.SCRIPTS[_admission.TAKE_SCRIPT] = bucket_script(
+    lambda buckets, states, now, cost: _admission._take(buckets, states, cost, now))
+fake_kv.SCRIPTS[_admission.SETTLE_SCRIPT] = bucket_script(
+    lambda buckets, states, now, charged, used: (0.0, _admission._settle(buckets, states, charged, used, now)))
+
+
+class AdmitTest(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.multiple(_admission, **SMALL_BUCKETS)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.store = self.make_store()
+
+    def make_store(self):
+        return MemoryBucketStore()
+
+    def state(self, key):
+        return self.store._states.get(key)
+
+    def level(self, identity, batch=False):
+        bucket = buckets_for(identity, batch)[1]
+        return bucket.level(self.state(bucket.key), time.time())
+
+    def test_admits_within_budget(self):
+        with client("rep-a"):
+            admit(payload(400), store=self.store)
+        self.assertAlmostEqual(self.level("rep-a"), 1200 - estimate_cost(payload(400)), delta=5)
+
+    def test_queues_until_refilled(self):
+        with client("rep-b"):
+            admit(payload(1000), store=self.store)
+            started = time.monotonic()
+            admit(payload(600), store=self.store)  # ~400 short: about 0.7s at 600/s
+        self.assertGreater(time.monotonic() - started, 0.5)
+
+    def test_rejects_when_the_wait_exceeds_the_deadline(self):
+        with client("rep-c"):
+            admit(payload(1000), store=self.store)
+            with self.assertRaises(AdmissionRejected) as caught:
+                admit(payload(1000), deadline=time.monotonic() + _admission.MIN_CALL_SECONDS + 0.5,
+                      store=self.store)
+        self.assertEqual(caught.exception.code, 429)
+        self.assertGreater(caught.exception.retry_after, 1)
+        self.assertEqual(caught.exception.headers["Retry-After"], "2")
+
+    def test_refills_over_time(self):
+        with client("rep-d"):
+            admit(payload(1100), store=self.store)
+            time.sleep(0.5)
+        self.assertAlmostEqual(self.level("rep-d"), 1200 - estimate_cost(payload(1100)) + 300, delta=40)
+
+    def test_clients_have_separate_buckets(self):
+        with client("rep-e"):
+            admit(payload(1100), store=self.store)
+        with client("rep-f"):
+            started = time.monotonic()
+            admit(payload(1100), store=self.store)
+        self.assertLess(time.monotonic() - started, 0.1)
+
+    def test_batch_work_has_its_own_bucket(self):
+        with client("rep-g"):
+            admit(payload(1100), store=self.store)
+        with client("rep-g", batch=True):
+            admit(payload(2500), store=self.store)
+        self.assertLess(self.level("rep-g", batch=True), 500)
+        self.assertLess(self.level("rep-g"), 200)
+
+    def test_settle_charges_actual_usage(self):
+        with client("rep-h"):
+            charge = admit(payload(1000), store=self.store)
+        charge.settle({"input_tokens": 150, "output_tokens": 50})
+        self.assertAlmostEqual(self.level("rep-h"), 1000, delta=5)
+        charge.settle({"input_tokens": 1000})  # only the first settle counts
+        self.assertAlmostEqual(self.level("rep-h"), 1000, delta=5)
+
+    def test_failed_call_is_refunded(self):
+        with client("rep-i"):
+            admit(payload(1000), store=self.store).settle(None)
+        self.assertAlmostEqual(self.level("rep-i"), 1200, delta=1)
+
+    def test_searches_charged_once_up_front(self):
+        searching = dict(payload(100), tools=[{"type": "web_search_20250305", "name": "web_search", "max_uses": 5}])
+        self.assertEqual(estimate_cost(searching) - estimate_cost(payload(100)), _admission.SEARCH_USE_TOKENS)
+
+
+class KVAdmitTest(AdmitTest):
+    """The same cases against the shared store, through fake_kv."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.kv = fake_kv.serve()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.kv.shutdown()
+        cls.kv.server_close()
+
+    def make_store(self):
+        return KVBucketStore(KVClient(self.kv.url, self.kv.token))
+
+    def state(self, key):
+        stored = self.kv.redis.data.get("bucket:" + key)
+        return (float(stored["tokens"]), float(stored["updated_at"])) if stored else None
+
+    def test_is_the_default_with_kv_configured(self):
+        env = {"KV_REST_API_URL": self.kv.url, "KV_REST_API_TOKEN": self.kv.token,
+               "RATE_LIMIT_BACKEND": ""}
+        with mock.patch.dict("os.environ", env):
+            self.assertIsInstance(_admission.store_from_env(), KVBucketStore)
+
+
+class GenerateAdmissionTest(unittest.TestCase):
+    def test_rejection_fails_the_request(self):
+        targets = [{"name": "Acme", "type": "person"}, {"name": "Beta", "type": "person"}]
+        company = {"name": "Seller", "description": "Software"}
+        with mock.patch.object(generate, "call_claude", side_effect=AdmissionRejected(1.5)):
+            with self.assertRaises(AdmissionRejected):
+                generate.generate_snippets(targets, company)
+
+
+if __name__ == "__main__":
+    unittest.main()
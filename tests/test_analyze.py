@@ -0,0 +1,37 @@
+import json
+import unittest
+import urllib.request
+from unittest import mock
+
+import support  # noqa: F401
+import analyze
+from test_jobs import serve_handler
+
+
+class StreamErrorTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server, cls.url = serve_handler(analyze.handler)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def test_failure_after_the_stream_starts_is_an_error_event(self):
+        body = {"url": "https://acme.example/", "page_text": "We fix pipes", "stream": True}
+        request = urllib.request.Request(self.url + "/api/analyze", data=json.dumps(body).encode(),
+                                         headers={"Content-Type": "application/json"})
+        research = {"page": "", "crawl": "", "search": ""}
+        with mock.patch.object(analyze, "leadership_stages", return_value={}), \
+                mock.patch.object(analyze, "run_stages", return_value=research), \
+                mock.patch.object(analyze, "combine_leadership", side_effect=RuntimeError("boom")):
+            with urllib.request.urlopen(request, timeout=10) as resp:
+                self.assertEqual(resp.status, 200)
+                self.assertEqual(resp.headers["Content-Type"], "text/event-stream")
+                stream = resp.read().decode()
+        self.assertEqual(stream, 'event: error\ndata: {"message": "Internal error: RuntimeError: boom"}\n\n')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+import time
+import unittest
+from unittest import mock
+
+import support  # noqa: F401
+import analyze_batch
+from analyze_batch import TIME_LIMIT_MESSAGE, iter_analyses, parse_items
+
+
+def fake_analyze_page(url, page_text, company, attempt=0, leadership_text="", latency_budget=None):
+    time.sleep(1.5 if "slow" in url else 0.05)
+    return {"overview": url}
+
+
+class IterAnalysesDeadlineTest(unittest.TestCase):
+    def setUp(self):
+        for name, value in (("analyze_page", fake_analyze_page), ("MIN_ANALYZE_SECONDS", 0.1),
+                            ("_prepare_one", lambda item, research, deadline=None: ("page", ""))):
+            patcher = mock.patch.object(analyze_batch, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_every_url_gets_a_result_by_the_deadline(self):
+        # Two workers: the fast URLs finish on one while a slow one holds the
+        # other, then the second slow URL starts; "https://d.example/" never does
+        items = parse_items(["https://a.example/", "https://slow.example/", "https://b.example/",
+                             "https://c.example/", "https://slow.example/2", "https://d.example/"])
+        started = time.monotonic()
+        results = dict(iter_analyses(items, {}, max_workers=2, deadline=started + 0.6))
+        self.assertLess(time.monotonic() - started, 1.0)
+
+        self.assertEqual(sorted(results), list(range(len(items))))
+        for index, item in enumerate(items):
+            with self.subTest(url=item["url"]):
+                result = results[index]
+                self.assertEqual(result["url"], item["url"])
+                if "slow" in item["url"] or "d.example" in item["url"]:
+                    self.assertEqual(result, {"status": "error", "url": item["url"], "message": TIME_LIMIT_MESSAGE})
+                else:
+                    self.assertEqual(result["status"], "success")
+
+    def test_url_not_started_without_enough_time(self):
+        items = parse_items(["https://a.example/"])
+        results = list(iter_analyses(items, {}, deadline=time.monotonic() + 0.05))
+        self.assertEqual(results, [(0, {"status": "error", "url": "https://a.example/", "message": TIME_LIMIT_MESSAGE})])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import support  # noqa: F401
+from _cache import MemoryCache, SQLiteCache, get_or_compute, single_flight
+
+
+class Counter:
+    """A slow ``compute`` that returns how many times it has been called."""
+
+    def __init__(self, seconds=0.0):
+        self.seconds = seconds
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def __call__(self):
+        with self.lock:
+            self.calls += 1
+            calls = self.calls
+        time.sleep(self.seconds)
+        return calls
+
+
+class CacheBehaviour:
+    """Cases every cache backend passes; subclasses provide make_cache()."""
+
+    def setUp(self):
+        self.cache = self.make_cache(max_entries=3, ttl=60)
+
+    def test_entries_expire_after_their_ttl(self):
+        self.cache.set("short", "v", ttl=0.1)
+        self.cache.set("long", "v")
+        self.assertEqual(self.cache.get("short"), "v")
+        time.sleep(0.15)
+        self.assertIsNone(self.cache.get("short"))
+        self.assertEqual(self.cache.get("long"), "v")
+
+    def test_least_recently_used_is_evicted_at_capacity(self):
+        for key in ("a", "b", "c"):
+            self.cache.set(key, key)
+            time.sleep(0.01)
+        self.cache.get("a")
+        time.sleep(0.01)
+        self.cache.set("d", "d")
+        self.assertEqual([self.cache.get(key) for key in ("a", "b", "c", "d")], ["a", None, "c", "d"])
+
+    def test_stale_value_is_served_while_refreshed_once(self):
+        key = f"swr-{type(self).__name__}"
+        compute = Counter(seconds=0.2)
+        self.assertEqual(get_or_compute(self.cache, key, compute, fresh_for=0.05, stale_for=60), 1)
+        time.sleep(0.1)
+        # Stale now: every caller gets the old value at once, one refresh runs
+        started = time.monotonic()
+        values = [get_or_compute(self.cache, key, compute, fresh_for=0.05, stale_for=60) for _ in range(5)]
+        self.assertLess(time.monotonic() - started, 0.15)
+        self.assertEqual(values, [1] * 5)
+        time.sleep(0.3)
+        self.assertEqual(compute.calls, 2)
+        self.assertEqual(get_or_compute(self.cache, key, compute, fresh_for=60), 2)
+
+    def test_concurrent_misses_compute_once(self):
+        key = f"miss-{type(self).__name__}"
+        compute = Counter(seconds=0.2)
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            values = list(pool.map(lambda _: get_or_compute(self.cache, key, compute, fresh_for=60), range(8)))
+        self.assertEqual((values, compute.calls), ([1] * 8, 1))
+        self.assertEqual(self.cache.get(key)["value"], 1)
+
+
+class MemoryCacheTest(CacheBehaviour, unittest.TestCase):
+    def make_cache(self, **options):
+        return MemoryCache(**options)
+
+
+class SQLiteCacheTest(CacheBehaviour, unittest.TestCase):
+    def make_cache(self, **options):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        return SQLiteCache(os.path.join(directory.name, "cache.sqlite3"), namespace="test", **options)
+
+    def test_namespaces_share_a_file_separately(self):
+        other = SQLiteCache(self.cache.path, namespace="other")
+        self.cache.set("k", "mine")
+        self.assertIsNone(other.get("k"))
+
+
+class SingleFlightTest(unittest.TestCase):
+    def test_concurrent_callers_share_one_result_or_error(self):
+        compute = Counter(seconds=0.2)
+        with ThreadPoolExecutor(max_workers=5) as pool:
+            values = list(pool.map(lambda _: single_flight("sf", compute), range(5)))
+        self.assertEqual((values, compute.calls), ([1] * 5, 1))
+        # Nothing is kept: a later call computes again
+        self.assertEqual(single_flight("sf", compute), 2)
+
+        def fail():
+            time.sleep(0.1)
+            raise ValueError("down")
+
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            futures = [pool.submit(single_flight, "sf-error", fail) for _ in range(3)]
+        for future in futures:
+            self.assertIsInstance(future.exception(), ValueError)
+
+
+if __name__ == "__main__":
+    unittest.main()
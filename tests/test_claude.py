@@ -0,0 +1,105 @@
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import support  # noqa: F401
+import _claude
+import _http
+import fake_anthropic
+
+
+def request(model):
+    return {"model": model, "max_tokens": 200, "messages": [{"role": "user", "content": "Hi"}]}
+
+
+class NotJSONHandler(BaseHTTPRequestHandler):
+    """Answers every request with a 200 whose body isn't JSON (a proxy page)."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = b"<html>Service temporarily unavailable</html>"
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class RetryAndBreakerTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = fake_anthropic.serve(latency_ms=0, tokens_per_second=100_000, retry_after=0)
+        cls.url = f"http://127.0.0.1:{cls.server.server_port}/v1/messages"
+
+    @classmethod
+    def tearDownClass(cls):
+        _http.close_all()
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        patcher = mock.patch.object(_claude, "ANTHROPIC_API_URL", self.url)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.server.config.fail_next, self.server.config.error_rate = 0, 0.0
+        self.server.requests = 0
+
+    def test_retries_overloaded_then_succeeds(self):
+        self.server.config.fail_next = 2
+        response = _claude.post_messages(request("retry-model"))
+        self.assertEqual(response["type"], "message")
+        self.assertEqual(self.server.requests, 3)
+
+    def test_gives_up_after_max_attempts(self):
+        self.server.config.error_rate = 1.0
+        with self.assertRaises(_claude.urllib.error.HTTPError) as caught:
+            _claude.post_messages(request("give-up-model"))
+        self.assertEqual(caught.exception.code, 529)
+        self.assertEqual(self.server.requests, _claude.MAX_ATTEMPTS)
+
+    def test_breaker_opens_then_trial_closes_it(self):
+        breaker = _claude.breaker_for("breaker-model")
+        breaker.cooldown = 0.2
+        self.server.config.error_rate = 1.0
+        with self.assertRaises(_claude.urllib.error.HTTPError):
+            _claude.post_messages(request("breaker-model"))
+        with self.assertRaises(_claude.CircuitOpenError):
+            _claude.post_messages(request("breaker-model"))
+        self.assertEqual(self.server.requests, _claude.BREAKER_THRESHOLD)
+
+        self.server.config.error_rate = 0.0
+        with self.assertRaises(_claude.CircuitOpenError):
+            _claude.post_messages(request("breaker-model"))  # still cooling down
+        time.sleep(0.25)
+        self.assertEqual(_claude.post_messages(request("breaker-model"))["type"], "message")
+        self.assertTrue(breaker.allow())
+
+    def test_half_open_trial_with_non_json_reply_is_released(self):
+        bad = ThreadingHTTPServer(("127.0.0.1", 0), NotJSONHandler)
+        bad.daemon_threads = True
+        threading.Thread(target=bad.serve_forever, daemon=True).start()
+        self.addCleanup(bad.server_close)
+        self.addCleanup(bad.shutdown)
+
+        breaker = _claude.breaker_for("half-open-model")
+        breaker.cooldown = 0
+        for _ in range(_claude.BREAKER_THRESHOLD):
+            breaker.record_failure()
+        with mock.patch.object(_claude, "ANTHROPIC_API_URL", f"http://127.0.0.1:{bad.server_port}/v1/messages"):
+            with self.assertRaises(ValueError):
+                _claude.post_messages(request("half-open-model"))
+
+        # The trial ended without a verdict, so the next call gets to try
+        self.assertEqual(_claude.post_messages(request("half-open-model"))["type"], "message")
+        self.assertTrue(breaker.allow())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import html
+import io
+import re
+import unittest
+
+import support
+from _html import html_to_text, read_document, read_text
+
+
+def strip_html(page):
+    """The regex stripper _html.py replaced (analyze._strip_html)."""
+    text = re.sub(r"<script[^>]*>.*?</script>", "", page, flags=re.DOTALL | re.IGNORECASE)
+    text = re.sub(r"<style[^>]*>.*?</style>", "", text, flags=re.DOTALL | re.IGNORECASE)
+    text = re.sub(r"<[^>]+>", " ", text)
+    text = re.sub(r"\s+", " ", text).strip()
+    return text
+
+
+class FakeResponse(io.BytesIO):
+    """Just enough of a PooledResponse for the read_* helpers."""
+
+    def __init__(self, body, url="https://example.com/", chunk=None):
+        super().__init__(body.encode())
+        self.url = url
+        self.headers = None
+        self._chunk = chunk
+
+    def read(self, amt=-1):
+        return super().read(min(amt, self._chunk) if self._chunk and amt and amt > 0 else amt)
+
+
+class MatchesRegexStripperTest(unittest.TestCase):
+    def test_fixture_pages_match_without_nav(self):
+        # Skipping <nav> (and other SKIP_TAGS) subtrees is the one intended
+        # difference; the old stripper also left entities undecoded
+        for name, page in support.fixture_pages():
+            with self.subTest(page=name):
+                no_nav = re.sub(r"<(nav|noscript|template|svg)\b.*?</\1>", "", page, flags=re.S | re.I)
+                self.assertEqual(html_to_text(page), html.unescape(strip_html(no_nav)))
+
+    def test_nav_is_skipped(self):
+        page = "<body><nav><a href='/'>Home</a> <a href='/team'>Team</a></nav><p>Hello world</p></body>"
+        self.assertEqual(html_to_text(page), "Hello world")
+        self.assertEqual(strip_html(page), "Home Team Hello world")
+
+    def test_streamed_in_small_chunks(self):
+        for name, page in support.fixture_pages():
+            with self.subTest(page=name):
+                self.assertEqual(read_text(FakeResponse(page, chunk=7)), html_to_text(page))
+
+    def test_max_chars(self):
+        page = "<p>" + "word " * 1000 + "</p>"
+        self.assertEqual(len(read_text(FakeResponse(page), max_chars=100)), 100)
+
+
+class ReadDocumentTest(unittest.TestCase):
+    def test_links_after_text_budget(self):
+        page = (
+            "<html><head><title>Acme | Home</title></head><body>"
+            "<p>" + "Plumbing and drain service. " * 5000 + "</p>"
+            "<footer><a href='/about'>About</a> <a href='/team'>Meet the team</a></footer>"
+            "</body></html>"
+        )
+        document = read_document(FakeResponse(page), max_chars=200)
+        self.assertEqual(len(document.text), 200)
+        self.assertEqual(document.title, "Acme | Home")
+        self.assertEqual(document.links, [("/about", "About"), ("/team", "Meet the team")])
+
+    def test_organization_name(self):
+        page = (
+            '<script type="application/ld+json">{"@type": "Plumber", "name": "Acme  Plumbing"}</script>'
+            '<meta property="og:site_name" content="Acme"><p>Hi</p>'
+        )
+        document = read_document(FakeResponse(page))
+        self.assertEqual((document.organization_name, document.site_name, document.text),
+                         ("Acme Plumbing", "Acme", "Hi"))
+
+
+if __name__ == "__main__":
+    unittest.main()
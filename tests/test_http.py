@@ -0,0 +1,148 @@
+import socket
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import support  # noqa: F401
+import _http
+import analyze
+from _html import read_text
+
+
+class DripHandler(BaseHTTPRequestHandler):
+    """/drip sends a page's opening text at once, then a byte every 0.2s for
+    10s; /stall sends the opening text and then nothing for 10s."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if self.path == "/fast":
+            body = b"<p>Quick page</p>"
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        head = b"<p>Acme Plumbing, drains and boilers.</p><p>"
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(head) + 50))
+        self.end_headers()
+        self.wfile.write(head)
+        self.wfile.flush()
+        try:
+            if self.path == "/stall":
+                time.sleep(10)
+            for _ in range(50):
+                time.sleep(0.2)
+                self.wfile.write(b"x")
+                self.wfile.flush()
+        except OSError:
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+class SlowResponseTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), DripHandler)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base = f"http://127.0.0.1:{cls.server.server_port}"
+
+    @classmethod
+    def tearDownClass(cls):
+        _http.close_all()
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def test_drip_stops_at_max_seconds(self):
+        started = time.monotonic()
+        with self.assertRaises(_http.ResponseLimitError):
+            with _http.urlopen(self.base + "/drip", timeout=10, max_seconds=1) as resp:
+                resp.read()
+        self.assertLess(time.monotonic() - started, 1.5)
+
+    def test_one_blocking_read_stops_at_max_seconds(self):
+        # A server that goes silent mid-body: the socket read itself must end
+        started = time.monotonic()
+        with _http.urlopen(self.base + "/stall", timeout=10, max_seconds=0.5) as resp:
+            self.assertEqual(resp.read(1000), b"<p>Acme Plumbing, drains and boilers.</p><p>")
+            with self.assertRaises(_http.ResponseLimitError):
+                resp.read(1000)
+        self.assertLess(time.monotonic() - started, 0.8)
+
+    def test_read_text_returns_partial_text(self):
+        started = time.monotonic()
+        with _http.urlopen(self.base + "/drip", timeout=10, max_seconds=1) as resp:
+            text = read_text(resp)
+        self.assertLess(time.monotonic() - started, 1.5)
+        self.assertTrue(text.startswith("Acme Plumbing, drains and boilers."))
+
+    def test_drained_response_is_reused(self):
+        _http.close_all()
+        for _ in range(2):
+            with _http.urlopen(self.base + "/fast", max_seconds=5) as resp:
+                self.assertEqual(resp.read(), b"<p>Quick page</p>")
+        self.assertEqual(len(_http._pool[("http", f"127.0.0.1:{self.server.server_port}")]), 1)
+
+
+class SitemapHandler(BaseHTTPRequestHandler):
+    """/sitemap.xml lists one page; /<case>/robots.txt is unusable in a
+    different way per case."""
+
+    protocol_version = "HTTP/1.1"
+
+    def send(self, content_type, body):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.endswith("/sitemap.xml"):
+            return self.send("application/xml", b"<urlset><url><loc>https://acme.example/team</loc></url></urlset>")
+        if self.path == "/binary/robots.txt":
+            return self.send("application/octet-stream", b"User-agent: *")
+        if self.path == "/slow/robots.txt":
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain")
+            self.send_header("Content-Length", "100")
+            self.end_headers()
+            self.wfile.flush()
+            time.sleep(2)
+            return
+        self.connection.shutdown(socket.SHUT_RDWR)  # /reset/robots.txt
+
+    def log_message(self, *args):
+        pass
+
+
+class SitemapLinksTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), SitemapHandler)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base = f"http://127.0.0.1:{cls.server.server_port}"
+
+    @classmethod
+    def tearDownClass(cls):
+        _http.close_all()
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def test_unusable_robots_txt_falls_back_to_sitemap_xml(self):
+        for case in ("binary", "slow", "reset"):
+            with self.subTest(robots=case):
+                links = analyze._sitemap_links(f"{self.base}/{case}", max_seconds=1)
+                self.assertEqual(links, [("https://acme.example/team", "")])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,133 @@
+import json
+import os
+import threading
+import time
+import unittest
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+from unittest import mock
+
+import support  # noqa: F401
+import _claude
+import _http
+import analyze_batch
+import fake_anthropic
+import fake_kv
+import fixture_sites
+import generate
+import jobs
+from _jobs import JobStoreUnavailable, KVJobStore, refresh_job, store_from_env
+
+COMPANY = {"name": "Seller", "description": "Call handling software", "target_industries": "Home services"}
+
+
+def serve_handler(handler):
+    quiet = type(handler.__name__, (handler,), {"log_message": lambda self, *args: None})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), quiet)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def call(url, body=None):
+    """(status, parsed JSON body) of a GET, or a POST of ``body``."""
+    data = json.dumps(body).encode() if body is not None else None
+    request = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(request, timeout=60) as resp:
+            return resp.status, json.loads(resp.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+class JobsTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.api = fake_anthropic.serve(latency_ms=0, tokens_per_second=100_000, batch_seconds=0.3)
+        cls.kv = fake_kv.serve()
+        cls.sites = fixture_sites.serve()
+        cls.servers = [cls.api, cls.kv]
+        for handler in (analyze_batch.handler, jobs.handler):
+            server, url = serve_handler(handler)
+            cls.servers.append(server)
+            setattr(cls, handler.__module__ + "_url", url)
+
+    @classmethod
+    def tearDownClass(cls):
+        _http.close_all()
+        for server in cls.servers:
+            server.shutdown()
+            server.server_close()
+
+    def setUp(self):
+        base = f"http://127.0.0.1:{self.api.server_port}/v1/messages"
+        for patcher in (
+            mock.patch.object(_claude, "ANTHROPIC_API_URL", base),
+            mock.patch.object(_claude, "ANTHROPIC_BATCHES_URL", base + "/batches"),
+            mock.patch.dict(os.environ, {"KV_REST_API_URL": self.kv.url, "KV_REST_API_TOKEN": self.kv.token}),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def wait_until_completed(self, poll):
+        for _ in range(50):
+            job = poll()
+            if job["status"] == "completed":
+                return job
+            time.sleep(0.1)
+        self.fail("job never completed")
+
+    def test_generate_job_submit_poll_results(self):
+        store = store_from_env()
+        self.assertIsInstance(store, KVJobStore)
+        targets = [{"name": "Acme Plumbing", "type": "company"}, {"name": "Maria Alvarez", "type": "person"}]
+        job = generate.submit_generate_job(targets, COMPANY, store)
+
+        self.assertEqual(refresh_job(store, job["id"], generate.snippet_result)["status"], "processing")
+        job = self.wait_until_completed(lambda: refresh_job(store, job["id"], generate.snippet_result))
+        self.assertEqual([r["name"] for r in job["results"]], ["Acme Plumbing", "Maria Alvarez"])
+        self.assertEqual({r["snippet"] for r in job["results"]}, {fake_anthropic.SNIPPET})
+        self.assertEqual(job["request_counts"]["succeeded"], 2)
+
+    def test_analyze_job_through_the_endpoints(self):
+        urls = sorted(self.sites.values())
+        status, queued = call(self.analyze_batch_url, {"mode": "batch", "urls": urls, "company": COMPANY})
+        self.assertEqual(status, 202)
+        self.assertEqual((queued["status"], queued["researched"], queued["total"]), ("queued", len(urls), len(urls)))
+
+        job_url = f"{self.jobs_url}/api/jobs?id={queued['job_id']}"
+        status, job = call(job_url)
+        self.assertEqual((status, job["status"]), (200, "processing"))
+        job = self.wait_until_completed(lambda: call(job_url)[1])
+        self.assertEqual([r["url"] for r in job["results"]], urls)
+        for result in job["results"]:
+            self.assertEqual(result["status"], "success")
+            self.assertEqual(result["analysis"]["overview"], fake_anthropic.ANALYSIS["overview"])
+            self.assertNotIn("researched", result)
+
+    def test_research_is_capped(self):
+        items = analyze_batch.parse_items([{"url": url, "page_text": "Plumbing"} for url in self.sites.values()])
+        started = time.monotonic()
+        job = analyze_batch.submit_analyze_job(items, COMPANY, 0, store_from_env(), deadline=started + 0.01)
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual({item["researched"] for item in job["items"]}, {False})
+
+        job = self.wait_until_completed(
+            lambda: refresh_job(store_from_env(), job["id"], analyze_batch.analysis_result))
+        self.assertEqual({result["researched"] for result in job["results"]}, {False})
+
+    def test_unknown_job(self):
+        self.assertEqual(call(f"{self.jobs_url}/api/jobs?id=nope")[0], 404)
+
+    def test_vercel_needs_the_shared_store(self):
+        with mock.patch.dict(os.environ, {"VERCEL": "1", "KV_REST_API_URL": ""}):
+            with self.assertRaises(JobStoreUnavailable):
+                store_from_env()
+            status, body = call(f"{self.jobs_url}/api/jobs?id=abc")
+        self.assertEqual(status, 503)
+        self.assertIn("KV_REST_API_URL", body["message"])
+
+
+if __name__ == "__main__":
+    unittest.main()
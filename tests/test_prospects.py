@@ -0,0 +1,174 @@
+import json
+import os
+import sqlite3
+import tempfile
+import unittest
+import urllib.error
+import urllib.request
+from unittest import mock
+
+import support  # noqa: F401
+import analyze
+import fake_kv
+import prospects
+from _kv import KVClient
+from _prospects import KVProspectStore, NullProspectStore, SQLiteProspectStore, store_from_env
+from test_jobs import serve_handler
+
+ANALYSIS = {
+    "overview": "Plumbing contractor",
+    "key_contacts": [
+        {"name": "Maria Alvarez", "title": "Chief Operating Officer", "relevance_score": 9, "source": "site"},
+        {"name": "Tom Reed", "title": "Service Manager", "relevance_score": 6, "source": "site"},
+    ],
+}
+
+
+class StoreBehaviour:
+    """Cases every prospect store passes; subclasses provide make_store()."""
+
+    def setUp(self):
+        self.store = self.make_store()
+
+    def test_records_and_reads_back_an_analysis(self):
+        self.store.record_analysis("https://www.acme.example/about", "Acme Plumbing LLC", "s1", 0, ANALYSIS)
+        analysis, analyzed_at = self.store.fresh_analysis("https://WWW.acme.example/about/", "s1")
+        self.assertEqual(analysis, ANALYSIS)
+        self.assertIsNone(self.store.latest_analysis("https://www.acme.example/about", "s2"))
+        self.assertIsNone(self.store.fresh_analysis("https://www.acme.example/about", "s1", max_age=-1))
+
+        prospect = self.store.prospect("acme.example")
+        self.assertEqual((prospect["company"], prospect["updated_at"]), ("Acme Plumbing LLC", analyzed_at))
+        self.assertEqual([a["analysis"] for a in prospect["analyses"]], [ANALYSIS])
+        self.assertEqual([c["name"] for c in prospect["contacts"]], ["Maria Alvarez", "Tom Reed"])
+        self.assertIsNone(self.store.prospect("unknown.example"))
+
+    def test_analyses_are_filed_by_page_text(self):
+        other = dict(ANALYSIS, overview="From other page text")
+        self.store.record_analysis("https://acme.example/", "Acme", "s1", 0, ANALYSIS, "text-a")
+        self.store.record_analysis("https://acme.example/", "Acme", "s1", 0, other, "text-b")
+        self.assertEqual(self.store.latest_analysis("https://acme.example/", "s1", "text-a")[0], ANALYSIS)
+        self.assertEqual(self.store.latest_analysis("https://acme.example/", "s1", "text-b")[0], other)
+        self.assertIsNone(self.store.latest_analysis("https://acme.example/", "s1"))
+
+    def test_company_search_by_prefix(self):
+        self.store.record_analysis("https://acme.example/", "Acme Plumbing, Inc.", "s1", 0, ANALYSIS)
+        self.store.record_analysis("https://acme-hvac.example/", "Acme HVAC", "s1", 0, {"key_contacts": []})
+        self.store.record_analysis("https://beta.example/", "Beta Co", "s1", 0, ANALYSIS)
+        found = self.store.search_company("acme")
+        self.assertEqual([p["domain"] for p in found], ["acme-hvac.example", "acme.example"])
+        self.assertEqual([c["name"] for c in found[1]["contacts"]], ["Maria Alvarez", "Tom Reed"])
+        self.assertEqual([p["domain"] for p in self.store.search_company("Acme Plumbing")], ["acme.example"])
+
+        # Renaming a prospect moves it in the index
+        self.store.record_analysis("https://acme.example/", "Zenith Plumbing", "s1", 0, ANALYSIS)
+        self.assertEqual([p["domain"] for p in self.store.search_company("acme")], ["acme-hvac.example"])
+
+    def test_contacts_by_role_and_title(self):
+        self.store.record_analysis("https://acme.example/", "Acme", "s1", 0, ANALYSIS)
+        self.store.record_analysis("https://beta.example/", "Beta", "s1", 0, {"key_contacts": [
+            {"name": "Lee Park", "title": "COO", "relevance_score": 7}]})
+        by_role = self.store.contacts_by_title("coo")
+        self.assertEqual([(c["name"], c["company"]) for c in by_role],
+                         [("Maria Alvarez", "Acme"), ("Lee Park", "Beta")])
+        self.assertEqual([c["name"] for c in self.store.contacts_by_title("service man")], ["Tom Reed"])
+
+        # A contact whose title changed is no longer found under the old one
+        self.store.record_analysis("https://acme.example/", "Acme", "s1", 0, {"key_contacts": [
+            {"name": "Tom Reed", "title": "Dispatch Lead", "relevance_score": 6}]})
+        self.assertEqual(self.store.contacts_by_title("service man"), [])
+        self.assertEqual([c["name"] for c in self.store.contacts_by_title("dispatch")], ["Tom Reed"])
+
+
+class SQLiteStoreTest(StoreBehaviour, unittest.TestCase):
+    def make_store(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "prospects.sqlite3")
+        return SQLiteProspectStore(self.path)
+
+    def test_migrates_a_file_without_page_keys(self):
+        os.remove(self.path)
+        with sqlite3.connect(self.path) as db:
+            db.execute("CREATE TABLE analyses (url TEXT NOT NULL, seller TEXT NOT NULL, domain TEXT NOT NULL, "
+                       "attempt INTEGER NOT NULL, analysis TEXT NOT NULL, analyzed_at REAL NOT NULL, "
+                       "PRIMARY KEY (url, seller))")
+            db.execute("INSERT INTO analyses VALUES ('https://acme.example', 's1', 'acme.example', 0, ?, 1)",
+                       (json.dumps(ANALYSIS),))
+        db.close()
+        store = SQLiteProspectStore(self.path)
+        self.assertEqual(store.latest_analysis("https://acme.example/", "s1"), (ANALYSIS, 1))
+
+
+class KVStoreTest(StoreBehaviour, unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.kv = fake_kv.serve()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.kv.shutdown()
+        cls.kv.server_close()
+
+    def make_store(self):
+        self.kv.redis.data.clear()
+        return KVProspectStore(KVClient(self.kv.url, self.kv.token))
+
+
+class StoreFromEnvTest(unittest.TestCase):
+    def test_backend_selection(self):
+        kv = {"KV_REST_API_URL": "http://kv.example", "KV_REST_API_TOKEN": "t", "PROSPECT_STORE": ""}
+        with mock.patch.dict(os.environ, kv):
+            self.assertIsInstance(store_from_env(), KVProspectStore)
+        with mock.patch.dict(os.environ, {"KV_REST_API_URL": "", "PROSPECT_STORE": "", "VERCEL": "1"}):
+            self.assertIsInstance(store_from_env(), NullProspectStore)
+        with mock.patch.dict(os.environ, {"KV_REST_API_URL": "", "PROSPECT_STORE": "kv"}):
+            with self.assertRaises(ValueError):
+                store_from_env()
+
+
+class StoredAnalysisTest(unittest.TestCase):
+    def test_store_is_keyed_on_the_page_text_sent(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        store = SQLiteProspectStore(os.path.join(directory.name, "prospects.sqlite3"))
+        url, company = "https://acme.example/", {"name": "Seller"}
+        with mock.patch.object(analyze, "PROSPECTS", store):
+            analyze.save_analysis("k", url, company, 0, ANALYSIS, "Acme", analyze.page_key("We fix  pipes"))
+            self.assertEqual(analyze.stored_analysis(url, company, analyze.page_key(" We fix pipes"))[0], ANALYSIS)
+            self.assertIsNone(analyze.stored_analysis(url, company, analyze.page_key("We sell boats")))
+            self.assertIsNone(analyze.stored_analysis(url, company, analyze.page_key("")))
+
+
+class ProspectsAuthTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server, cls.url = serve_handler(prospects.handler)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def status(self, token=None):
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        request = urllib.request.Request(self.url + "/api/prospects?company=acme", headers=headers)
+        try:
+            with urllib.request.urlopen(request, timeout=10) as resp:
+                return resp.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+    def test_requires_the_configured_token(self):
+        with mock.patch.dict(os.environ, {"PROSPECTS_API_TOKEN": "secret"}):
+            self.assertEqual(self.status(), 401)
+            self.assertEqual(self.status("wrong"), 401)
+            self.assertEqual(self.status("secret"), 200)
+
+    def test_disabled_without_a_token(self):
+        with mock.patch.dict(os.environ, {"PROSPECTS_API_TOKEN": ""}):
+            self.assertEqual(self.status("anything"), 503)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import json
+import unittest
+
+import support  # noqa: F401
+from _recover import ObjectStreamParser, recover_object
+from analyze import parse_analysis
+from fake_anthropic import ANALYSIS
+
+EXPECTED = ("overview", "tags", "insights", "outreach")
+
+
+class RecoverObjectTest(unittest.TestCase):
+    def test_whole_object_in_prose(self):
+        text = "Sure {not json} here it is:\n```json\n" + json.dumps(ANALYSIS) + "\n```"
+        self.assertEqual(recover_object(text), (ANALYSIS, True))
+
+    def test_echoed_example_before_the_answer(self):
+        text = ('Using the format {"name": "...", "title": "..."} for contacts, here is the analysis: '
+                + json.dumps(ANALYSIS))
+        self.assertEqual(recover_object(text, EXPECTED), (ANALYSIS, True))
+        self.assertEqual(recover_object(text)[0], ANALYSIS)  # more fields wins without expected
+
+    def test_truncated_answer_beats_complete_example(self):
+        answer = json.dumps(ANALYSIS)
+        cut = answer[:answer.index('"outreach"') + 20]
+        text = 'e.g. {"overview": "one line"} then: ' + cut
+        fields, complete = recover_object(text, EXPECTED)
+        self.assertFalse(complete)
+        self.assertEqual(fields["insights"], ANALYSIS["insights"])
+        self.assertNotIn("outreach", fields)
+
+    def test_nested_objects_are_not_candidates(self):
+        # The nested outreach object has more keys than the outer one
+        text = json.dumps({"overview": "x", "outreach": ANALYSIS["outreach"]})
+        self.assertEqual(recover_object(text), (json.loads(text), True))
+
+    def test_nothing_found(self):
+        self.assertEqual(recover_object("no object {here}"), ({}, False))
+
+    def test_earliest_of_equal_candidates(self):
+        self.assertEqual(recover_object('{"a": 1} {"a": 2}'), ({"a": 1}, True))
+
+    def test_stream_parser_reports_fields_as_they_complete(self):
+        parser = ObjectStreamParser()
+        self.assertEqual(parser.feed('Here: {"overview": "A'), [])
+        self.assertEqual(parser.feed('cme", "tags": ["x"'), [("overview", "Acme")])
+        self.assertEqual(parser.feed("]}"), [("tags", ["x"])])
+        self.assertTrue(parser.closed)
+
+
+class ParseAnalysisTest(unittest.TestCase):
+    def test_prefers_the_analysis_over_an_echoed_contact(self):
+        raw = 'Contacts look like {"name": "Jo", "title": "CEO", "source": "site"}.\n' + json.dumps(ANALYSIS)
+        self.assertEqual(parse_analysis(raw), ANALYSIS)
+
+
+if __name__ == "__main__":
+    unittest.main()